@@ -4,6 +4,7 @@ from taiyaki import __version__
 from taiyaki.cmdargs import (
     AutoBool, Bounded, DeviceAction, display_version_and_exit, FileExists,
     Maybe, NonNegative, ParseToNamedTuple, Positive)
+from taiyaki.pruning import PRUNING_METHODS
 
 
 def get_train_flipflop_parser():
@@ -70,7 +71,31 @@ def get_train_flipflop_parser():
         '--min_momentum', type=Positive(float),
         help='Min momentum in cycling. default = Adam beta1, no cycling')
 
+    prn_grp = parser.add_argument_group('Pruning Arguments')
+    prn_grp.add_argument(
+        '--prune_sparsity', default=None, metavar='fraction',
+        type=Maybe(Bounded(float, lower=0.0, upper=1.0)),
+        help='Prune weights of recurrent and convolutional layers to this ' +
+        'sparsity and keep them at zero while training. Default: no pruning')
+    prn_grp.add_argument(
+        '--prune_method', default='block', choices=PRUNING_METHODS,
+        help='Select weights to prune individually by magnitude, in blocks ' +
+        'or as whole columns. Only block and structured pruning speed up ' +
+        'sparse inference')
+    prn_grp.add_argument(
+        '--prune_niter', default=0, metavar='batches',
+        type=NonNegative(int),
+        help='Increase sparsity linearly from zero over this many ' +
+        'iterations. Default: prune to full sparsity before training')
+
     data_grp = parser.add_argument_group('Data Arguments')
+    data_grp.add_argument(
+        '--chunk_index', default=False, action=AutoBool,
+        help='Sample chunks from an index of those passing filters, built ' +
+        'for each chunk length before training, rather than rejecting ' +
+        'chunks after sampling. Faster when filters reject many chunks, ' +
+        'but each index requires a pass over all reads. Requires ' +
+        '--chunk_len_buckets')
     data_grp.add_argument(
         '--filter_max_dwell', default=10.0, metavar='multiple',
         type=Maybe(Positive(float)),
@@ -94,6 +119,13 @@ def get_train_flipflop_parser():
     data_grp.add_argument(
         '--limit', default=None, type=Maybe(Positive(int)),
         help='Limit number of reads to process')
+    data_grp.add_argument(
+        '--read_cache_size', default=None, metavar='reads',
+        type=Maybe(Positive(int)),
+        help='Load reads from input as they are used, keeping at most this ' +
+        'many in memory in each process, rather than loading every read ' +
+        'before training. Random access to reads is fastest for mapped ' +
+        'signal files in columnar format. Default: load all reads')
     data_grp.add_argument(
         '--reverse', default=False, action=AutoBool,
         help='Reverse input sequence and current')
@@ -102,6 +134,19 @@ def get_train_flipflop_parser():
         type=NonNegative(int), default=100000,
         help='Sample n reads to decide on bounds for filtering before ' +
         'training. Set to 0 to do all.')
+    data_grp.add_argument(
+        '--chunk_len_buckets', default=None, metavar='n',
+        type=Maybe(Positive(int)),
+        help='Use n fixed chunk lengths, evenly spaced between ' +
+        'chunk_len_min and chunk_len_max, each with a fixed sub-batch ' +
+        'size, so the shapes of batches repeat between iterations. ' +
+        'Default: random chunk length for each iteration')
+    data_grp.add_argument(
+        '--chunk_len_bucket_weights', default=None, metavar='weight',
+        nargs='+', type=Positive(float),
+        help='Relative frequency of each of the --chunk_len_buckets chunk ' +
+        'lengths. Default: frequency with which a random chunk length is ' +
+        'closest to each bucket')
     data_grp.add_argument(
         '--chunk_len_min', default=3000, metavar='samples', type=Positive(int),
         help='Min length of each chunk in samples (chunk lengths are ' +
@@ -154,6 +199,18 @@ def get_train_flipflop_parser():
     # mode using torch.distributed.launch. See the README.
     cmp_grp.add_argument(
         '--local_rank', type=int, default=None, help=argparse.SUPPRESS)
+    cmp_grp.add_argument(
+        '--prefetch_depth', default=2, metavar='iterations',
+        type=Positive(int),
+        help='Number of iterations each --prefetch_workers worker prepares ' +
+        'ahead of training. Requires torch 1.7 or later, otherwise 2')
+    cmp_grp.add_argument(
+        '--prefetch_workers', default=0, metavar='n', type=NonNegative(int),
+        help='Number of worker processes preparing batches of chunks in ' +
+        'the background while training. Batches are seeded by iteration so ' +
+        'are the same for any number of workers, though differ from those ' +
+        'prepared with 0 workers, where batches are prepared by the ' +
+        'training process itself between steps')
 
     out_grp = parser.add_argument_group('Output Arguments')
     out_grp.add_argument(
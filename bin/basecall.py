@@ -1,21 +1,21 @@
 #!/usr/bin/env python3
 import argparse
-from multiprocessing import Pool
+from itertools import islice
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import sys
 import time
 import torch
 
 from ont_fast5_api import fast5_interface
 
-from taiyaki import basecall_helpers, decodeutil, fast5utils, helpers, qscores
-from taiyaki.cmdargs import (AutoBool, FileExists, NonNegative,
-                             ParseToNamedTuple, Positive)
+from taiyaki import basecall_helpers, fast5utils, helpers
+from taiyaki.cmdargs import (AutoBool, cpu_list, FileExists, Maybe,
+                             NonNegative, ParseToNamedTuple, Positive)
 from taiyaki.common_cmdargs import add_common_command_args
-from taiyaki.decode import flipflop_make_trans, flipflop_viterbi
-from taiyaki.flipflopfings import nstate_flipflop, path_to_str
-from taiyaki.helpers import (guess_model_stride, load_model,
-                             open_file_or_stdout, Progress)
-from taiyaki.maths import med_mad
+from taiyaki.flipflopfings import nstate_flipflop
+from taiyaki.helpers import get_model_stride, load_model, Progress
+from taiyaki.iterators import prefetch_map, StageTimer
 from taiyaki.prepare_mapping_funcs import get_per_read_params_dict_from_tsv
 from taiyaki.signal import Signal
 
@@ -27,17 +27,30 @@ def get_parser():
 
     add_common_command_args(
         parser, """alphabet device input_folder
-        input_strand_list jobs limit output quiet
+        input_strand_list jobs limit quiet
         recursive version""".split())
 
     parser.add_argument(
         '--beam', default=None, metavar=('width', 'guided'), nargs=2,
         type=(int, bool), action=ParseToNamedTuple,
         help='Use beam search decoding')
+    parser.add_argument(
+        '--beam_by_chunk', default=False, action=AutoBool,
+        help='With --beam, decode each chunk as it leaves the network and '
+        'stitch the paths, as for Viterbi decoding, rather than decoding the '
+        'whole read.  Memory used no longer grows with the length of reads '
+        'but calls near chunk boundaries may differ')
     parser.add_argument(
         "--chunk_size", type=Positive(int), metavar="blocks",
         default=basecall_helpers._DEFAULT_CHUNK_SIZE,
         help="Size of signal chunks sent to GPU is chunk_size * model stride")
+    parser.add_argument(
+        '--execution_mode', default='processes',
+        choices=['processes', 'threads'],
+        help='Run --jobs worker processes, each with its own copy of the '
+        'model, or a single process with --jobs threads sharing the model. '
+        'Each thread batches chunks from its own reads; chunks from '
+        'different threads are not batched together')
     parser.add_argument(
         '--fastq', default=False, action=AutoBool,
         help='Write output in fastq format (default is fasta)')
@@ -45,6 +58,10 @@ def get_parser():
         "--max_concurrent_chunks", type=Positive(int), default=128,
         help="Maximum number of chunks to call at "
         "once. Lower values will consume less (GPU) RAM.")
+    parser.add_argument(
+        '--output', default=None, metavar='filename',
+        help='Write output to file. With --reads_per_shard, the shard '
+        'number is inserted before the extension of the filename')
     parser.add_argument(
         "--overlap", type=NonNegative(int), metavar="blocks",
         default=basecall_helpers._DEFAULT_OVERLAP,
@@ -58,38 +75,78 @@ def get_parser():
     parser.add_argument(
         "--qscore_scale", type=float, default=1.0,
         help="Scaling factor to apply to q scores in fastq")
+    parser.add_argument(
+        "--queue_size", type=Positive(int), default=4,
+        help="Maximum number of reads each worker holds between the reading, "
+        "network and decoding stages of its pipeline")
+    parser.add_argument(
+        "--reads_per_shard", type=Maybe(Positive(int)), default=None,
+        help="Split output into files of this many reads.  Shards are "
+        "suffixed '.partial' until complete.  Default: single output file")
+    parser.add_argument(
+        "--reader_threads", type=Positive(int), default=1,
+        help="Number of threads each worker uses to read and normalise "
+        "signal ahead of the network")
+    parser.add_argument(
+        "--reads_per_task", type=Positive(int), default=16,
+        help="Number of reads sent to a worker at once, without "
+        "--schedule_by_length.  Chunks from all reads sent to a worker are "
+        "batched together.")
+    parser.add_argument(
+        '--resume', default=False, action=AutoBool,
+        help='Record completed reads in an index alongside output and, if '
+        'the index exists, skip reads already called and append to output. '
+        'Reads that failed are called again')
     parser.add_argument(
         '--reverse', default=False, action=AutoBool,
         help='Reverse sequences in output')
+    parser.add_argument(
+        "--samples_per_task", type=Positive(int), default=1000000,
+        help="Maximum number of samples sent to a worker at once, with "
+        "--schedule_by_length.  Longer reads are sent on their own.")
     parser.add_argument(
         '--scaling', action=FileExists, default=None,
         help='Path to TSV containing per-read scaling params')
+    parser.add_argument(
+        '--schedule_by_length', default=False, action=AutoBool,
+        help='Find the length of all reads from their fast5 metadata before '
+        'calling, then send the longest reads to workers first and group '
+        'short reads together.  Otherwise send reads in file order')
+    parser.add_argument(
+        '--shared_model', default=False, action=AutoBool,
+        help='Load model once and share it between all workers, rather than '
+        'each worker loading its own copy. CPU only')
+    parser.add_argument(
+        '--stream_long_reads', default=False, action=AutoBool,
+        help='Call reads with more than --max_concurrent_chunks chunks as a '
+        'stream: chunks are created, called and decoded a window at a time '
+        'and the basecall built progressively, so memory used by a worker '
+        'does not grow with the length of reads.  Requires --beam_by_chunk '
+        'with --beam')
     parser.add_argument(
         '--temperature', default=1.0, type=float,
         help='Scaling factor applied to network outputs before decoding')
+    parser.add_argument(
+        '--torch_threads', default=None, type=Maybe(Positive(int)),
+        help='Number of threads torch uses within each operation, for each '
+        'worker.  Default: with --execution_mode threads, the number of '
+        'CPUs available divided between --jobs threads; otherwise number of '
+        '--worker_cpus if given, or torch default')
+    parser.add_argument(
+        '--worker_cpus', default=None, nargs='+', type=cpu_list,
+        metavar='cpus',
+        help='CPUs each worker process is pinned to, e.g. 0-3 4-7 for two '
+        'workers with four CPUs each.  Sets are assigned to workers in turn. '
+        'With --execution_mode threads, the process is pinned to all CPUs '
+        'listed')
     parser.add_argument(
         "model", action=FileExists,
-        help="Model checkpoint file to use for basecalling")
+        help="Model checkpoint, or TorchScript model exported by "
+        "misc/export_model.py, to use for basecalling")
 
     return parser
 
 
-def med_mad_norm(x, dtype='f4'):
-    """ Normalise a numpy array using median and MAD
-
-    Args:
-        x (:class:`ndarray`): 1D array containing values to be normalised.
-        dtype (str or :class:`dtype`): dtype of returned array.
-
-    Returns:
-        :class:`ndarray`:  Array of same shape as `x` and dtype `dtype`
-            contained normalised values.
-    """
-    med, mad = med_mad(x)
-    normed_x = (x - med) / mad
-    return normed_x.astype(dtype)
-
-
 def get_signal(read_filename, read_id):
     """ Get raw signal from read tuple
 
@@ -115,62 +172,122 @@ def get_signal(read_filename, read_id):
         return None
 
 
-def worker_init(device, modelname, chunk_size, overlap,
+def worker_init(device, model, chunk_size, overlap,
                 read_params, alphabet, max_concurrent_chunks,
                 fastq, qscore_scale, qscore_offset, beam, posterior,
-                temperature):
+                temperature, reader_threads, queue_size, beam_by_chunk,
+                stream_long_reads, torch_threads, worker_cpus,
+                worker_counter):
     global all_read_params
-    global process_read_partial
+    global process_reads_partial
 
     all_read_params = read_params
+    cpus = None
+    if worker_cpus is not None:
+        if worker_counter is None:
+            #  Single process, run on all CPUs given
+            cpus = sorted(set().union(*worker_cpus))
+        else:
+            with worker_counter.get_lock():
+                worker_index = worker_counter.value
+                worker_counter.value += 1
+            cpus = worker_cpus[worker_index % len(worker_cpus)]
+    basecall_helpers.set_worker_threads(torch_threads, cpus)
     device = helpers.set_torch_device(device)
-    model = load_model(modelname).to(device)
-    stride = guess_model_stride(model)
+    if isinstance(model, str):
+        model = load_model(model, map_location=device)
+    model = model.to(device)
+    stride = get_model_stride(model)
     chunk_size = chunk_size * stride
     overlap = overlap * stride
 
     n_can_base = len(alphabet)
     n_can_state = nstate_flipflop(n_can_base)
 
-    def process_read_partial(read_filename, read_id, read_params):
-        res = process_read(read_filename, read_id,
-                           model, chunk_size, overlap, read_params,
-                           n_can_state, stride, alphabet,
-                           max_concurrent_chunks, fastq, qscore_scale,
-                           qscore_offset, beam, posterior, temperature)
-        return (read_id, *res)
+    def process_reads_partial(reads):
+        return process_reads(reads, model, chunk_size, overlap,
+                             n_can_state, stride, alphabet,
+                             max_concurrent_chunks, fastq, qscore_scale,
+                             qscore_offset, beam, posterior, temperature,
+                             reader_threads, queue_size, beam_by_chunk,
+                             stream_long_reads)
 
 
-def worker(args):
-    read_filename, read_id = args
-    read_params = all_read_params[
-        read_id] if read_id in all_read_params else None
-    return process_read_partial(read_filename, read_id, read_params)
+def worker(reads):
+    reads = [(read_filename, read_id, all_read_params.get(read_id))
+             for read_filename, read_id in reads]
+    return process_reads_partial(reads)
 
 
-def process_read(
-        read_filename, read_id, model, chunk_size, overlap, read_params,
-        n_can_state, stride, alphabet, max_concurrent_chunks,
-        fastq=False, qscore_scale=1.0, qscore_offset=0.0, beam=None,
-        posterior=True, temperature=1.0):
-    """Basecall a read, dividing the samples into chunks before applying the
-    basecalling network and then stitching them back together.
+def load_read(read_filename, read_id, read_params, chunk_size, overlap,
+              reverse=False):
+    """ Load, normalise and chunk the signal of a read
 
     Args:
         read_filename (str): filename to load data from.
-        read_id (str): id used in comment line in fasta or fastq output.
+        read_id (str): id of read to load.
+        read_params (dict str -> T): reads specific scaling parameters,
+            including 'shift' and 'scale', or None.
+        chunk_size (int): chunk size, measured in samples.
+        overlap (int): overlap between chunks, measured in samples.
+        reverse (bool): Reverse signal before normalising.
+
+    Returns:
+        tuple of list and :class:`ndarray` and :class:`ndarray` and int:
+            chunked signal, as views onto the normalised signal, start and end
+            coordinates of each chunk and the number of samples in the read,
+            as returned by :func:`basecall_helpers.strided_chunks`.
+
+        If unable to read signal from file, `None` is returned.
+    """
+    signal = get_signal(read_filename, read_id)
+    if signal is None:
+        return None
+    normed_signal = basecall_helpers.normalise_signal(
+        signal, read_params, reverse)
+    chunks, chunk_starts, chunk_ends = basecall_helpers.strided_chunks(
+        normed_signal, chunk_size, overlap)
+    return chunks, chunk_starts, chunk_ends, len(signal)
+
+
+def process_reads(
+        reads, model, chunk_size, overlap, n_can_state, stride, alphabet,
+        max_concurrent_chunks, fastq=False, qscore_scale=1.0,
+        qscore_offset=0.0, beam=None, posterior=True, temperature=1.0,
+        reader_threads=1, queue_size=4, beam_by_chunk=False,
+        stream_long_reads=False):
+    """Basecall a group of reads, dividing the samples into chunks and
+    batching the chunks of all reads together before applying the basecalling
+    network.  The outputs for each read are stitched back together once all
+    its chunks have been called.
+
+    Reads are processed by a pipeline of three stages, which run concurrently:
+    reader threads load and normalise signal, the network is applied to
+    batches of chunks, and a decoding thread stitches and decodes the output
+    for each read.  Each stage holds at most `queue_size` reads ready for
+    the next.  With beam search, groups of `queue_size` reads are decoded
+    together in parallel unless `beam_by_chunk` is set, when each batch of
+    chunks is decoded as it leaves the network.
+
+    With `stream_long_reads`, reads with more than `max_concurrent_chunks`
+    chunks are not batched but called by the network stage on their own, one
+    window of chunks at a time, see :func:`basecall_helpers.stream_read`.
+    Streaming requires `beam_by_chunk` when `beam` is set.
+
+    Args:
+        reads (list of tuples): (read_filename, read_id, read_params) for
+            each read, where `read_params` is a dict containing the
+            read-specific scaling parameters 'shift' and 'scale', or None.
         model (:class:`nn.Module`): Taiyaki network.
         chunk_size (int): chunk size, measured in samples.
         overlap (int): overlap between chunks, measured in samples.
-        read_params (dict str -> T): reads specific scaling parameters,
-            including 'shift' and 'scale'.
         n_can_state (int): number of canonical flip-flop transitions (40 for
             ACGT).
         stride (int): stride of basecalling network (measured in samples)
         alphabet (str): Alphabet (e.g. 'ACGT').
         max_concurrent_chunks (int): max number of chunks to basecall at same
-            time (having this limit prevents running out of memory for long
-            reads).
+            time.  Chunks from different reads are combined to fill batches of
+            this size.
         fastq (bool): generate fastq file with q scores if this is True,
             otherwise generate fasta.
         qscore_scale (float): Scaling factor for Q score calibration.
@@ -178,72 +295,171 @@ def process_read(
         beam (None or NamedTuple): Use beam search decoding
         posterior (bool): Decode using posterior probability of transitions
         temperature (float): Multiplier for network output
+        reader_threads (int): Number of threads loading signal.
+        queue_size (int): Maximum number of reads buffered between stages.
+        beam_by_chunk (bool): With `beam`, decode chunks separately and
+            stitch their paths.
+        stream_long_reads (bool): Stream reads with more than
+            `max_concurrent_chunks` chunks.
 
     Returns:
-        tuple of str and str and int: strings containing the called bases and
-            their associated Phred-encoded quality scores, and the number of
-            samples in the read (before chunking).
+        tuple of list and dict: The list contains a tuple (read_id,
+            basecall, qstring, nsample) for each read, where `basecall` and
+            `qstring` are strings containing the called bases and their
+            associated Phred-encoded quality scores, and `nsample` is the
+            number of samples in the read (before chunking).  The dictionary
+            maps the name of each stage to a :class:`StageTimer` recording its
+            throughput.
 
         When `fastq` is False, `None` is returned instead of a quality string.
+        If the signal for a read cannot be obtained, both `basecall` and
+        `qstring` are `None`.
     """
-    signal = get_signal(read_filename, read_id)
-    if signal is None:
-        return None, None, 0
-    if model.metadata['reverse']:
-        signal = signal[::-1]
-
-    if read_params is None:
-        normed_signal = med_mad_norm(signal)
+    assert not stream_long_reads or beam is None or beam_by_chunk, \
+        'Streaming reads with beam search requires decoding by chunk'
+    timers = {'read': StageTimer('reads'),
+              'network': StageTimer('chunks'),
+              'decode': StageTimer('reads')}
+
+    def read_stage(read):
+        read_filename, read_id, read_params = read
+        with timers['read'].time():
+            return read_id, load_read(
+                read_filename, read_id, read_params, chunk_size, overlap,
+                model.metadata['reverse'])
+
+    def network_stage(loaded_reads):
+        batcher = basecall_helpers.ChunkBatcher(max_concurrent_chunks)
+
+        def call_batches(flush=False):
+            for chunks, index in batcher.batches(flush=flush):
+                with timers['network'].time(len(index)):
+                    outputs = basecall_helpers.call_chunks(
+                        model, chunks, n_can_state, fastq, beam, posterior,
+                        temperature, beam_by_chunk)
+                for _, read_data, read_outputs in batcher.add_outputs(
+                        index, *outputs):
+                    yield read_data + (read_outputs,)
+
+        for i, (read_id, read) in enumerate(loaded_reads):
+            if read is None:
+                yield read_id, None, None, 0, None
+                continue
+            chunks, chunk_starts, chunk_ends, nsample = read
+            nchunks = len(chunk_starts)
+            if stream_long_reads and nchunks > max_concurrent_chunks:
+                #  Long read, streamed and decoded as it is called
+                with timers['network'].time(nchunks):
+                    call = basecall_helpers.stream_read(
+                        chunks, chunk_starts, chunk_ends, model, n_can_state,
+                        stride, alphabet, max_concurrent_chunks, fastq,
+                        qscore_scale, qscore_offset, beam, posterior,
+                        temperature)
+                yield read_id, None, None, nsample, call
+                continue
+            batcher.add_read(
+                i, chunks, (read_id, chunk_starts, chunk_ends, nsample))
+            yield from call_batches()
+        yield from call_batches(flush=True)
+
+    def decode_stage(group):
+        called = [read for read in group
+                  if read[4] is not None and read[1] is not None]
+        with timers['decode'].time(len(called)):
+            if decode_beam:
+                calls = basecall_helpers.beam_decode_reads(
+                    [(read[4], read[1], read[2]) for read in called], stride,
+                    alphabet, beam)
+            else:
+                #  Paths from beam search by chunk include their last state
+                calls = [basecall_helpers.decode_read(
+                    read_outputs, chunk_starts, chunk_ends, stride, alphabet,
+                    fastq, qscore_scale, qscore_offset,
+                    path_stitching=beam is not None)
+                    for _, chunk_starts, chunk_ends, _, read_outputs in called]
+        calls = iter(calls)
+        results = []
+        for read_id, chunk_starts, _, nsample, read_outputs in group:
+            if read_outputs is None:
+                call = (None, None)
+            elif chunk_starts is None:
+                #  Streamed read, outputs are its basecall
+                call = read_outputs
+            else:
+                call = next(calls)
+            results.append((read_id,) + call + (nsample,))
+        return results
+
+    #  Reads are decoded from their stitched paths if already decoded by chunk
+    decode_beam = beam is not None and not beam_by_chunk
+    if not decode_beam:
+        group_size, ngroup = 1, queue_size
     else:
-        normed_signal = (signal - read_params['shift']) / read_params['scale']
+        #  Beam search decodes a group of reads in parallel.  A second group
+        #  is collected from the network stage while the first is decoded.
+        group_size, ngroup = queue_size, 2
 
-    chunks, chunk_starts, chunk_ends = basecall_helpers.chunk_read(
-        normed_signal, chunk_size, overlap)
+    def group_stage(called_reads):
+        called_reads = iter(called_reads)
+        return iter(lambda: list(islice(called_reads, group_size)), [])
+
+    loaded_reads = prefetch_map(read_stage, reads, reader_threads,
+                                queue_size)
+    groups = prefetch_map(decode_stage,
+                          group_stage(network_stage(loaded_reads)), 1, ngroup)
+    results = [result for group in groups for result in group]
+    return results, timers
 
-    qstring = None
-    with torch.no_grad():
-        device = next(model.parameters()).device
-        chunks = torch.tensor(chunks, device=device)
-        trans = []
-        for some_chunks in torch.split(chunks, max_concurrent_chunks, 1):
-            trans.append(model(some_chunks)[:, :, :n_can_state])
-        trans = torch.cat(trans, 1) * temperature
-
-        if posterior:
-            trans = (flipflop_make_trans(trans) + 1e-8).log()
-
-        if beam is not None:
-            trans = basecall_helpers.stitch_chunks(trans, chunk_starts,
-                                                   chunk_ends, stride)
-            best_path, score = decodeutil.beamsearch(trans.cpu().numpy(),
-                                                     beam_width=beam.width,
-                                                     guided=beam.guided)
-        else:
-            _, _, chunk_best_paths = flipflop_viterbi(trans)
-            best_path = basecall_helpers.stitch_chunks(
-                chunk_best_paths, chunk_starts, chunk_ends,
-                stride).cpu().numpy()
 
-        if fastq:
-            chunk_errprobs = qscores.errprobs_from_trans(trans,
-                                                         chunk_best_paths)
-            errprobs = basecall_helpers.stitch_chunks(
-                chunk_errprobs, chunk_starts, chunk_ends, stride)
-            qstring = qscores.path_errprobs_to_qstring(errprobs, best_path,
-                                                       qscore_scale,
-                                                       qscore_offset)
+def process_read(
+        read_filename, read_id, model, chunk_size, overlap, read_params,
+        n_can_state, stride, alphabet, max_concurrent_chunks,
+        fastq=False, qscore_scale=1.0, qscore_offset=0.0, beam=None,
+        posterior=True, temperature=1.0, beam_by_chunk=False,
+        stream_long_reads=False):
+    """Basecall a single read.  See :func:`process_reads` for a description
+    of the arguments.
 
-    # This makes our basecalls agree with Guppy's, and removes the
-    # problem that there is no entry transition for the first path
-    # element, so we don't know what the q score is.
-    basecall = path_to_str(best_path, alphabet=alphabet,
-                           include_first_source=False)
+    Returns:
+        tuple of str and str and int: strings containing the called bases and
+            their associated Phred-encoded quality scores, and the number of
+            samples in the read (before chunking).
 
-    return basecall, qstring, len(signal)
+        When `fastq` is False, `None` is returned instead of a quality string.
+    """
+    ((_, basecall, qstring, nsample),), _ = process_reads(
+        [(read_filename, read_id, read_params)], model, chunk_size, overlap,
+        n_can_state, stride, alphabet, max_concurrent_chunks, fastq,
+        qscore_scale, qscore_offset, beam, posterior, temperature,
+        beam_by_chunk=beam_by_chunk, stream_long_reads=stream_long_reads)
+    return basecall, qstring, nsample
 
 
 def main():
-    args = get_parser().parse_args()
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.beam is not None and args.fastq:
+        parser.error('--fastq output is not supported with --beam decoding')
+    if args.shared_model and torch.device(args.device).type != 'cpu':
+        parser.error('--shared_model is only supported on the CPU')
+    if args.stream_long_reads and args.beam is not None and \
+            not args.beam_by_chunk:
+        parser.error('--stream_long_reads requires --beam_by_chunk with ' +
+                     '--beam')
+    if args.output is None and (args.resume or
+                                args.reads_per_shard is not None):
+        parser.error('--output is required with --resume or --reads_per_shard')
+    writer = basecall_helpers.BasecallWriter(
+        args.output, args.reads_per_shard, args.resume)
+    existing_files = writer.existing_files()
+    if args.resume:
+        if (len(existing_files) > 0 and
+                writer.index_filename not in existing_files):
+            parser.error(('Cannot resume, output exists but index {} does ' +
+                          'not').format(writer.index_filename))
+    elif len(existing_files) > 0:
+        parser.error('Output {} exists, use --resume to continue'.format(
+            existing_files[0]))
 
     # TODO convert to logging
 
@@ -271,28 +487,92 @@ def main():
     t0 = time.time()
     progress = Progress(quiet=args.quiet)
     startcharacter = '@' if args.fastq else '>'
-    initargs = [args.device, args.model, args.chunk_size, args.overlap,
+    if args.shared_model:
+        #  Model is loaded once and its parameters placed in shared memory.
+        #  Forked workers inherit the model rather than loading their own copy.
+        sys.stderr.write("* Loading model into shared memory.\n")
+        model = load_model(args.model).share_memory()
+        pool_context = multiprocessing.get_context('fork')
+    else:
+        model = args.model
+        pool_context = multiprocessing.get_context()
+    torch_threads = args.torch_threads
+    if args.execution_mode == 'threads':
+        cpus = None
+        if args.worker_cpus is not None:
+            cpus = sorted(set().union(*args.worker_cpus))
+            if len(args.worker_cpus) > 1:
+                sys.stderr.write(
+                    ('* Warning: --execution_mode threads runs all workers ' +
+                     'in one process, pinned to all {} CPUs of ' +
+                     '--worker_cpus rather than a set per worker.\n').format(
+                         len(cpus)))
+        if torch_threads is None:
+            #  Avoid each thread using every CPU in each operation
+            torch_threads = basecall_helpers.threads_per_worker(
+                args.jobs, cpus)
+    initargs = [args.device, model, args.chunk_size, args.overlap,
                 all_read_params, args.alphabet,
                 args.max_concurrent_chunks, args.fastq, args.qscore_scale,
                 args.qscore_offset, args.beam, args.posterior,
-                args.temperature]
-    pool = Pool(args.jobs, initializer=worker_init, initargs=initargs)
-    with open_file_or_stdout(args.output) as fh:
-        for read_id, basecall, qstring, read_nsample in \
-                pool.imap_unordered(worker, fast5_reads):
-            if basecall is not None and len(basecall) > 0:
-                fh.write("{}{}\n{}\n".format(
-                    startcharacter, read_id,
-                    basecall[::-1] if args.reverse else basecall))
-                nbase += len(basecall)
-                ncalled += 1
-                if args.fastq:
-                    fh.write("+\n{}\n".format(
-                        qstring[::-1] if args.reverse else qstring))
-
-            nread += 1
-            nsample += read_nsample
-            progress.step()
+                args.temperature, args.reader_threads, args.queue_size,
+                args.beam_by_chunk, args.stream_long_reads,
+                torch_threads, args.worker_cpus]
+    stage_timers = {'read': StageTimer('reads'),
+                    'network': StageTimer('chunks'),
+                    'decode': StageTimer('reads')}
+    task_completion_times = []
+    with writer:
+        if len(writer.done_read_ids) > 0:
+            sys.stderr.write(
+                "* Resuming, skipping {} reads already called.\n".format(
+                    len(writer.done_read_ids)))
+            fast5_reads = (rec for rec in fast5_reads
+                           if rec[1] not in writer.done_read_ids)
+        if args.schedule_by_length:
+            read_lengths = list(fast5utils.iterate_read_lengths(fast5_reads))
+            read_groups = basecall_helpers.schedule_reads(
+                read_lengths, args.samples_per_task)
+            sys.stderr.write(
+                ("* Scheduled {} reads ({:.1f} Msample) in {} tasks, " +
+                 "longest first.\n").format(
+                    len(read_lengths),
+                    sum(rec[2] for rec in read_lengths) / 1e6,
+                    len(read_groups)))
+        else:
+            fast5_reads = iter(fast5_reads)
+            read_groups = iter(
+                lambda: list(islice(fast5_reads, args.reads_per_task)), [])
+        if args.execution_mode == 'threads':
+            #  Threads share the model, initialised once in this process
+            worker_init(*initargs, None)
+            pool = ThreadPool(args.jobs)
+        else:
+            worker_counter = pool_context.Value('i', 0)
+            pool = pool_context.Pool(args.jobs, initializer=worker_init,
+                                     initargs=initargs + [worker_counter])
+        for results, timers in pool.imap_unordered(worker, read_groups):
+            task_completion_times.append(time.time())
+            for stage, timer in timers.items():
+                stage_timers[stage].update(timer)
+            for read_id, basecall, qstring, read_nsample in results:
+                record = ''
+                if basecall is not None and len(basecall) > 0:
+                    record = "{}{}\n{}\n".format(
+                        startcharacter, read_id,
+                        basecall[::-1] if args.reverse else basecall)
+                    nbase += len(basecall)
+                    ncalled += 1
+                    if args.fastq:
+                        record += "+\n{}\n".format(
+                            qstring[::-1] if args.reverse else qstring)
+                writer.write(read_id, record)
+
+                nread += 1
+                nsample += read_nsample
+                progress.step()
+            #  Results for a group of reads are a natural checkpoint
+            writer.checkpoint()
     total_time = time.time() - t0
 
     sys.stderr.write(
@@ -302,6 +582,14 @@ def main():
     sys.stderr.write(
         "* {:7.2f} ksample / s\n".format(nsample / total_time / 1000.0))
     sys.stderr.write("* {} reads failed.\n".format(nread - ncalled))
+    tail = basecall_helpers.idle_tail(task_completion_times, args.jobs)
+    sys.stderr.write(
+        "* Idle tail {:.2f}s ({:.1%} of run) with fewer tasks than "
+        "workers outstanding.\n".format(tail, tail / total_time))
+    sys.stderr.write("* Time spent in each stage, summed over workers:\n")
+    for stage in ['read', 'network', 'decode']:
+        sys.stderr.write("*   {:8s} {}\n".format(
+            stage, stage_timers[stage]))
     return
 
 
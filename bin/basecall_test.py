@@ -16,7 +16,7 @@ from taiyaki.cmdargs import (AutoBool, FileExists, NonNegative,
 from taiyaki.common_cmdargs import add_common_command_args
 from taiyaki.decode import flipflop_make_trans, flipflop_viterbi
 from taiyaki.flipflopfings import nstate_flipflop, path_to_str
-from taiyaki.helpers import (guess_model_stride, load_model,
+from taiyaki.helpers import (get_model_stride, load_model,
                              open_file_or_stdout, Progress)
 from taiyaki.maths import med_mad
 from taiyaki.prepare_mapping_funcs import get_per_read_params_dict_from_tsv
@@ -129,7 +129,7 @@ def worker_init(device, modelname, chunk_size, overlap,
     device = helpers.set_torch_device(device)
     model = load_model(modelname).to(device)
     qmodel = torch.quantization.quantize_dynamic(model, {nn.LSTM}, dtype=torch.qint8)
-    stride = guess_model_stride(qmodel)
+    stride = get_model_stride(qmodel)
     chunk_size = chunk_size * stride
     overlap = overlap * stride
 
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+# Benchmark the stages of basecalling over a grid of settings
+import argparse
+from collections import OrderedDict
+from itertools import islice, product
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import resource
+import sys
+import time
+
+import numpy as np
+import torch
+
+from ont_fast5_api import fast5_interface
+
+from taiyaki import basecall_helpers, fast5utils
+from taiyaki.cmdargs import (AutoBool, FileExists, Maybe, NonNegative,
+                             ParseToNamedTuple, Positive)
+from taiyaki.common_cmdargs import add_common_command_args
+from taiyaki.flipflopfings import nstate_flipflop
+from taiyaki.helpers import get_model_stride, load_model, set_torch_device
+from taiyaki.iterators import StageTimer
+from taiyaki.signal import Signal
+
+
+#  Stages of basecalling timed, in the order they are applied.  The network,
+#  posterior, viterbi and qscores stages are the steps of
+#  basecall_helpers.call_chunks; decode is stitching the outputs of each read
+#  and forming its basecall, by basecall_helpers.decode_read
+STAGES = OrderedDict([
+    ('io', 'reads'),
+    ('normalisation', 'reads'),
+    ('chunking', 'reads'),
+    ('network', 'chunks'),
+    ('posterior', 'chunks'),
+    ('viterbi', 'chunks'),
+    ('qscores', 'chunks'),
+    ('decode', 'reads')])
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Time each stage of basecalling, for every combination ' +
+        'of the settings given, and report timings and peak memory use',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    add_common_command_args(
+        parser, """alphabet device input_strand_list limit output recursive
+        version""".split())
+
+    parser.add_argument(
+        '--beam', default=None, metavar=('width', 'guided'), nargs=2,
+        type=(int, bool), action=ParseToNamedTuple,
+        help='Use beam search decoding, as for basecall.py')
+    parser.add_argument(
+        '--beam_by_chunk', default=False, action=AutoBool,
+        help='With --beam, decode each chunk, as for basecall.py')
+    parser.add_argument(
+        '--chunk_size', default=[basecall_helpers._DEFAULT_CHUNK_SIZE],
+        nargs='+', type=Positive(int), metavar='blocks',
+        help='Sizes of chunks to try, as for basecall.py')
+    parser.add_argument(
+        '--execution_mode', default='processes',
+        choices=['processes', 'threads'],
+        help='Run --jobs worker processes, or --jobs threads sharing one '
+        'model, as for basecall.py')
+    parser.add_argument(
+        '--fastq', default=False, action=AutoBool,
+        help='Calculate q scores, as for fastq output of basecall.py')
+    parser.add_argument(
+        '--format', default='json', choices=['json', 'tsv'],
+        help='Format of report')
+    parser.add_argument(
+        '--input_folder', default=None, action=FileExists,
+        help='Directory containing fast5 files of reads to call.  Default: '
+        'call synthetic reads')
+    parser.add_argument(
+        '--jobs', default=[1], nargs='+', type=Positive(int), metavar='n',
+        help='Numbers of worker processes to try')
+    parser.add_argument(
+        '--max_concurrent_chunks', default=[128], nargs='+',
+        type=Positive(int), metavar='chunks',
+        help='Maximum numbers of chunks called at once to try')
+    parser.add_argument(
+        '--overlap', default=[basecall_helpers._DEFAULT_OVERLAP], nargs='+',
+        type=NonNegative(int), metavar='blocks',
+        help='Overlaps between chunks to try, as for basecall.py')
+    parser.add_argument(
+        '--posterior', default=True, action=AutoBool,
+        help='Decode using posterior probability of transitions')
+    parser.add_argument(
+        '--reads_per_task', default=16, type=Positive(int),
+        help='Number of reads sent to a worker at once')
+    parser.add_argument(
+        '--seed', default=None, type=NonNegative(int),
+        help='Seed for signal of synthetic reads.  Default: random')
+    parser.add_argument(
+        '--stream_long_reads', default=False, action=AutoBool,
+        help='Stream reads with more than --max_concurrent_chunks chunks, as '
+        'for basecall.py')
+    parser.add_argument(
+        '--synthetic_length', default=20000, type=Positive(int),
+        metavar='samples', help='Length of each synthetic read')
+    parser.add_argument(
+        '--synthetic_reads', default=64, type=Positive(int),
+        help='Number of synthetic reads to call, without --input_folder')
+    parser.add_argument(
+        '--temperature', default=1.0, type=float,
+        help='Scaling factor applied to network outputs before decoding')
+    parser.add_argument(
+        '--torch_threads', default=None, type=Maybe(Positive(int)),
+        help='Number of threads torch uses within each operation, for each '
+        'worker.  Default: with --execution_mode threads, the number of '
+        'CPUs available divided between --jobs threads; otherwise torch '
+        'default')
+
+    parser.add_argument(
+        'model', action=FileExists,
+        help='Model checkpoint, or exported TorchScript model, to '
+        'benchmark')
+
+    return parser
+
+
+def load_signal(read):
+    """ Load raw signal of a read from its fast5 file or, for a synthetic
+    read, generate it
+
+    Args:
+        read (tuple): (filepath, read_id) of a read in a fast5 file or, for
+            a synthetic read, (None, seed, nsample).
+
+    Returns:
+        :class:`ndarray`: 1D array containing signal, or None if the signal
+            could not be read.
+    """
+    if read[0] is None:
+        _, seed, nsample = read
+        rng = np.random.RandomState(seed)
+        return rng.normal(90.0, 15.0, size=nsample).astype('f4')
+    try:
+        with fast5_interface.get_fast5_file(read[0], 'r') as f5file:
+            return Signal(f5file.get_read(read[1])).current
+    except Exception as e:
+        sys.stderr.write(
+            'Unable to obtain signal for {} from {}.\n{}\n'.format(
+                read[1], read[0], repr(e)))
+        return None
+
+
+def worker_init(device, model, chunk_size, overlap, max_concurrent_chunks,
+                alphabet, call_params, torch_threads):
+    global benchmark_reads_partial
+
+    basecall_helpers.set_worker_threads(torch_threads)
+    device = set_torch_device(device)
+    model = load_model(model, map_location=device).to(device).eval()
+    stride = get_model_stride(model)
+    chunk_size *= stride
+    overlap *= stride
+    n_can_state = nstate_flipflop(len(alphabet))
+    #  First call to model has one-off costs that should not be timed
+    with torch.no_grad():
+        model(torch.zeros(chunk_size, 1, 1, device=device))
+
+    def benchmark_reads_partial(reads):
+        return benchmark_reads(
+            reads, model, chunk_size, overlap, n_can_state, stride, alphabet,
+            max_concurrent_chunks, **call_params)
+
+
+def worker(reads):
+    return benchmark_reads_partial(reads)
+
+
+def benchmark_reads(reads, model, chunk_size, overlap, n_can_state, stride,
+                    alphabet, max_concurrent_chunks, fastq=True, beam=None,
+                    posterior=True, temperature=1.0, beam_by_chunk=False,
+                    stream_long_reads=False):
+    """ Basecall a group of reads, timing each stage separately
+
+    Chunks are called and decoded by the functions used by basecall.py,
+    :func:`basecall_helpers.call_chunks`, :func:`basecall_helpers.decode_read`
+    and :func:`basecall_helpers.stream_read`, with chunks from all reads
+    batched together.  Stages are applied one after another, rather than
+    overlapped as by basecall.py, so the time for each can be measured.  When
+    decoding by beam search after stitching, the reads of the task are decoded
+    together.
+
+    Args:
+        reads (list of tuple): reads to call, see :func:`load_signal`.
+        model (:class:`nn.Module`): Taiyaki network.
+        chunk_size (int): chunk size, measured in samples.
+        overlap (int): overlap between chunks, measured in samples.
+        n_can_state (int): number of canonical flip-flop transitions.
+        stride (int): stride of basecalling network (measured in samples)
+        alphabet (str): Alphabet (e.g. 'ACGT').
+        max_concurrent_chunks (int): max number of chunks to basecall at same
+            time.
+        fastq (bool): calculate q scores.
+        beam (None or NamedTuple): Use beam search decoding
+        posterior (bool): Decode using posterior probability of transitions
+        temperature (float): Multiplier for network output
+        beam_by_chunk (bool): With `beam`, decode each chunk using beam search
+        stream_long_reads (bool): Stream reads with more than
+            `max_concurrent_chunks` chunks, see
+            :func:`basecall_helpers.stream_read`.
+
+    Returns:
+        dict: with entries 'timers', a dictionary mapping each stage to a
+            :class:`StageTimer`, 'start' and 'end' times of the task, the
+            number of reads 'nread', samples 'nsample' and bases 'nbase'
+            called, and the peak resident memory of the worker 'peak_rss', in
+            kilobytes.
+    """
+    start = time.time()
+    timers = {stage: StageTimer(unit) for stage, unit in STAGES.items()}
+    call_steps = [timers[stage] for stage in
+                  ['network', 'posterior', 'viterbi', 'qscores']]
+    batcher = basecall_helpers.ChunkBatcher(max_concurrent_chunks)
+    decode_beam = beam is not None and not beam_by_chunk
+    #  Called reads awaiting beam search
+    called = []
+    nread, nsample, nbase = 0, 0, 0
+
+    def call_batches(flush=False):
+        nbase = 0
+        for chunks, index in batcher.batches(flush=flush):
+            outputs = basecall_helpers.call_chunks(
+                model, chunks, n_can_state, fastq, beam, posterior,
+                temperature, beam_by_chunk, timers=timers)
+            for _, (chunk_starts, chunk_ends), read_outputs in \
+                    batcher.add_outputs(index, *outputs):
+                if decode_beam:
+                    called.append((read_outputs, chunk_starts, chunk_ends))
+                    continue
+                with timers['decode'].time():
+                    basecall, _ = basecall_helpers.decode_read(
+                        read_outputs, chunk_starts, chunk_ends, stride,
+                        alphabet, fastq, path_stitching=beam is not None)
+                nbase += len(basecall)
+        return nbase
+
+    for i, read in enumerate(reads):
+        with timers['io'].time():
+            signal = load_signal(read)
+        if signal is None:
+            continue
+        with timers['normalisation'].time():
+            signal = basecall_helpers.normalise_signal(
+                signal, None, model.metadata['reverse'])
+        with timers['chunking'].time():
+            chunks, chunk_starts, chunk_ends = \
+                basecall_helpers.strided_chunks(signal, chunk_size, overlap)
+        nread += 1
+        nsample += len(signal)
+        if stream_long_reads and len(chunk_starts) > max_concurrent_chunks:
+            #  Time streaming other than calling chunks as decoding
+            call_seconds = sum(timer.seconds for timer in call_steps)
+            stream_start = time.time()
+            basecall, _ = basecall_helpers.stream_read(
+                chunks, chunk_starts, chunk_ends, model, n_can_state, stride,
+                alphabet, max_concurrent_chunks, fastq, beam=beam,
+                posterior=posterior, temperature=temperature, timers=timers)
+            call_seconds = sum(timer.seconds for timer in call_steps) - \
+                call_seconds
+            timers['decode'].add(1, time.time() - stream_start - call_seconds)
+            nbase += len(basecall)
+            continue
+        batcher.add_read(i, chunks, (chunk_starts, chunk_ends))
+        nbase += call_batches()
+    nbase += call_batches(flush=True)
+    if len(called) > 0:
+        with timers['decode'].time(len(called)):
+            calls = basecall_helpers.beam_decode_reads(
+                called, stride, alphabet, beam)
+        nbase += sum(len(basecall) for basecall, _ in calls)
+
+    return {'timers': timers, 'start': start, 'end': time.time(),
+            'nread': nread, 'nsample': nsample, 'nbase': nbase,
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def run_setting(reads, model, device, chunk_size, overlap,
+                max_concurrent_chunks, jobs, alphabet, call_params,
+                torch_threads, reads_per_task, execution_mode='processes'):
+    """ Call reads with a pool of new workers and collate timings
+
+    Args:
+        reads (list of tuple): reads to call, see :func:`load_signal`.
+        model (str): filename of model.
+        device (:class:`torch.device`): device to call reads on.
+        chunk_size (int): chunk size, measured in blocks.
+        overlap (int): overlap between chunks, measured in blocks.
+        max_concurrent_chunks (int): max number of chunks to call at once.
+        jobs (int): number of worker processes, or threads.
+        alphabet (str): Alphabet (e.g. 'ACGT').
+        call_params (dict): keyword arguments for calling reads, see
+            :func:`benchmark_reads`.
+        torch_threads (int or None): threads torch uses in each worker.  In
+            threads mode, None divides the CPUs available between threads.
+        reads_per_task (int): number of reads sent to a worker at once.
+        execution_mode (str): 'processes' to call reads in worker
+            processes, or 'threads' to call them in threads sharing a model
+            loaded in this process.
+
+    Returns:
+        :class:`OrderedDict`: settings and results of the run.  Wall time is
+            measured from the start of the first task to the end of the last,
+            so excludes starting workers and loading the model.  Stage times
+            are summed over workers and peak memory is the largest of any
+            worker; workers are forked, so memory shared with the parent
+            process is included.
+    """
+    initargs = [device, model, chunk_size, overlap, max_concurrent_chunks,
+                alphabet, call_params, torch_threads]
+    reads = iter(reads)
+    tasks = iter(lambda: list(islice(reads, reads_per_task)), [])
+    timers = {stage: StageTimer(unit) for stage, unit in STAGES.items()}
+    start, end = float('inf'), float('-inf')
+    nread, nsample, nbase, peak_rss = 0, 0, 0, 0
+    if execution_mode == 'threads':
+        #  Threads share the model, initialised once in this process
+        if torch_threads is None:
+            initargs[-1] = basecall_helpers.threads_per_worker(jobs)
+        worker_init(*initargs)
+        pool = ThreadPool(jobs)
+    else:
+        pool = multiprocessing.Pool(jobs, initializer=worker_init,
+                                    initargs=initargs)
+    with pool:
+        for res in pool.imap_unordered(worker, tasks):
+            for stage, timer in res['timers'].items():
+                timers[stage].update(timer)
+            start = min(start, res['start'])
+            end = max(end, res['end'])
+            nread += res['nread']
+            nsample += res['nsample']
+            nbase += res['nbase']
+            peak_rss = max(peak_rss, res['peak_rss'])
+    wall = max(end - start, 0.0)
+
+    return OrderedDict([
+        ('chunk_size', chunk_size),
+        ('overlap', overlap),
+        ('max_concurrent_chunks', max_concurrent_chunks),
+        ('jobs', jobs),
+        ('reads', nread),
+        ('samples', nsample),
+        ('bases', nbase),
+        ('wall_seconds', wall),
+        ('samples_per_second', nsample / wall if wall > 0 else 0.0),
+        ('bases_per_second', nbase / wall if wall > 0 else 0.0),
+        ('peak_rss_mb', peak_rss / 1024.0),
+        ('stages', OrderedDict(
+            (stage, OrderedDict([('unit', timer.unit),
+                                 ('items', timer.nitem),
+                                 ('seconds', timer.seconds)]))
+            for stage, timer in timers.items()))])
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    device = torch.device(args.device)
+    if args.fastq and args.beam is not None:
+        parser.error('--fastq is not supported with --beam decoding')
+    if args.stream_long_reads and args.beam is not None and \
+            not args.beam_by_chunk:
+        parser.error('--stream_long_reads requires --beam_by_chunk with ' +
+                     '--beam')
+
+    if args.input_folder is not None:
+        reads = list(fast5utils.iterate_fast5_reads(
+            args.input_folder, limit=args.limit,
+            strand_list=args.input_strand_list, recursive=args.recursive))
+        source = args.input_folder
+    else:
+        rng = np.random.RandomState(args.seed)
+        seeds = rng.randint(np.iinfo('i4').max, size=args.synthetic_reads)
+        reads = [(None, seed, args.synthetic_length) for seed in seeds]
+        source = 'synthetic'
+    sys.stderr.write('* Benchmarking with {} reads ({}).\n'.format(
+        len(reads), source))
+
+    settings = OrderedDict([
+        ('model', args.model), ('device', str(device)), ('reads', source),
+        ('nread', len(reads)), ('execution_mode', args.execution_mode),
+        ('torch_threads', args.torch_threads)])
+    call_params = OrderedDict([
+        ('fastq', args.fastq), ('beam', args.beam),
+        ('posterior', args.posterior), ('temperature', args.temperature),
+        ('beam_by_chunk', args.beam_by_chunk),
+        ('stream_long_reads', args.stream_long_reads)])
+    settings.update(call_params)
+    results = []
+    for chunk_size, overlap, max_concurrent_chunks, jobs in product(
+            args.chunk_size, args.overlap, args.max_concurrent_chunks,
+            args.jobs):
+        if overlap >= chunk_size:
+            sys.stderr.write(
+                '* Skipping overlap {} with chunk size {}.\n'.format(
+                    overlap, chunk_size))
+            continue
+        res = run_setting(
+            reads, args.model, device, chunk_size, overlap,
+            max_concurrent_chunks, jobs, args.alphabet, call_params,
+            args.torch_threads, args.reads_per_task, args.execution_mode)
+        sys.stderr.write(
+            ('* chunk_size {} overlap {} max_concurrent_chunks {} jobs {}: ' +
+             '{:.2f} ksample / s, {:.2f} kbase / s, peak RSS {:.0f} MB\n'
+             ).format(chunk_size, overlap, max_concurrent_chunks, jobs,
+                      res['samples_per_second'] / 1000.0,
+                      res['bases_per_second'] / 1000.0, res['peak_rss_mb']))
+        results.append(res)
+
+    if len(results) == 0:
+        sys.stderr.write('* No valid settings to benchmark.\n')
+        return
+    if args.output is None:
+        basecall_helpers.write_benchmark_report(
+            results, settings, sys.stdout, args.format)
+    else:
+        with open(args.output, 'w') as fh:
+            basecall_helpers.write_benchmark_report(
+                results, settings, fh, args.format)
+
+
+if __name__ == '__main__':
+    main()
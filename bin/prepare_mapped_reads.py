@@ -5,7 +5,7 @@ import numpy as np
 import os
 import sys
 
-from taiyaki import alphabet, bio, fast5utils, helpers
+from taiyaki import alphabet, bio, fast5utils
 from taiyaki.cmdargs import FileExists, Maybe
 from taiyaki.common_cmdargs import add_common_command_args
 from taiyaki.iterators import imap_mp
@@ -45,6 +45,11 @@ def get_parser():
         'significantly improve I/O performance and use less ' +
         'disk space. An entire batch must be loaded into memory in order ' +
         'access any read potentailly increasing RAM requirements.')
+    parser.add_argument(
+        '--columnar_format', action='store_true',
+        help='Output columnar mapped signal file format, overriding ' +
+        '--batch_format. Data are stored uncompressed, as memory mapped ' +
+        'columns, so any read can be accessed without reading any other.')
 
     parser.add_argument(
         'input_per_read_params', action=FileExists,
@@ -105,7 +110,8 @@ def main():
     kwargs = {}
     kwargs['per_read_params_dict'] = get_per_read_params_dict_from_tsv(
         args.input_per_read_params)
-    kwargs['model'] = helpers.load_model(args.model)
+    #  Model is loaded by each worker, rather than sent with every job
+    kwargs['model'] = args.model
     kwargs['alphabet_info'] = alphabet_info
     kwargs['max_read_length'] = args.max_read_length
     kwargs['localpen'] = args.localpen
@@ -134,7 +140,8 @@ def main():
     # results is an iterable of dicts
     # each dict is a set of return values from a single read
     generate_output_from_results(
-        results, args.output, alphabet_info, args.batch_format)
+        results, args.output, alphabet_info,
+        batch_format=args.batch_format, columnar_format=args.columnar_format)
 
 
 if __name__ == '__main__':
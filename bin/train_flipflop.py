@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 from collections import defaultdict, namedtuple
-from itertools import islice
+import inspect
 import math
 import numpy as np
 import os
@@ -11,10 +11,10 @@ import torch
 
 from taiyaki import (
     chunk_selection, ctc, flipflopfings, helpers, layers,
-    mapped_signal_files, maths, signal_mapping)
+    mapped_signal_files, maths, pruning, signal_mapping)
 from taiyaki.constants import (
     DOTROWLENGTH, MODEL_LOG_FILENAME, BATCH_LOG_FILENAME, VAL_LOG_FILENAME)
-from taiyaki.helpers import get_model_device, guess_model_stride
+from taiyaki.helpers import get_model_device, get_model_stride
 from _bin_argparse import get_train_flipflop_parser
 
 
@@ -47,7 +47,9 @@ OPTIM_INFO = namedtuple('OPTIM_INFO', (
 TRAIN_PARAMS = namedtuple('TRAIN_PARAMS', (
     'niteration', 'sharpen', 'chunk_len_min', 'chunk_len_max',
     'min_sub_batch_size', 'sub_batches', 'save_every',
-    'outdir', 'full_filter_status'))
+    'outdir', 'full_filter_status', 'prune_sparsity', 'prune_method',
+    'prune_niter', 'prefetch_workers', 'prefetch_depth', 'chunk_index',
+    'chunk_len_buckets', 'chunk_len_bucket_weights'))
 
 BATCH_FIELDS = [
     'iter', 'loss', 'gradientmax', 'gradientcap', 'learning_rate',
@@ -80,8 +82,13 @@ def parse_network_metadata(network):
 def prepare_random_batches(
         read_data, batch_chunk_len, sub_batch_size, target_sub_batches,
         alphabet_info, filter_params, net_info, log,
-        select_strands_randomly=True, first_strand_index=0, pin=True):
+        select_strands_randomly=True, first_strand_index=0, pin=True,
+        chunk_indexes=None):
     total_sub_batches = 0
+    chunk_index = None
+    if chunk_indexes is not None and select_strands_randomly:
+        chunk_index = get_chunk_index(
+            chunk_indexes, read_data, batch_chunk_len, filter_params, log)
     if net_info.metadata.reverse:
         revop = np.flip
     else:
@@ -94,7 +101,7 @@ def prepare_random_batches(
             read_data, sub_batch_size, batch_chunk_len, filter_params,
             standardize=net_info.metadata.standardize,
             select_strands_randomly=select_strands_randomly,
-            first_strand_index=first_strand_index)
+            first_strand_index=first_strand_index, chunk_index=chunk_index)
         first_strand_index += sum(batch_rejections.values())
         if len(chunk_batch) < sub_batch_size:
             log.write(('* Warning: only {} chunks passed filters ' +
@@ -146,6 +153,246 @@ def prepare_random_batches(
         yield indata, seqs, seqlens, mod_cats, sub_batch_size, batch_rejections
 
 
+def get_chunk_index(chunk_indexes, read_data, chunk_len, filter_params, log):
+    """ Index of chunks of a given length passing filters, built when first
+    required
+
+    Args:
+        chunk_indexes (dict): indexes already built, by length of chunk
+        read_data, filter_params, log: as for
+            :func:`prepare_random_batches`.
+        chunk_len (int): length of chunks
+
+    Returns:
+        :class:`chunk_selection.ChunkIndex`: index for chunk length
+    """
+    if chunk_len not in chunk_indexes:
+        chunk_indexes[chunk_len] = chunk_index = chunk_selection.ChunkIndex(
+            read_data, chunk_len, filter_params)
+        log.write(('* Indexed {} chunks of length {} passing filters ' +
+                   '({:.1%} of sampled chunks would pass)\n').format(
+                       chunk_index.nchunks, chunk_len,
+                       chunk_index.pass_fraction))
+    return chunk_indexes[chunk_len]
+
+
+def get_sub_batch_size(train_params, batch_chunk_len):
+    """ Number of chunks in a sub-batch for chunks of a given length """
+    # We choose the size of a sub-batch so that the size of the data in
+    # the sub-batch is about the same as args.min_sub_batch_size chunks of
+    # length args.chunk_len_max
+    return int(
+        train_params.min_sub_batch_size * train_params.chunk_len_max /
+        batch_chunk_len + 0.5)
+
+
+def get_batch_buckets(train_params, net_info):
+    """ Fixed lengths of chunk, and corresponding sub-batch sizes, for
+    training with `train_params.chunk_len_buckets`
+
+    Lengths are evenly spaced between `train_params.chunk_len_min` and
+    `train_params.chunk_len_max`, as multiples of the stride.  Unless
+    `train_params.chunk_len_bucket_weights` are given, each length is chosen
+    with the probability that the random chunk length chosen without buckets
+    is closest to it, so the distribution of chunks seen in training is
+    close to that without buckets.
+
+    Returns:
+        tuple of list and np array, or None: length of chunks and number of
+            chunks in sub-batch for each bucket, and probability of choosing
+            each bucket.  None if training without buckets.
+    """
+    if train_params.chunk_len_buckets is None:
+        return None
+    stride = net_info.stride
+    lengths = np.unique(np.linspace(
+        train_params.chunk_len_min, train_params.chunk_len_max,
+        train_params.chunk_len_buckets).astype(int) // stride * stride)
+
+    if train_params.chunk_len_bucket_weights is None:
+        random_lengths = np.arange(
+            train_params.chunk_len_min,
+            train_params.chunk_len_max + 1) // stride * stride
+        closest = np.argmin(np.abs(
+            random_lengths[:, None] - lengths[None, :]), axis=1)
+        weights = np.bincount(closest, minlength=len(lengths))
+    else:
+        weights = np.array(train_params.chunk_len_bucket_weights)
+        if len(weights) != len(lengths):
+            raise ValueError((
+                '{} weights given for {} chunk length buckets ' +
+                '({})').format(len(weights), len(lengths),
+                               ' '.join(map(str, lengths))))
+
+    buckets = [(int(batch_chunk_len),
+                get_sub_batch_size(train_params, batch_chunk_len))
+               for batch_chunk_len in lengths]
+    return buckets, weights / np.sum(weights)
+
+
+def choose_batch_params(train_params, net_info, batch_buckets=None):
+    """ Choose random chunk length, and corresponding sub-batch size, for an
+    iteration of training
+
+    Args:
+        train_params, net_info: parameters for training and network.
+        batch_buckets (tuple): buckets to choose from, as returned by
+            :func:`get_batch_buckets`, or None to choose any length of chunk.
+
+    Returns:
+        tuple of int: length of chunks and number of chunks in sub-batch
+    """
+    if batch_buckets is not None:
+        buckets, probabilities = batch_buckets
+        return buckets[np.random.choice(len(buckets), p=probabilities)]
+    # Chunk length is chosen randomly in the range given but forced to
+    # be a multiple of the stride
+    batch_chunk_len = (
+        np.random.randint(train_params.chunk_len_min,
+                          train_params.chunk_len_max + 1) //
+        net_info.stride) * net_info.stride
+    return batch_chunk_len, get_sub_batch_size(train_params, batch_chunk_len)
+
+
+class MessageList(list):
+    """ Collect messages written by a worker, to be logged later """
+
+    def write(self, message):
+        self.append(message)
+
+
+class PreparedBatches(torch.utils.data.Dataset):
+    """ Sub-batches for each iteration of training, prepared by the workers
+    of a :class:`torch.utils.data.DataLoader`
+
+    The random number generator is seeded from `seed` and the iteration
+    before the sub-batches for an iteration are prepared, so they do not
+    depend on the number of workers or on which worker prepares them.
+
+    Args:
+        batch_params (list of tuple): length of chunks and sub-batch size for
+            each iteration, as returned by :func:`choose_batch_params`.
+        seed (int): seed for sampling chunks.
+        read_data, sub_batches, alphabet_info, filter_params, net_info,
+            chunk_indexes: as for :func:`prepare_random_batches`.  Only the
+            metadata of `net_info` is used.  Each worker builds its own
+            copy of any index of chunks not already built.
+    """
+
+    def __init__(self, batch_params, seed, read_data, sub_batches,
+                 alphabet_info, filter_params, net_info, chunk_indexes=None):
+        self.batch_params = batch_params
+        self.seed = seed
+        self.read_data = read_data
+        self.sub_batches = sub_batches
+        self.alphabet_info = alphabet_info
+        self.filter_params = filter_params
+        self.net_info = NETWORK_INFO(None, None, net_info.metadata,
+                                     net_info.stride)
+        self.chunk_indexes = chunk_indexes
+
+    def __len__(self):
+        return len(self.batch_params)
+
+    def __getitem__(self, i):
+        """ Sub-batches for iteration `i`
+
+        Returns:
+            tuple of list and list: sub-batches, as yielded by
+                :func:`prepare_random_batches`, and messages to log.
+        """
+        np.random.seed([self.seed, i])
+        batch_chunk_len, sub_batch_size = self.batch_params[i]
+        messages = MessageList()
+        batches = prepare_random_batches(
+            self.read_data, batch_chunk_len, sub_batch_size,
+            self.sub_batches, self.alphabet_info, self.filter_params,
+            self.net_info, messages, pin=False,
+            chunk_indexes=self.chunk_indexes)
+        # counts of rejections are a defaultdict, which cannot be pickled
+        return [batch[:-1] + (dict(batch[-1]),) for batch in batches], \
+            messages
+
+
+def _no_collate(batch):
+    return batch
+
+
+def iterate_training_batches(
+        train_params, net_info, read_data, alphabet_info, filter_params,
+        log):
+    """ Sub-batches for each iteration of training
+
+    With `train_params.prefetch_workers`, sub-batches are prepared by worker
+    processes, each preparing up to `train_params.prefetch_depth` iterations
+    ahead of training, and returned in shared memory.  Otherwise each
+    iteration is prepared by the training process when required.
+
+    With `train_params.chunk_index`, which requires
+    `train_params.chunk_len_buckets`, chunks are sampled from an index of the
+    chunks of each bucket's length that pass filters, built before training,
+    rather than by sampling and rejecting chunks.
+
+    With `train_params.chunk_len_buckets`, each iteration uses one of a fixed
+    set of chunk lengths and sub-batch sizes, from :func:`get_batch_buckets`,
+    so the shapes of batches repeat.
+
+    Yields:
+        tuple of int and iterable: length of chunks and iterable of
+            sub-batches, as yielded by :func:`prepare_random_batches`, for
+            each iteration.
+    """
+    batch_buckets = get_batch_buckets(train_params, net_info)
+    chunk_indexes = {} if train_params.chunk_index else None
+    if batch_buckets is not None:
+        for (batch_chunk_len, sub_batch_size), probability in zip(
+                *batch_buckets):
+            log.write(('* Chunk length bucket {} with sub-batches of {} ' +
+                       'chunks, chosen with probability {:.3f}\n').format(
+                           batch_chunk_len, sub_batch_size, probability))
+            if chunk_indexes is not None:
+                #  Build before starting any workers, which share indexes
+                get_chunk_index(chunk_indexes, read_data, batch_chunk_len,
+                                filter_params, log)
+
+    if train_params.prefetch_workers == 0:
+        for _ in range(train_params.niteration):
+            batch_chunk_len, sub_batch_size = choose_batch_params(
+                train_params, net_info, batch_buckets)
+            yield batch_chunk_len, prepare_random_batches(
+                read_data, batch_chunk_len, sub_batch_size,
+                train_params.sub_batches, alphabet_info, filter_params,
+                net_info, log, chunk_indexes=chunk_indexes)
+        return
+
+    batch_params = [choose_batch_params(train_params, net_info, batch_buckets)
+                    for _ in range(train_params.niteration)]
+    seed = np.random.randint(np.iinfo(np.int32).max)
+    dataset = PreparedBatches(
+        batch_params, seed, read_data, train_params.sub_batches,
+        alphabet_info, filter_params, net_info, chunk_indexes)
+    #  prefetch_factor and generator are only accepted from torch 1.7
+    loader_kwargs = {}
+    loader_params = inspect.signature(torch.utils.data.DataLoader).parameters
+    if 'prefetch_factor' in loader_params:
+        loader_kwargs['prefetch_factor'] = train_params.prefetch_depth
+    elif train_params.prefetch_depth != 2:
+        log.write(('* Warning: --prefetch_depth requires torch 1.7 or ' +
+                   'later, torch {} prepares 2 iterations ahead in each ' +
+                   'worker.\n').format(torch.__version__))
+    if 'generator' in loader_params:
+        loader_kwargs['generator'] = torch.Generator().manual_seed(seed)
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=None, shuffle=False,
+        num_workers=train_params.prefetch_workers, collate_fn=_no_collate,
+        pin_memory=torch.cuda.is_available(), **loader_kwargs)
+    for (batch_chunk_len, _), (batches, messages) in zip(
+            batch_params, loader):
+        for message in messages:
+            log.write(message)
+        yield batch_chunk_len, batches
+
+
 def calculate_loss(
         net_info, batch_gen, sharpen, mod_cat_weights=None, mod_factor=None,
         calc_grads=False):
@@ -251,6 +498,12 @@ def parse_init_args(args):
         if args.chunk_len_min > args.chunk_len_max:
             # Illegal chunk length parameters
             raise ValueError('--chunk_len_min greater than --chunk_len_max')
+        if args.chunk_len_bucket_weights is not None and \
+           len(args.chunk_len_bucket_weights) != args.chunk_len_buckets:
+            raise ValueError('--chunk_len_bucket_weights requires a weight ' +
+                             'for each of --chunk_len_buckets')
+        if args.chunk_index and args.chunk_len_buckets is None:
+            raise ValueError('--chunk_index requires --chunk_len_buckets')
 
         logs.main.write('* Using random seed: {}\n'.format(seed))
     else:
@@ -280,6 +533,9 @@ def parse_init_args(args):
     if _MAKE_TORCH_DETERMINISTIC and device.type == 'cuda':
         torch.backends.cudnn.deterministic = True
         torch.backends.cudnn.benchmark = False
+    elif args.chunk_len_buckets is not None and device.type == 'cuda':
+        # Shapes of batches repeat, so autotuned algorithms are reused
+        torch.backends.cudnn.benchmark = True
 
     return RESOURCE_INFO(is_multi_gpu, is_lead_process, device), logs
 
@@ -299,16 +555,20 @@ def load_data(args, log, res_info):
     if args.limit is not None:
         log.write('* Limiting number of strands to {}\n'.format(args.limit))
 
-    with mapped_signal_files.MappedSignalReader(args.input) as msr:
-        alphabet_info = msr.get_alphabet_information()
-        # load list of signal_mapping.SignalMapping objects
-        read_data = list(islice(msr.reads(read_ids), args.limit))
+    # sequence of signal_mapping.SignalMapping objects
+    read_data = mapped_signal_files.MappedReadCollection(
+        args.input, read_ids, args.limit, args.read_cache_size)
+    alphabet_info = read_data.get_alphabet_information()
     log.write('* Using alphabet definition: {}\n'.format(str(alphabet_info)))
 
     if len(read_data) == 0:
         log.write('* No reads remaining for training, exiting.\n')
         exit(1)
-    log.write('* Loaded {} reads.\n'.format(len(read_data)))
+    if args.read_cache_size is None:
+        log.write('* Loaded {} reads.\n'.format(len(read_data)))
+    else:
+        log.write(('* Found {} reads, loading as used and caching at most ' +
+                   '{}.\n').format(len(read_data), args.read_cache_size))
 
     # mod cat inv freq weighting is currently disabled. Compute and set this
     # value to enable mod cat weighting
@@ -406,7 +666,7 @@ def load_network(args, alphabet_info, res_info, log):
         net_clone = None
 
     log.write('* Estimating filter parameters from training data\n')
-    stride = guess_model_stride(network)
+    stride = get_model_stride(network)
     optimiser = torch.optim.AdamW(
         network.parameters(), lr=args.lr_max, betas=args.adam,
         weight_decay=args.weight_decay, eps=args.eps)
@@ -491,7 +751,7 @@ def extract_reporting_data(
         args, read_data, res_info, alphabet_info, filter_params, net_info,
         log):
     # Generate list of batches for standard loss reporting
-    all_read_ids = [read.read_id for read in read_data]
+    all_read_ids = read_data.read_ids
     if args.reporting_strand_list is not None:
         # get reporting read ids in from strand list
         reporting_read_ids = set(helpers.get_read_ids(
@@ -503,12 +763,11 @@ def extract_reporting_data(
         reporting_read_ids = set(np.random.choice(
             all_read_ids, size=num_report_reads, replace=False))
     # generate reporting reads list
-    report_read_data = [read for read in read_data
-                        if read.read_id in reporting_read_ids]
+    report_read_data = read_data.subset(reporting_read_ids)
     if not args.include_reporting_strands:
         # if holding strands out remove these reads from read_data
-        read_data = [read for read in read_data
-                     if read.read_id not in reporting_read_ids]
+        read_data = read_data.subset(
+            set(all_read_ids).difference(reporting_read_ids))
         log.write(('* Standard loss reporting from {} validation reads ' +
                    'held out of training. \n').format(len(report_read_data)))
     reporting_chunk_len = (args.chunk_len_min + args.chunk_len_max) // 2
@@ -529,10 +788,36 @@ def parse_train_params(args):
     train_params = TRAIN_PARAMS(
         args.niteration, args.sharpen, args.chunk_len_min, args.chunk_len_max,
         args.min_sub_batch_size, args.sub_batches, args.save_every,
-        args.outdir, args.full_filter_status)
+        args.outdir, args.full_filter_status, args.prune_sparsity,
+        args.prune_method, args.prune_niter, args.prefetch_workers,
+        args.prefetch_depth, args.chunk_index, args.chunk_len_buckets,
+        args.chunk_len_bucket_weights)
     return train_params
 
 
+def prune_network(net_info, train_params, curr_iter):
+    """ Prune network to sparsity reached at the given iteration
+
+    Sparsity increases linearly from zero to `train_params.prune_sparsity`
+    over `train_params.prune_niter` iterations.  Weights that are already
+    zero are pruned first, so weights stay pruned as sparsity increases.
+
+    Args:
+        net_info (:class:`NETWORK_INFO`): network to prune
+        train_params (:class:`TRAIN_PARAMS`): training parameters
+        curr_iter (int): number of iterations completed
+
+    Returns:
+        dict: masks for weights of network, see
+            :func:`taiyaki.pruning.prune_model`.
+    """
+    sparsity = train_params.prune_sparsity
+    if curr_iter < train_params.prune_niter:
+        sparsity *= curr_iter / train_params.prune_niter
+    return pruning.prune_model(net_info.net, sparsity,
+                               train_params.prune_method)
+
+
 def train_model(
         train_params, net_info, optim_info, res_info, read_data, alphabet_info,
         filter_params, mod_info, reporting_batch_list, logs):
@@ -543,9 +828,27 @@ def train_model(
     total_bases = total_samples = total_chunks = 0
     # To count the numbers of different sorts of chunk rejection
     rejection_dict = defaultdict(int)
+    if train_params.prune_sparsity is None:
+        masks = None
+    else:
+        logs.main.write((
+            '* Pruning to sparsity {} ({} pruning) over {} ' +
+            'iterations\n').format(
+                train_params.prune_sparsity, train_params.prune_method,
+                train_params.prune_niter))
+        masks = prune_network(net_info, train_params, 0)
     time_last = time.time()
     logs.main.write('* Training\n')
-    for curr_iter in range(train_params.niteration):
+    if train_params.prefetch_workers > 0:
+        logs.main.write(('* Preparing batches with {} workers, up to {} ' +
+                         'iterations ahead each\n').format(
+                             train_params.prefetch_workers,
+                             train_params.prefetch_depth))
+    training_batches = iterate_training_batches(
+        train_params, net_info, read_data, alphabet_info, filter_params,
+        logs.main)
+    for curr_iter, (batch_chunk_len, main_batch_gen) in enumerate(
+            training_batches):
         sharpen = float(train_params.sharpen.min + (
             train_params.sharpen.max - train_params.sharpen.min) *
             min(1.0, curr_iter / train_params.sharpen.niter))
@@ -553,23 +856,6 @@ def train_model(
             mod_info.mod_factor.final - mod_info.mod_factor.start) *
             min(1.0, curr_iter / mod_info.mod_factor.niter))
 
-        # Chunk length is chosen randomly in the range given but forced to
-        # be a multiple of the stride
-        batch_chunk_len = (
-            np.random.randint(train_params.chunk_len_min,
-                              train_params.chunk_len_max + 1) //
-            net_info.stride) * net_info.stride
-        # We choose the size of a sub-batch so that the size of the data in
-        # the sub-batch is about the same as args.min_sub_batch_size chunks of
-        # length args.chunk_len_max
-        sub_batch_size = int(
-            train_params.min_sub_batch_size * train_params.chunk_len_max /
-            batch_chunk_len + 0.5)
-        main_batch_gen = prepare_random_batches(
-            read_data, batch_chunk_len, sub_batch_size,
-            train_params.sub_batches, alphabet_info, filter_params, net_info,
-            logs.main)
-
         # take optimiser step
         optim_info.optimiser.zero_grad()
         chunk_count, fval, chunk_samples, chunk_bases, batch_rejections = \
@@ -578,6 +864,14 @@ def train_model(
                 mod_factor, calc_grads=True)
         grad_maxs = apply_clipping(net_info, grad_max_threshs)
         optim_info.optimiser.step()
+        if masks is not None:
+            # Keep pruned weights at zero, increasing sparsity periodically
+            if (curr_iter < train_params.prune_niter and
+                    ((curr_iter + 1) % DOTROWLENGTH == 0 or
+                     curr_iter + 1 == train_params.prune_niter)):
+                masks = prune_network(net_info, train_params, curr_iter + 1)
+            else:
+                pruning.apply_masks(net_info.net, masks)
         if optim_info.rolling_mads is not None:
             grad_max_threshs = optim_info.rolling_mads.update(grad_maxs)
         # record step information
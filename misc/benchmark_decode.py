@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Benchmark CPU implementations of flip-flop decoding
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from taiyaki import decode
+from taiyaki.cmdargs import Positive
+from taiyaki.flipflopfings import nstate_flipflop
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Compare native and torch implementations of flip-flop ' +
+        'decoding on random scores',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--nbase', default=4, type=Positive(int),
+        help='Number of bases in alphabet')
+    parser.add_argument(
+        '--nblock', default=5000, type=Positive(int),
+        help='Number of blocks (T) in each score matrix')
+    parser.add_argument(
+        '--nbatch', default=128, type=Positive(int),
+        help='Number of score matrices (N) in batch')
+    parser.add_argument(
+        '--repeats', default=3, type=Positive(int),
+        help='Number of times to repeat each timing, best time is reported')
+    parser.add_argument(
+        '--seed', default=None, type=Positive(int),
+        help='Set random number seed')
+    parser.add_argument(
+        '--threads', default=None, type=Positive(int),
+        help='Number of threads for torch. Default: torch default')
+    return parser
+
+
+def best_time(f, repeats):
+    """ Best of several timings of a function
+
+    Args:
+        f (Callable): function to time, taking no arguments
+        repeats (int): number of timings
+
+    Returns:
+        tuple of float and object: best time, in seconds, and result of last
+            call to `f`.
+    """
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        res = f()
+        times.append(time.perf_counter() - t0)
+    return min(times), res
+
+
+def main():
+    args = get_parser().parse_args()
+    if args.seed is not None:
+        np.random.seed(args.seed)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    nstate = nstate_flipflop(args.nbase)
+    scores = torch.tensor(np.random.normal(
+        size=(args.nblock, args.nbatch, nstate)).astype('f4'))
+    print('* Scores: T = {}  N = {}  S = {}'.format(*scores.shape))
+    print('{:10s} {:>10s} {:>10s} {:>8s}  {}'.format(
+        'decoder', 'torch (s)', 'native (s)', 'speedup', 'agreement'))
+
+    t_torch, (_, _, path_torch) = best_time(
+        lambda: decode.flipflop_viterbi(scores, _never_use_native=True),
+        args.repeats)
+    t_native, (_, _, path_native) = best_time(
+        lambda: decode.flipflop_viterbi(scores), args.repeats)
+    print('{:10s} {:10.3f} {:10.3f} {:8.2f}  {}'.format(
+        'viterbi', t_torch, t_native, t_torch / t_native,
+        'identical paths' if torch.equal(path_torch, path_native)
+        else 'PATHS DIFFER'))
+
+    t_torch, trans_torch = best_time(
+        lambda: decode.flipflop_make_trans(scores, _never_use_native=True),
+        args.repeats)
+    t_native, trans_native = best_time(
+        lambda: decode.flipflop_make_trans(scores), args.repeats)
+    print('{:10s} {:10.3f} {:10.3f} {:8.2f}  max abs diff {:.2e}'.format(
+        'posterior', t_torch, t_native, t_torch / t_native,
+        float((trans_torch - trans_native).abs().max())))
+
+
+if __name__ == '__main__':
+    main()
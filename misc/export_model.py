@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Export a model checkpoint as a frozen TorchScript module for inference.  The
+# exported model can be used in place of the checkpoint by basecall.py and
+# prepare_mapped_reads.py
+import argparse
+import timeit
+
+import torch
+
+from taiyaki.cmdargs import FileAbsent, FileExists, Positive
+from taiyaki.common_cmdargs import add_common_command_args
+from taiyaki.helpers import export_model, load_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Trace model into a frozen TorchScript module, with ' +
+        'its metadata, for inference',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    add_common_command_args(parser, ['alphabet', 'version'])
+
+    parser.add_argument(
+        '--chunk_len', default=4000, type=Positive(int),
+        help='Length of chunks, in samples, used to trace and compare models')
+    parser.add_argument(
+        '--test_chunks', default=32, type=Positive(int),
+        help='Number of random chunks used to compare speed and outputs')
+
+    parser.add_argument(
+        'model', action=FileExists,
+        help='Model checkpoint file to export')
+    parser.add_argument(
+        'output', action=FileAbsent,
+        help='Name for exported TorchScript model')
+
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+
+    model = load_model(args.model).eval()
+    #  Models with modified bases know their own alphabet
+    output_layer = model.sublayers[-1] if hasattr(model, 'sublayers') \
+        else model
+    model.metadata['alphabet'] = getattr(
+        output_layer, 'output_alphabet', '') or args.alphabet
+    exported = export_model(model, args.output, args.chunk_len)
+    print('* Exported model with metadata {}'.format(exported.metadata))
+
+    x = torch.randn(args.chunk_len, args.test_chunks, 1)
+    with torch.no_grad():
+        expected = model(x)
+        got = exported(x)
+        t_model = timeit.timeit(lambda: model(x), number=3) / 3
+        t_exported = timeit.timeit(lambda: exported(x), number=3) / 3
+    print('* Maximum difference in output {:.3g}'.format(
+        float((got - expected).abs().max())))
+    print('* Time in model {:.3f}s -> {:.3f}s ({:.2f}x faster)'.format(
+        t_model, t_exported, t_model / t_exported))
+
+
+if __name__ == '__main__':
+    main()
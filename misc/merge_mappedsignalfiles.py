@@ -41,6 +41,11 @@ def get_parser():
         'significantly improve I/O performance and use less ' +
         'disk space. An entire batch must be loaded into memory in order ' +
         'access any read potentailly increasing RAM requirements.')
+    parser.add_argument(
+        '--columnar_format', action='store_true',
+        help='Output columnar mapped signal file format, overriding ' +
+        '--batch_format. Data are stored uncompressed, as memory mapped ' +
+        'columns, so any read can be accessed without reading any other.')
 
     return parser
 
@@ -223,7 +228,8 @@ def main():
     reads_written = set()
     sys.stderr.write("Writing reads to {}\n".format(args.output))
     with MappedSignalWriter(
-            args.output, merge_alphabet_info, args.batch_format) as msw:
+            args.output, merge_alphabet_info, args.batch_format,
+            args.columnar_format) as msw:
         for input_fn, input_limit in zip(input_fns, input_limits):
             with MappedSignalReader(
                     input_fn, load_in_mem=args.load_in_mem) as msr:
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# Prune a model and convert it for sparse inference on the CPU, reporting
+# changes in sparsity, speed and accuracy on chunks from a mapped signal file
+import argparse
+import copy
+import sys
+
+import numpy as np
+import torch
+
+from taiyaki import mapped_signal_files, pruning
+from taiyaki.cmdargs import (
+    Bounded, FileAbsent, FileExists, Maybe, NonNegative, Positive)
+from taiyaki.common_cmdargs import add_common_command_args
+from taiyaki.helpers import load_model
+from taiyaki.quantization import calibrate
+
+from quantize_model import batches, evaluate, sample_chunks
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Prune model and store its weights in a block sparse ' +
+        'format for inference on the CPU',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    add_common_command_args(parser, ['version'])
+
+    parser.add_argument(
+        '--batch_size', default=32, type=Positive(int),
+        help='Number of chunks to run through model at once')
+    parser.add_argument(
+        '--calibration_chunks', default=128, type=NonNegative(int),
+        help='Number of chunks used to calibrate model. Zero for no ' +
+        'calibration, when the output of the model depends on batch')
+    parser.add_argument(
+        '--chunk_len', default=4000, type=Positive(int),
+        help='Length of chunks, in samples')
+    parser.add_argument(
+        '--method', default='block', choices=pruning.PRUNING_METHODS,
+        help='Select weights to prune individually by magnitude, in blocks ' +
+        'or as whole columns')
+    parser.add_argument(
+        '--seed', default=None, type=Positive(int),
+        help='Set random number seed')
+    parser.add_argument(
+        '--sparsity', default=None,
+        type=Maybe(Bounded(float, lower=0.0, upper=1.0)),
+        help='Fraction of weights to prune. Default: do not prune, use ' +
+        'model pruned during training (train_flipflop.py --prune_sparsity)')
+    parser.add_argument(
+        '--test_chunks', default=128, type=Positive(int),
+        help='Number of chunks used to compare speed and accuracy')
+    parser.add_argument(
+        '--threads', default=None, type=Positive(int),
+        help='Number of threads for torch. Default: torch default')
+
+    parser.add_argument(
+        'model', action=FileExists,
+        help='Model checkpoint file to convert')
+    parser.add_argument(
+        'input', action=FileExists,
+        help='Mapped signal file containing reads for calibration and testing')
+    parser.add_argument(
+        'output', action=FileAbsent,
+        help='Name for converted model checkpoint')
+
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    if args.seed is not None:
+        np.random.seed(args.seed)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = load_model(args.model).eval()
+    model_in_rev = model.metadata.get('reverse', False)
+    model_standardize = model.metadata.get('standardize', True)
+
+    with mapped_signal_files.MappedSignalReader(args.input) as msr:
+        alphabet_info = msr.get_alphabet_information()
+        read_ids = msr.get_read_ids()
+        np.random.shuffle(read_ids)
+        read_data = list(msr.reads(read_ids))
+    #  Calibrate and test on different reads, if possible
+    if len(read_data) > 1 and args.calibration_chunks > 0:
+        nsplit = len(read_data) // 2
+        calibration_reads = read_data[:nsplit]
+        test_reads = read_data[nsplit:]
+    else:
+        sys.stderr.write('* WARNING: calibrating and testing on same reads\n')
+        calibration_reads = test_reads = read_data
+
+    pruned_model = model
+    if args.sparsity is not None:
+        pruned_model = copy.deepcopy(model)
+        pruning.prune_model(pruned_model, args.sparsity, args.method)
+        print('* Pruned model to sparsity {} ({} pruning)'.format(
+            args.sparsity, args.method))
+    for name, sparsity in pruning.sparsity_report(pruned_model).items():
+        print('* {:<50s} sparsity {:.3f}'.format(name, sparsity))
+
+    sparse_model, nconverted = pruning.convert_to_sparse(pruned_model)
+    print('* Converted {} layers'.format(nconverted))
+    if nconverted == 0:
+        sys.stderr.write('* WARNING: model has no layers with a sparse ' +
+                         'version\n')
+    for name, layer in sparse_model.named_modules():
+        if hasattr(layer, 'density'):
+            print('* {:<50s} fraction of blocks stored {:.3f}'.format(
+                name, layer.density()))
+    if args.calibration_chunks > 0:
+        current, _ = sample_chunks(
+            calibration_reads, args.calibration_chunks, args.chunk_len,
+            model_standardize, model_in_rev)
+        ncalibrated = calibrate(sparse_model,
+                                batches(current, args.batch_size))
+        print('* Calibrated {} layers on {} chunks'.format(
+            ncalibrated, current.shape[1]))
+    torch.save(sparse_model, args.output)
+
+    current, sequences = sample_chunks(
+        test_reads, args.test_chunks, args.chunk_len, model_standardize,
+        model_in_rev)
+    if len(sequences) == 0:
+        sys.stderr.write('* No chunks of length {} for testing\n'.format(
+            args.chunk_len))
+        sys.exit(1)
+    t_dense, acc_dense, _ = evaluate(
+        model, current, sequences, alphabet_info, args.batch_size)
+    t_sparse, acc_sparse, _ = evaluate(
+        sparse_model, current, sequences, alphabet_info, args.batch_size)
+    print('* Tested on {} chunks of {} samples'.format(
+        len(sequences), args.chunk_len))
+    print('* Time in model {:.3f}s -> {:.3f}s ({:.2f}x faster)'.format(
+        t_dense, t_sparse, t_dense / t_sparse))
+    print('* Mean accuracy {:.5f} -> {:.5f} ({:+.5f})'.format(
+        acc_dense.mean(), acc_sparse.mean(),
+        acc_sparse.mean() - acc_dense.mean()))
+
+
+if __name__ == '__main__':
+    main()
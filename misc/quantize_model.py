@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# Convert a model for int8 inference on the CPU, calibrating on chunks from
+# a mapped signal file and reporting changes in size, speed and accuracy
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from taiyaki import mapped_signal_files
+from taiyaki.cmdargs import FileAbsent, FileExists, NonNegative, Positive
+from taiyaki.common_cmdargs import add_common_command_args
+from taiyaki.decode import flipflop_viterbi
+from taiyaki.flipflopfings import nstate_flipflop, path_to_str
+from taiyaki.helpers import load_model
+from taiyaki.maths import edit_distance
+from taiyaki.quantization import calibrate, convert_to_int8
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Convert model to use int8 weights and arithmetic for ' +
+        'inference on the CPU',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    add_common_command_args(parser, ['version'])
+
+    parser.add_argument(
+        '--batch_size', default=32, type=Positive(int),
+        help='Number of chunks to run through model at once')
+    parser.add_argument(
+        '--calibration_chunks', default=128, type=NonNegative(int),
+        help='Number of chunks used to calibrate model. Zero for no ' +
+        'calibration, when the output of the model depends on batch')
+    parser.add_argument(
+        '--chunk_len', default=4000, type=Positive(int),
+        help='Length of chunks, in samples')
+    parser.add_argument(
+        '--seed', default=None, type=Positive(int),
+        help='Set random number seed')
+    parser.add_argument(
+        '--test_chunks', default=128, type=Positive(int),
+        help='Number of chunks used to compare speed and accuracy')
+    parser.add_argument(
+        '--threads', default=None, type=Positive(int),
+        help='Number of threads for torch. Default: torch default')
+
+    parser.add_argument(
+        'model', action=FileExists,
+        help='Model checkpoint file to convert')
+    parser.add_argument(
+        'input', action=FileExists,
+        help='Mapped signal file containing reads for calibration and testing')
+    parser.add_argument(
+        'output', action=FileAbsent,
+        help='Name for converted model checkpoint')
+
+    return parser
+
+
+def sample_chunks(read_data, nchunk, chunk_len, standardize=True,
+                  reverse=False):
+    """ Sample chunks from mapped reads
+
+    Args:
+        read_data (list of :class:`signal_mapping.SignalMapping`): reads to
+            sample chunks from.
+        nchunk (int): number of chunks to sample.
+        chunk_len (int): length of chunks in samples.
+        standardize (bool): standardize current of chunks.
+        reverse (bool): reverse current and sequence of chunks.
+
+    Returns:
+        tuple of :class:`ndarray` and list of :class:`ndarray`: current of
+            chunks, chunk_len x number of chunks x 1, and integer encoded
+            reference sequence of each chunk.  Fewer than `nchunk` chunks
+            are returned if reads are too short.
+    """
+    revop = np.flip if reverse else np.array
+    currents, sequences = [], []
+    for _ in range(10 * nchunk):
+        if len(currents) == nchunk:
+            break
+        read = read_data[np.random.randint(len(read_data))]
+        chunk = read.get_chunk_with_sample_length(
+            chunk_len, standardize=standardize)
+        if chunk.accepted:
+            currents.append(revop(chunk.current))
+            sequences.append(revop(chunk.sequence))
+    current = np.array(currents, dtype=np.float32).T[:, :, None]
+    return np.ascontiguousarray(current), sequences
+
+
+def batches(current, batch_size):
+    """ Split chunks into batches for model
+
+    Args:
+        current (:class:`ndarray`): current of chunks, time x chunks x 1
+        batch_size (int): maximum number of chunks in batch
+
+    Yields:
+        :torch:`Tensor`: batch of chunks
+    """
+    for i in range(0, current.shape[1], batch_size):
+        yield torch.tensor(current[:, i: i + batch_size])
+
+
+def evaluate(model, current, sequences, alphabet_info, batch_size):
+    """ Time model and measure accuracy of basecalls of chunks
+
+    Accuracy is one minus the edit distance between the basecall and the
+    reference, divided by the length of the reference.
+
+    Args:
+        model (:nn:`Module`): model to evaluate
+        current (:class:`ndarray`): current of chunks, time x chunks x 1
+        sequences (list of :class:`ndarray`): integer encoded reference
+            for each chunk.
+        alphabet_info (:class:`alphabet.AlphabetInfo`): alphabet of
+            references.
+        batch_size (int): maximum number of chunks in batch
+
+    Returns:
+        tuple of float, :class:`ndarray` and :torch:`Tensor`: time spent in
+            model, in seconds, accuracy of each chunk and output of model.
+    """
+    n_can_state = nstate_flipflop(alphabet_info.ncan_base)
+    collapse = np.frombuffer(alphabet_info.collapse_alphabet.encode(),
+                             dtype=np.uint8)
+    model_time = 0.0
+    outputs, accuracies = [], []
+    with torch.no_grad():
+        for x in batches(current, batch_size):
+            t0 = time.perf_counter()
+            out = model(x)
+            model_time += time.perf_counter() - t0
+            outputs.append(out)
+            _, _, paths = flipflop_viterbi(out[:, :, :n_can_state])
+            for path in paths.numpy().T:
+                basecall = path_to_str(path, alphabet=alphabet_info.can_bases)
+                reference = collapse[sequences[len(accuracies)]]
+                accuracies.append(
+                    1.0 - edit_distance(basecall, reference) / len(reference))
+    return model_time, np.array(accuracies), torch.cat(outputs, 1)
+
+
+def main():
+    args = get_parser().parse_args()
+    if args.seed is not None:
+        np.random.seed(args.seed)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = load_model(args.model).eval()
+    model_in_rev = model.metadata.get('reverse', False)
+    model_standardize = model.metadata.get('standardize', True)
+
+    with mapped_signal_files.MappedSignalReader(args.input) as msr:
+        alphabet_info = msr.get_alphabet_information()
+        read_ids = msr.get_read_ids()
+        np.random.shuffle(read_ids)
+        read_data = list(msr.reads(read_ids))
+    #  Calibrate and test on different reads, if possible
+    if len(read_data) > 1 and args.calibration_chunks > 0:
+        nsplit = len(read_data) // 2
+        calibration_reads = read_data[:nsplit]
+        test_reads = read_data[nsplit:]
+    else:
+        sys.stderr.write('* WARNING: calibrating and testing on same reads\n')
+        calibration_reads = test_reads = read_data
+    print('* Loaded {} reads for calibration and {} for testing'.format(
+        0 if args.calibration_chunks == 0 else len(calibration_reads),
+        len(test_reads)))
+
+    int8_model, nconverted = convert_to_int8(model)
+    print('* Converted {} layers'.format(nconverted))
+    if nconverted == 0:
+        sys.stderr.write('* WARNING: model has no layers with an int8 ' +
+                         'version\n')
+    if args.calibration_chunks > 0:
+        current, _ = sample_chunks(
+            calibration_reads, args.calibration_chunks, args.chunk_len,
+            model_standardize, model_in_rev)
+        ncalibrated = calibrate(int8_model,
+                                batches(current, args.batch_size))
+        print('* Calibrated {} layers on {} chunks'.format(
+            ncalibrated, current.shape[1]))
+    torch.save(int8_model, args.output)
+
+    size_in = os.path.getsize(args.model)
+    size_out = os.path.getsize(args.output)
+    print('* Checkpoint size {:.2f} MB -> {:.2f} MB ({:.1f}x smaller)'.format(
+        size_in / 1e6, size_out / 1e6, size_in / size_out))
+
+    current, sequences = sample_chunks(
+        test_reads, args.test_chunks, args.chunk_len, model_standardize,
+        model_in_rev)
+    if len(sequences) == 0:
+        sys.stderr.write('* No chunks of length {} for testing\n'.format(
+            args.chunk_len))
+        sys.exit(1)
+    t_float, acc_float, out_float = evaluate(
+        model, current, sequences, alphabet_info, args.batch_size)
+    t_int8, acc_int8, out_int8 = evaluate(
+        int8_model, current, sequences, alphabet_info, args.batch_size)
+    print('* Tested on {} chunks of {} samples'.format(
+        len(sequences), args.chunk_len))
+    print('* Time in model {:.3f}s -> {:.3f}s ({:.2f}x faster)'.format(
+        t_float, t_int8, t_float / t_int8))
+    print('* Mean accuracy {:.5f} -> {:.5f} ({:+.5f})'.format(
+        acc_float.mean(), acc_int8.mean(), acc_int8.mean() - acc_float.mean()))
+    print('* Maximum absolute difference in output {:.3e}'.format(
+        float((out_float - out_int8).abs().max())))
+
+
+if __name__ == '__main__':
+    main()
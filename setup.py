@@ -51,11 +51,21 @@ try:
             "taiyaki.decodeutil.decodeutil",
             [os.path.join("taiyaki/decodeutil", "decodeutil.pyx"),
              os.path.join("taiyaki/decodeutil", "c_flipflopfwdbwd.c"),
+             os.path.join("taiyaki/decodeutil", "c_flipflopviterbi.c"),
              os.path.join("taiyaki/decodeutil", "c_hashdecode.c"),
              os.path.join("taiyaki/decodeutil", "fasthash.c"),
              os.path.join("taiyaki/decodeutil", "yastring.c")],
             include_dirs=[np.get_include()],
-            extra_compile_args=["-O3", "-std=c11"])])
+            extra_compile_args=["-O3", "-fopenmp", "-std=c11"],
+            extra_link_args=["-fopenmp"]),
+        Extension(
+            "taiyaki.sparse.sparse",
+            [os.path.join("taiyaki/sparse", "sparse.pyx"),
+             os.path.join("taiyaki/sparse", "c_blocksparse.c")],
+            include_dirs=[np.get_include()],
+            extra_compile_args=["-O3", "-fopenmp", "-std=c11", "-mavx2",
+                                "-mfma"],
+            extra_link_args=["-fopenmp"])])
 except ImportError:
     extensions = []
     sys.stderr.write(
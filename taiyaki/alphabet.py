@@ -46,14 +46,15 @@ class AlphabetInfo(object):
         Output is in cat_mod model output ordering.
 
         Args:
-            read_data (list): :class:`signal_mapping.SignalMappings` objects
+            read_data (list): :class:`signal_mapping.SignalMappings` objects,
+                or other sequence of them supporting `len` and indexing
             N (int): Number of reads to sample for inverse frequency estimation
         """
         N = min(N, len(read_data))
         # sample N reads
         labels = np.concatenate([
-            rd['Reference'] for rd in np.random.choice(
-                read_data, N, replace=False)])
+            read_data[i]['Reference'] for i in np.random.choice(
+                len(read_data), N, replace=False)])
         lab_counts = np.bincount(labels)
         if lab_counts.shape[0] < self.nbase or np.any(lab_counts == 0):
             raise NotImplementedError
@@ -77,14 +78,15 @@ class AlphabetInfo(object):
         Output is in cat_mod model output ordering.
 
         Args:
-            read_data (list): :class:`signal_mapping.SignalMappings` objects
+            read_data (list): :class:`signal_mapping.SignalMappings` objects,
+                or other sequence of them supporting `len` and indexing
             N (int): Number of reads to sample for inverse frequency estimation
         """
         N = min(N, len(read_data))
         # sample N reads
         labels = np.concatenate([
-            rd.Reference for rd in np.random.choice(
-                read_data, N, replace=False)])
+            read_data[i].Reference for i in np.random.choice(
+                len(read_data), N, replace=False)])
         lab_counts = np.bincount(labels)
         if lab_counts.shape[0] < self.nbase or np.any(lab_counts == 0):
             raise NotImplementedError
@@ -1,13 +1,91 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
 import numpy as np
+import os
+import sys
 import torch
 
-from taiyaki.helpers import get_model_device, guess_model_stride
+from taiyaki import decodeutil, qscores
+from taiyaki.decode import flipflop_make_trans, flipflop_viterbi
+from taiyaki.flipflopfings import path_to_str
+from taiyaki.helpers import get_model_device, get_model_stride
+from taiyaki.maths import med_mad
 
 
 _DEFAULT_CHUNK_SIZE = 1000
 _DEFAULT_OVERLAP = 100
 
 
+def chunk_coordinates(nsample, chunk_size, overlap):
+    """ Coordinates of overlapping chunks covering a signal
+
+    Args:
+        nsample (int): Length of signal.
+        chunk_size (int): Length of chunks into which signal will be split.
+        overlap (int): Overlap between one chunk and the next.
+
+    Returns:
+        tuple of :class:`ndarray` and :class:`ndarray`: an array containing
+            the coordinate of the start position in the signal of each chunk,
+            and an array containing the coordinate of the end position in the
+            signal (exclusive).
+
+        Where `nsample` is less than `chunk_size`, then a single chunk of
+        length `nsample` is returned.
+    """
+    if nsample < chunk_size:
+        return np.array([0]), np.array([nsample])
+
+    chunk_ends = np.arange(chunk_size, nsample, chunk_size - overlap,
+                           dtype=int)
+    chunk_ends = np.concatenate([chunk_ends, [nsample]], 0)
+    chunk_starts = chunk_ends - chunk_size
+    return chunk_starts, chunk_ends
+
+
+def strided_chunks(signal, chunk_size, overlap):
+    """ Divide signal into overlapping chunks without copying
+
+    Chunks start at regular intervals, except the last chunk which ends at the
+    end of the signal, so all chunks but the last are a single strided view
+    onto the signal.  The last chunk is a view of its own unless it happens
+    to fall on the regular grid.
+
+    Args:
+        signal (:class:`ndarray`): Signal to split into chunks.  Copied only if
+            not a contiguous float32 array.
+        chunk_size (int): Length of chunks into which `signal` will be split.
+        overlap (int): Overlap between one chunk and the next.
+
+    Returns:
+        tuple of list and :class:`ndarray` and :class:`ndarray`: blocks of
+            consecutive chunks, each a view chunk_size x nchunks x 1 that
+            should not be written to, and arrays containing the start and end
+            coordinates of each chunk, as for :func:`chunk_read`.
+
+        Where the length of `signal` is less than `chunk_size`, then a single
+        chunk of length equal to the length of `signal` is returned.
+    """
+    signal = np.ascontiguousarray(signal, dtype='f4')
+    chunk_starts, chunk_ends = chunk_coordinates(len(signal), chunk_size,
+                                                 overlap)
+    nchunks = len(chunk_starts)
+    if nchunks == 1:
+        return [signal[:, None, None]], chunk_starts, chunk_ends
+
+    step = chunk_size - overlap
+    on_grid = chunk_starts[-1] == (nchunks - 1) * step
+    nregular = nchunks if on_grid else nchunks - 1
+    itemsize = signal.strides[0]
+    chunks = [np.lib.stride_tricks.as_strided(
+        signal, shape=(chunk_size, nregular, 1),
+        strides=(itemsize, step * itemsize, itemsize), writeable=False)]
+    if not on_grid:
+        chunks.append(signal[chunk_starts[-1]:, None, None])
+    return chunks, chunk_starts, chunk_ends
+
+
 def chunk_read(signal, chunk_size, overlap):
     """ Divide signal into overlapping chunks, trim if necessary
 
@@ -29,27 +107,86 @@ def chunk_read(signal, chunk_size, overlap):
     if len(signal) < chunk_size:
         return signal[:, None, None], np.array([0]), np.array([len(signal)])
 
-    chunk_ends = np.arange(chunk_size, len(
-        signal), chunk_size - overlap, dtype=int)
-    chunk_ends = np.concatenate([chunk_ends, [len(signal)]], 0)
-    chunk_starts = chunk_ends - chunk_size
-    nchunks = len(chunk_ends)
+    chunks, chunk_starts, chunk_ends = strided_chunks(signal, chunk_size,
+                                                      overlap)
+    # We will use chunk_starts and chunk_ends to stitch the basecalls together
+    return np.concatenate(chunks, 1), chunk_starts, chunk_ends
 
-    chunks = np.empty((chunk_size, nchunks, 1), dtype='f4')
-    for i, (start, end) in enumerate(zip(chunk_starts, chunk_ends)):
-        chunks[:, i, 0] = signal[start:end]
 
-    # We will use chunk_starts and chunk_ends to stitch the basecalls together
-    return chunks, chunk_starts, chunk_ends
+def iterate_chunk_windows(chunks, max_chunks):
+    """ Gather windows of consecutive chunks, at most `max_chunks` at a time
+
+    A window lying within a single block of chunks is a view onto it, so
+    only one window at most is copied into memory at once.
+
+    Args:
+        chunks (list of :class:`ndarray`): blocks of consecutive chunks,
+            as returned by :func:`strided_chunks`.
+        max_chunks (int): Maximum number of chunks in a window.
+
+    Yields:
+        tuple of int and :class:`ndarray`: index of the first chunk in the
+            window and the chunked signal for the window, chunk_size x nchunks
+            x 1.
+    """
+    offsets = np.cumsum([0] + [block.shape[1] for block in chunks])
+    for first in range(0, offsets[-1], max_chunks):
+        last = min(first + max_chunks, offsets[-1])
+        window = [block[:, max(first - lo, 0):last - lo]
+                  for block, lo, hi in zip(chunks, offsets[:-1], offsets[1:])
+                  if lo < last and hi > first]
+        yield first, (window[0] if len(window) == 1 else
+                      np.concatenate(window, 1))
+
+
+def stitch_regions(chunk_starts, chunk_ends, stride, path_stitching=False):
+    """ Region of the output of each chunk retained when stitching
+
+    Neighbouring chunks are divided at the middle of their overlap, so the
+    regions of consecutive chunks abut.  The region of each chunk is known from
+    the coordinates of the chunks alone, before any output has been
+    calculated.
+
+    Args:
+        chunk_starts (:class:`ndarray`): array containing the coordinate of the
+            start position of each chunk in the signal, at least two chunks.
+        chunk_ends (:class:`ndarray`): array containing the coordinate of the
+            end position of each chunk in the signal (exclusive).
+        stride (int): Stride of the model used to call chunks.
+        path_stitching (bool): Include last value in stitching, default False.
+
+    Returns:
+        tuple of :class:`ndarray` and :class:`ndarray`: start and end
+            (exclusive) of the region of each chunk, in blocks relative to the
+            start of the chunk.
+    """
+    chunk_starts = np.asarray(chunk_starts)
+    chunk_ends = np.asarray(chunk_ends)
+    assert len(chunk_starts) > 1, 'Stitching requires at least two chunks'
+    offset = 1 if path_stitching else 0
+
+    starts = np.empty(len(chunk_starts), dtype=int)
+    starts[0] = chunk_starts[0] // stride
+    starts[1:] = (chunk_ends[:-1] - chunk_starts[1:]) // (2 * stride) + offset
+
+    ends = np.empty(len(chunk_starts), dtype=int)
+    ends[0] = (chunk_ends[0] + chunk_starts[1]) // (2 * stride) + offset
+    ends[1:-1] = (chunk_ends[1:-1] + chunk_starts[2:] -
+                  2 * chunk_starts[1:-1]) // (2 * stride) + offset
+    ends[-1] = (chunk_ends[-1] - chunk_starts[-1]) // stride + offset
+    return starts, ends
 
 
 def stitch_chunks(out, chunk_starts, chunk_ends, stride, path_stitching=False):
     """ Stitch together neural network output or viterbi path from overlapping
     chunks
 
+    The region of every chunk is gathered by a single indexing operation on
+    the output, flattened over blocks and chunks.
+
     Args:
-        out (:class:`torch.Tensor`): Tensor containing output of network,
-            dimensions time x batch x features.
+        out (:class:`torch.Tensor` or :class:`ndarray`): Tensor containing
+            output of network, dimensions time x batch x features.
         chunk_starts (:class:`ndarray`): array containing the coordinate of the
             start position of each chunk in the signal.
         chunk_ends (:class:`ndarray`): array containing the coordinate of the
@@ -58,40 +195,283 @@ def stitch_chunks(out, chunk_starts, chunk_ends, stride, path_stitching=False):
         path_stitching (bool): Include last value in stitching, default False.
 
     Returns:
-        :class:`torch.Tensor`: A block x feature matrix containing the stitched
-            chunks.
+        :class:`torch.Tensor` or :class:`ndarray`: A block x feature matrix
+            containing the stitched chunks, of same type as `out`.
     """
     nchunks = out.shape[1]
 
     if nchunks == 1:
         return out[:, 0]
-    else:
-        # first chunk
-        start = chunk_starts[0] // stride
-        end = (chunk_ends[0] + chunk_starts[1]) // (2 * stride)
-        if path_stitching:
-            end += 1
-        stitched_out = [out[start:end, 0]]
-
-        # middle chunks
-        for i in range(1, nchunks - 1):
-            start = (chunk_ends[i - 1] - chunk_starts[i]) // (2 * stride)
-            end = (chunk_ends[i] + chunk_starts[i + 1] -
-                   2 * chunk_starts[i]) // (2 * stride)
-            if path_stitching:
-                start += 1
-                end += 1
-            stitched_out.append(out[start:end, i])
-
-        # last chunk
-        start = (chunk_ends[-2] - chunk_starts[-1]) // (2 * stride)
-        end = (chunk_ends[-1] - chunk_starts[-1]) // stride
-        if path_stitching:
-            start += 1
-            end += 1
-        stitched_out.append(out[start:end, -1])
-
-        return torch.cat(stitched_out, 0)
+
+    starts, ends = stitch_regions(chunk_starts, chunk_ends, stride,
+                                  path_stitching)
+    #  Regions are clipped to the output as slicing would
+    starts = np.clip(starts, 0, out.shape[0])
+    lengths = np.clip(ends, starts, out.shape[0]) - starts
+    #  Index of each element of the stitched output in the output flattened
+    #  over blocks and chunks, element j of the stitched output being from
+    #  block j + starts[i] - offset[i] of chunk i
+    offset = np.cumsum(lengths) - lengths
+    flat_idx = np.arange(lengths.sum()) * nchunks + np.repeat(
+        (starts - offset) * nchunks + np.arange(nchunks), lengths)
+    flat_out = out.reshape((-1,) + tuple(out.shape[2:]))
+    if isinstance(out, torch.Tensor):
+        return flat_out.index_select(0, torch.from_numpy(flat_idx).to(
+            out.device))
+    return flat_out.take(flat_idx, axis=0)
+
+
+class ChunkBatcher(object):
+    """ Pack the chunks of many reads into batches of a fixed size
+
+    Chunks are queued by length so that every batch can be stacked into a
+    single tensor: the full-length chunks of all reads longer than the chunk
+    size share batches, while reads shorter than the chunk size are batched
+    with other reads of exactly the same length.  Outputs for each batch are
+    handed back using :meth:`add_outputs` and a read is released, with its
+    outputs in chunk order, once all of its chunks have been seen.
+
+    Example:
+        batcher = ChunkBatcher(128)
+        for key, chunks in reads:
+            batcher.add_read(key, chunks)
+            for batch, index in batcher.batches():
+                out = model(torch.tensor(batch))
+                for key, data, (read_out,) in batcher.add_outputs(index, out):
+                    ...
+        # then repeat the inner loop with `batcher.batches(flush=True)`
+
+    Args:
+        batch_size (int): Maximum number of chunks in a batch.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        #  Chunk length -> list of (key, chunk index, chunk) awaiting a batch
+        self._queued = OrderedDict()
+        #  Key -> [data, number of chunks, list of outputs for each chunk]
+        self._reads = dict()
+
+    def __len__(self):
+        """ Number of reads for which outputs are outstanding """
+        return len(self._reads)
+
+    @property
+    def nqueued(self):
+        """ Number of chunks queued but not yet returned in a batch """
+        return sum(len(queue) for queue in self._queued.values())
+
+    def add_read(self, key, chunks, data=None):
+        """ Queue the chunks of a read for batching
+
+        Args:
+            key (hashable): Unique identifier for the read.
+            chunks (:class:`ndarray` or list): Chunked signal for the read,
+                dimensions chunk length x nchunks x features, as returned by
+                :func:`chunk_read`, or blocks of consecutive chunks as
+                returned by :func:`strided_chunks`.
+            data (object, optional): Arbitrary data returned with the outputs
+                of the read once complete.
+        """
+        assert key not in self._reads, 'Read {} already queued'.format(key)
+        if isinstance(chunks, np.ndarray):
+            chunks = [chunks]
+        nchunks = sum(block.shape[1] for block in chunks)
+        self._reads[key] = [data, nchunks, [None] * nchunks]
+        queue = self._queued.setdefault(chunks[0].shape[0], [])
+        i = 0
+        for block in chunks:
+            for j in range(block.shape[1]):
+                queue.append((key, i, block[:, j:j + 1]))
+                i += 1
+
+    def batches(self, flush=False):
+        """ Generate batches from queued chunks
+
+        Args:
+            flush (bool, optional): Return all queued chunks, even if there are
+                too few of a given length to fill a batch.
+
+        Yields:
+            tuple of :class:`ndarray` and list: Batch of chunks, dimensions
+                chunk length x batch size x features, and a list of (key,
+                chunk index) tuples identifying each chunk in the batch.  The
+                list should be passed back to :meth:`add_outputs`.
+        """
+        for chunk_len in list(self._queued.keys()):
+            queue = self._queued[chunk_len]
+            while len(queue) >= self.batch_size or (flush and len(queue) > 0):
+                batch = queue[:self.batch_size]
+                del queue[:self.batch_size]
+                chunks = np.concatenate([chunk for _, _, chunk in batch], 1)
+                yield chunks, [(key, i) for key, i, _ in batch]
+            if len(queue) == 0:
+                del self._queued[chunk_len]
+
+    def add_outputs(self, index, *outputs):
+        """ Return outputs for a batch of chunks
+
+        Args:
+            index (list): List of (key, chunk index) tuples for batch, as
+                yielded by :meth:`batches`.
+            *outputs: One or more :class:`torch.Tensor` containing outputs for
+                the batch, with chunks along the second dimension.
+
+        Returns:
+            list of tuples: (key, data, outputs) for each read for which all
+                chunks have now been seen.  `outputs` is a tuple containing,
+                for each of `outputs`, a tensor of the read's chunks in order.
+        """
+        completed = []
+        for j, (key, i) in enumerate(index):
+            read = self._reads[key]
+            read[2][i] = tuple(out[:, j:j + 1] for out in outputs)
+            read[1] -= 1
+            if read[1] == 0:
+                del self._reads[key]
+                read_outputs = tuple(torch.cat(chunk_out, 1)
+                                     for chunk_out in zip(*read[2]))
+                completed.append((key, read[0], read_outputs))
+        return completed
+
+
+def schedule_reads(reads, max_samples):
+    """ Group reads into tasks for workers, longest reads first
+
+    Reads are sorted by decreasing length and packed into tasks of at most
+    `max_samples` samples; a read longer than `max_samples` is a task on its
+    own.  Handing out the longest reads first means the last tasks of a run
+    are short, so workers finish at nearly the same time, and packing short
+    reads together saves the overhead of sending each to a worker.
+
+    Args:
+        reads (iterable of tuple(str, str, int)): filepath, read_id and
+            number of samples for each read, as yielded by
+            :func:`fast5utils.iterate_read_lengths`.
+        max_samples (int): Maximum number of samples in a task with more than
+            one read.
+
+    Returns:
+        list of list of tuple(str, str): tasks in the order they should be
+            dispatched, each a list of (filepath, read_id) tuples.
+    """
+    tasks, task, task_samples = [], [], 0
+    for filepath, read_id, nsample in sorted(
+            reads, key=lambda read: read[2], reverse=True):
+        if len(task) > 0 and task_samples + nsample > max_samples:
+            tasks.append(task)
+            task, task_samples = [], 0
+        task.append((filepath, read_id))
+        task_samples += nsample
+    if len(task) > 0:
+        tasks.append(task)
+    return tasks
+
+
+def idle_tail(completion_times, nworker):
+    """ Time at the end of a run for which some workers have no task
+
+    Once fewer tasks are outstanding than there are workers, at least one
+    worker is idle.  A run whose tasks are poorly balanced, e.g. with a long
+    read dispatched last, has a long idle tail.
+
+    Args:
+        completion_times (list of float): time at which each task completed,
+            in increasing order.
+        nworker (int): Number of workers.
+
+    Returns:
+        float: time from the completion of the task after which fewer than
+            `nworker` tasks were outstanding until the completion of the last
+            task.
+    """
+    if len(completion_times) == 0:
+        return 0.0
+    first_idle = max(0, len(completion_times) - nworker)
+    return completion_times[-1] - completion_times[first_idle]
+
+
+def write_benchmark_report(results, settings, filehandle, fmt='json'):
+    """ Write results of benchmarking basecalling, see benchmark_basecall.py
+
+    Args:
+        results (list of dict): results for each setting benchmarked, with
+            entry 'stages' mapping each stage timed to a dictionary of its
+            'unit', 'items' and 'seconds'.  All results must have the same
+            entries and stages.
+        settings (dict): description of benchmark, included in JSON report.
+        filehandle (file): file to write to.
+        fmt (str): 'json' or 'tsv'.  A TSV report has one row per setting
+            and a column of seconds for each stage.
+    """
+    if fmt == 'json':
+        json.dump(OrderedDict([('settings', settings),
+                               ('results', results)]), filehandle, indent=2)
+        filehandle.write('\n')
+        return
+
+    columns = [key for key in results[0] if key != 'stages']
+    stages = list(results[0]['stages'])
+    filehandle.write('\t'.join(
+        columns + ['{}_seconds'.format(stage) for stage in stages]) + '\n')
+    for res in results:
+        row = [res[key] for key in columns] + \
+            [res['stages'][stage]['seconds'] for stage in stages]
+        filehandle.write('\t'.join(
+            '{:.6g}'.format(x) if isinstance(x, float) else str(x)
+            for x in row) + '\n')
+
+
+def set_worker_threads(torch_threads=None, cpus=None):
+    """ Set the CPUs a worker process runs on and the number of threads torch
+    uses within each operation
+
+    Several workers each running as many torch threads as there are CPUs
+    oversubscribe the machine; pinning each worker to its own set of CPUs,
+    with one torch thread per CPU, avoids threads competing and migrating
+    between cores.
+
+    Args:
+        torch_threads (int, optional): Number of intra-op threads for torch.
+            Defaults to the number of `cpus` if given, otherwise torch's own
+            default is left unchanged.
+        cpus (list of int, optional): CPUs the process may run on.  Ignored
+            on platforms without :func:`os.sched_setaffinity`.
+
+    Returns:
+        int: number of intra-op threads torch uses.
+    """
+    if cpus is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        else:
+            sys.stderr.write('* Setting CPU affinity is not supported on '
+                             'this platform.\n')
+        if torch_threads is None:
+            torch_threads = len(cpus)
+    if torch_threads is not None:
+        torch.set_num_threads(torch_threads)
+    return torch.get_num_threads()
+
+
+def threads_per_worker(nworker, cpus=None):
+    """ Number of torch threads for each of several workers sharing CPUs
+
+    Args:
+        nworker (int): Number of workers.
+        cpus (list of int, optional): CPUs shared by the workers.  Defaults
+            to the CPUs the process may run on.
+
+    Returns:
+        int: number of threads, so workers together use no more threads
+            than CPUs, and at least one.
+    """
+    if cpus is None:
+        if hasattr(os, 'sched_getaffinity'):
+            cpus = os.sched_getaffinity(0)
+        else:
+            cpus = range(os.cpu_count() or 1)
+    return max(1, len(cpus) // nworker)
 
 
 def run_model(
@@ -133,22 +513,22 @@ def run_model(
         :class:`ndarray` and remains in host memory.
     """
     device = get_model_device(model)
-    stride = guess_model_stride(model)
+    stride = get_model_stride(model)
     chunk_size *= stride
     overlap *= stride
 
-    chunks, chunk_starts, chunk_ends = chunk_read(
+    chunks, chunk_starts, chunk_ends = strided_chunks(
         normed_signal, chunk_size, overlap)
+    if max_concur_chunks is None:
+        max_concur_chunks = len(chunk_starts)
 
-    chunks = torch.tensor(chunks)
     with torch.no_grad():
-        if max_concur_chunks is None:
-            out = model(chunks.to(device)).cpu()
-        else:
-            out = []
-            for some_chunks in torch.split(chunks, max_concur_chunks, 1):
-                out.append(model(some_chunks.to(device)).cpu())
-            out = torch.cat(out, 1)
+        out = []
+        for _, some_chunks in iterate_chunk_windows(chunks, max_concur_chunks):
+            some_chunks = torch.from_numpy(
+                np.require(some_chunks, requirements=['C', 'W']))
+            out.append(model(some_chunks.to(device)).cpu())
+        out = out[0] if len(out) == 1 else torch.cat(out, 1)
         stitched_chunks = stitch_chunks(
             out, chunk_starts, chunk_ends, stride)
     if return_numpy:
@@ -156,3 +536,542 @@ def run_model(
     if return_tensor_on_device:
         return stitched_chunks.to(device)
     return stitched_chunks
+
+
+def med_mad_norm(x, dtype='f4'):
+    """ Normalise a numpy array using median and MAD
+
+    Args:
+        x (:class:`ndarray`): 1D array containing values to be normalised.
+        dtype (str or :class:`dtype`): dtype of returned array.
+
+    Returns:
+        :class:`ndarray`:  Array of same shape as `x` and dtype `dtype`
+            contained normalised values.
+    """
+    med, mad = med_mad(x)
+    normed_x = (x - med) / mad
+    return normed_x.astype(dtype)
+
+
+def normalise_signal(signal, read_params, reverse=False):
+    """ Normalise signal of read, using per-read parameters if available
+
+    Args:
+        signal (:class:`ndarray`): 1D array containing raw signal.
+        read_params (dict str -> T): reads specific scaling parameters,
+            including 'shift' and 'scale'.  If None, the signal is normalised
+            using its median and MAD.
+        reverse (bool): Reverse signal before normalising.
+
+    Returns:
+        :class:`ndarray`: 1D array containing normalised signal.
+    """
+    if reverse:
+        signal = signal[::-1]
+
+    if read_params is None:
+        return med_mad_norm(signal)
+    return (signal - read_params['shift']) / read_params['scale']
+
+
+@contextmanager
+def _time_step(timers, step, nitem, device):
+    """ Time a step of :func:`call_chunks`, if a timer is given for it,
+    waiting for work queued on the device so it is included
+    """
+    if timers is None or step not in timers:
+        yield
+        return
+    with timers[step].time(nitem):
+        yield
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+
+
+def call_chunks(model, chunks, n_can_state, fastq=False, beam=None,
+                posterior=True, temperature=1.0, beam_by_chunk=False,
+                timers=None):
+    """ Apply network and decoding to a batch of chunks
+
+    Args:
+        model (:class:`nn.Module`): Taiyaki network.
+        chunks (:class:`ndarray`): Batch of chunks, chunk length x nchunks x 1.
+        n_can_state (int): number of canonical flip-flop transitions (40 for
+            ACGT).
+        fastq (bool): calculate error probabilities for q scores.
+        beam (None or NamedTuple): Use beam search decoding
+        posterior (bool): Decode using posterior probability of transitions
+        temperature (float): Multiplier for network output
+        beam_by_chunk (bool): With `beam`, decode each chunk using beam
+            search rather than returning scores for the whole read to be
+            decoded.
+        timers (dict, optional): :class:`iterators.StageTimer` for any of
+            the steps 'network', 'posterior', 'viterbi' (finding best path of
+            each chunk, including by beam search) and 'qscores', which are
+            timed with the number of chunks, waiting for the device to
+            finish.
+
+    Returns:
+        tuple of :class:`torch.Tensor`: When `beam` is set, and not
+            `beam_by_chunk`, a tuple containing the transition scores for each
+            chunk to be decoded after stitching.  Otherwise a tuple containing
+            the best path for each chunk followed, if `fastq` is True, by the
+            error probabilities of the path.
+    """
+    with torch.no_grad():
+        device = get_model_device(model)
+        nchunk = chunks.shape[1]
+        with _time_step(timers, 'network', nchunk, device):
+            chunks = torch.from_numpy(
+                np.require(chunks, requirements=['C', 'W'])).to(device)
+            trans = model(chunks)[:, :, :n_can_state] * temperature
+
+        if posterior:
+            with _time_step(timers, 'posterior', nchunk, device):
+                trans = (flipflop_make_trans(trans) + 1e-8).log()
+
+        if beam is not None and not beam_by_chunk:
+            return (trans,)
+
+        if beam is not None:
+            with _time_step(timers, 'viterbi', nchunk, device):
+                np_trans = trans.cpu().numpy()
+                best_paths = decodeutil.beamsearch_batch(
+                    [np_trans[:, i] for i in range(np_trans.shape[1])],
+                    beam_width=beam.width, guided=beam.guided,
+                    with_path=True)
+                chunk_best_paths = torch.tensor(
+                    np.stack([path for _, _, path in best_paths], 1),
+                    dtype=torch.long, device=device)
+            return (chunk_best_paths,)
+
+        with _time_step(timers, 'viterbi', nchunk, device):
+            _, _, chunk_best_paths = flipflop_viterbi(trans)
+        if fastq:
+            with _time_step(timers, 'qscores', nchunk, device):
+                chunk_errprobs = qscores.errprobs_from_trans(
+                    trans, chunk_best_paths)
+            return chunk_best_paths, chunk_errprobs
+        return (chunk_best_paths,)
+
+
+def decode_read(outputs, chunk_starts, chunk_ends, stride, alphabet,
+                fastq=False, qscore_scale=1.0, qscore_offset=0.0, beam=None,
+                path_stitching=False):
+    """ Stitch together outputs for chunks of read and form basecall
+
+    Args:
+        outputs (tuple of :class:`torch.Tensor`): Outputs for each chunk of
+            the read, as returned by :func:`call_chunks`.
+        chunk_starts (:class:`ndarray`): start coordinate of each chunk.
+        chunk_ends (:class:`ndarray`): end coordinate of each chunk.
+        stride (int): stride of basecalling network (measured in samples)
+        alphabet (str): Alphabet (e.g. 'ACGT').
+        fastq (bool): generate q scores if this is True.
+        qscore_scale (float): Scaling factor for Q score calibration.
+        qscore_offset (float): Offset for Q score calibration.
+        beam (None or NamedTuple): Use beam search decoding
+        path_stitching (bool): Stitch paths including their last state, as
+            required for paths found by beam search of each chunk, see
+            :func:`stitch_chunks`.
+
+    Returns:
+        tuple of str and str: strings containing the called bases and their
+            associated Phred-encoded quality scores.
+
+        When `fastq` is False, `None` is returned instead of a quality string.
+    """
+    if beam is not None:
+        return beam_decode_reads(
+            [(outputs, chunk_starts, chunk_ends)], stride, alphabet, beam)[0]
+
+    qstring = None
+    best_path = stitch_chunks(
+        outputs[0], chunk_starts, chunk_ends, stride,
+        path_stitching).cpu().numpy()
+    if fastq:
+        errprobs = stitch_chunks(
+            outputs[1], chunk_starts, chunk_ends, stride)
+        qstring = qscores.path_errprobs_to_qstring(errprobs, best_path,
+                                                   qscore_scale,
+                                                   qscore_offset)
+
+    # This makes our basecalls agree with Guppy's, and removes the
+    # problem that there is no entry transition for the first path
+    # element, so we don't know what the q score is.
+    basecall = path_to_str(best_path, alphabet=alphabet,
+                           include_first_source=False)
+
+    return basecall, qstring
+
+
+def beam_decode_reads(reads, stride, alphabet, beam):
+    """ Stitch together outputs for the chunks of several reads and form
+    their basecalls using beam search.  Reads are decoded in parallel.
+
+    Args:
+        reads (list of tuples): (outputs, chunk_starts, chunk_ends) for each
+            read, where the arguments are as for :func:`decode_read`.
+        stride (int): stride of basecalling network (measured in samples)
+        alphabet (str): Alphabet (e.g. 'ACGT').
+        beam (NamedTuple): Beam search parameters `width` and `guided`.
+
+    Returns:
+        list of tuples: (basecall, None) for each read, as returned by
+            :func:`decode_read`.
+    """
+    trans = [stitch_chunks(
+        outputs[0], chunk_starts, chunk_ends, stride).cpu().numpy()
+        for outputs, chunk_starts, chunk_ends in reads]
+    best_paths = decodeutil.beamsearch_batch(
+        trans, beam_width=beam.width, guided=beam.guided)
+    return [(path_to_str(best_path, alphabet=alphabet,
+                         include_first_source=False), None)
+            for best_path, _ in best_paths]
+
+
+def stream_read(chunks, chunk_starts, chunk_ends, model, n_can_state, stride,
+                alphabet, max_concurrent_chunks, fastq=False,
+                qscore_scale=1.0, qscore_offset=0.0, beam=None,
+                posterior=True, temperature=1.0, timers=None):
+    """ Basecall a read as a stream of windows of chunks
+
+    Chunks are gathered, called and decoded `max_concurrent_chunks` at a
+    time.
+    The region of each chunk kept after stitching is known in advance, so the
+    bases for each window are emitted as soon as it has been called and its
+    outputs are then freed.  The basecall is identical to that from stitching
+    the outputs for the whole read, see :func:`decode_read`.
+
+    Args:
+        chunks (list of :class:`ndarray`): chunked signal, as returned by
+            :func:`strided_chunks`.
+        chunk_starts (:class:`ndarray`): start coordinate of each chunk.
+        chunk_ends (:class:`ndarray`): end coordinate of each chunk.
+        model (:class:`nn.Module`): Taiyaki network.
+        n_can_state (int): number of canonical flip-flop transitions (40 for
+            ACGT).
+        stride (int): stride of basecalling network (measured in samples)
+        alphabet (str): Alphabet (e.g. 'ACGT').
+        max_concurrent_chunks (int): number of chunks in each window.
+        fastq (bool): generate q scores if this is True.
+        qscore_scale (float): Scaling factor for Q score calibration.
+        qscore_offset (float): Offset for Q score calibration.
+        beam (None or NamedTuple): Use beam search decoding, chunk by chunk.
+        posterior (bool): Decode using posterior probability of transitions
+        temperature (float): Multiplier for network output
+        timers (dict, optional): timers for steps of calling chunks, see
+            :func:`call_chunks`.
+
+    Returns:
+        tuple of str and str: strings containing the called bases and their
+            associated Phred-encoded quality scores.
+
+        When `fastq` is False, `None` is returned instead of a quality string.
+    """
+    if len(chunk_starts) == 1:
+        outputs = call_chunks(model, chunks[0], n_can_state, fastq, beam,
+                              posterior, temperature, beam_by_chunk=True,
+                              timers=timers)
+        return decode_read(outputs, chunk_starts, chunk_ends, stride,
+                           alphabet, fastq, qscore_scale, qscore_offset)
+
+    #  Paths found by beam search are stitched including their last state
+    region_starts, region_ends = stitch_regions(
+        chunk_starts, chunk_ends, stride, path_stitching=beam is not None)
+    basecall, qstring = [], []
+    #  Last state of path so far, prepended to each piece of the path so that
+    #  moves across the join between pieces are seen
+    last_state = None
+    for first, window in iterate_chunk_windows(
+            chunks, max_concurrent_chunks):
+        outputs = [out.cpu().numpy() for out in call_chunks(
+            model, window, n_can_state, fastq, beam, posterior, temperature,
+            beam_by_chunk=True, timers=timers)]
+        for j in range(window.shape[1]):
+            region = slice(region_starts[first + j], region_ends[first + j])
+            path = outputs[0][region, j]
+            if fastq:
+                errprobs = outputs[1][region, j]
+            if last_state is not None:
+                path = np.concatenate([[last_state], path])
+                if fastq:
+                    errprobs = np.concatenate([[0.0], errprobs])
+            if len(path) == 0:
+                continue
+            basecall.append(path_to_str(path, alphabet=alphabet,
+                                        include_first_source=False))
+            if fastq:
+                qstring.append(qscores.path_errprobs_to_qstring(
+                    errprobs, path, qscore_scale, qscore_offset))
+            last_state = path[-1]
+        del outputs
+
+    return ''.join(basecall), ''.join(qstring) if fastq else None
+
+
+class BasecallWriter(object):
+    """ Write basecalls to a file, or to shards of a fixed number of reads,
+    optionally recording completed reads so an interrupted run can be resumed
+
+    When `reads_per_shard` is given, reads are written to a series of files
+    named from `output` by inserting a shard number before the extension,
+    e.g. `basecalls.00000.fa`, `basecalls.00001.fa`.  A shard has the suffix
+    `.partial` until it is complete, so downstream tools can start consuming
+    finished shards while basecalling continues.
+
+    When `resume` is True, each read is recorded in a sidecar index,
+    `<output>.index`, with the shard and offset in the file at which its
+    record ends.  Entries are added at each :meth:`checkpoint`, after the
+    output has been flushed.  If the index already exists, output is
+    truncated to the end of the last read recorded and continued from there;
+    :attr:`done_read_ids` contains the reads that need not be called again
+    once output has been opened.  The index records `reads_per_shard`, which
+    must be the same when resuming.  Reads with an empty record, e.g. whose
+    calling failed, are neither written nor recorded, so are called again
+    when resuming and do not count towards the reads in a shard.
+
+    Example:
+        with BasecallWriter('calls.fa', 1000, resume=True) as writer:
+            for read_id, record in calls(reads_not_in(writer.done_read_ids)):
+                writer.write(read_id, record)
+            writer.checkpoint()
+
+    Args:
+        output (str): Name of output file, or None to write to stdout.
+        reads_per_shard (int, optional): Number of reads in each shard, or
+            None for a single output file.
+        resume (bool, optional): Record completed reads in an index, and
+            resume from the index if it exists.
+    """
+    INDEX_SETTINGS = '#reads_per_shard\t{}\n'
+    INDEX_HEADER = 'read_id\tshard\toffset\n'
+
+    def __init__(self, output=None, reads_per_shard=None, resume=False):
+        assert output is not None or (reads_per_shard is None and
+                                      not resume), \
+            'Sharded or resumable output must be written to a file'
+        self.output = output
+        self.reads_per_shard = reads_per_shard
+        self.done_read_ids = set()
+        self.shard = 0
+        self._nread_in_shard = 0
+        self._fh = None
+        self._index_fh = None
+        self._pending = []
+        self.resume = resume
+
+    def open(self):
+        """ Prepare output for writing, resuming from index if requested
+
+        Called on entering context.  Existing output is overwritten unless
+        resuming.
+        """
+        if self.resume:
+            self._resume()
+        if self.reads_per_shard is None and self._fh is None:
+            self._open()
+
+    @property
+    def index_filename(self):
+        """ Name of sidecar index of completed reads """
+        return self.output + '.index'
+
+    def shard_filename(self, shard=None, partial=False):
+        """ Name of output file
+
+        Args:
+            shard (int, optional): Number of shard, default current shard.
+                Ignored when output is not sharded.
+            partial (bool, optional): Name of shard while being written.
+
+        Returns:
+            str: filename
+        """
+        if self.reads_per_shard is None:
+            return self.output
+        root, ext = os.path.splitext(self.output)
+        filename = '{}.{:05d}{}'.format(
+            root, self.shard if shard is None else shard, ext)
+        return filename + '.partial' if partial else filename
+
+    def existing_files(self):
+        """ Output files, including the index, that already exist
+
+        Returns:
+            list of str: filenames
+        """
+        if self.output is None:
+            return []
+        candidates = [self.output, self.index_filename]
+        if self.reads_per_shard is not None:
+            candidates += [self.shard_filename(0),
+                           self.shard_filename(0, partial=True)]
+        return [fn for fn in candidates if os.path.exists(fn)]
+
+    def _resume(self):
+        """ Read index, truncating output to the last completed read
+
+        Raises:
+            ValueError: if the index was written with a different number of
+                reads per shard, or output is missing or shorter than the
+                reads recorded in the index.
+        """
+        offset = None
+        if os.path.exists(self.index_filename):
+            with open(self.index_filename, 'rb+') as fh:
+                settings = fh.readline().decode()
+                if settings != self.INDEX_SETTINGS.format(
+                        self.reads_per_shard):
+                    raise ValueError((
+                        'Cannot resume, index {} was not written with ' +
+                        '{} reads per shard').format(
+                            self.index_filename, self.reads_per_shard))
+                fh.readline()
+                index_end = fh.tell()
+                for line in fh:
+                    fields = line.decode().rstrip('\n').split('\t')
+                    if not line.endswith(b'\n') or len(fields) != 3:
+                        #  Incomplete entry written when interrupted
+                        break
+                    index_end += len(line)
+                    read_id, shard, offset = fields[0], int(fields[1]), \
+                        int(fields[2])
+                    if shard != self.shard:
+                        self.shard = shard
+                        self._nread_in_shard = 0
+                    self._nread_in_shard += 1
+                    self.done_read_ids.add(read_id)
+                fh.truncate(index_end)
+            self._index_fh = open(self.index_filename, 'a')
+        else:
+            self._index_fh = open(self.index_filename, 'w')
+            self._index_fh.write(self.INDEX_SETTINGS.format(
+                self.reads_per_shard))
+            self._index_fh.write(self.INDEX_HEADER)
+            self._index_fh.flush()
+            return
+        if offset is None:
+            #  Index contains no reads
+            offset = 0
+        else:
+            self._check_output(offset)
+
+        if self._shard_is_full():
+            self._finish_shard()
+            return
+        if self.reads_per_shard is not None and os.path.exists(
+                self.shard_filename()):
+            #  Last shard was finished but more reads may be added to it
+            os.rename(self.shard_filename(),
+                      self.shard_filename(partial=True))
+        filename = self.shard_filename(partial=True)
+        if offset > 0 or os.path.exists(filename):
+            self._fh = open(filename, 'rb+')
+            self._fh.truncate(offset)
+            self._fh.seek(offset)
+
+    def _check_output(self, offset):
+        """ Check output contains the reads recorded in the index
+
+        Args:
+            offset (int): offset at which last read recorded ends in the
+                current shard.
+
+        Raises:
+            ValueError: if output is missing or shorter than `offset`.
+        """
+        filenames = [self.shard_filename(partial=True), self.shard_filename()]
+        for filename in filenames:
+            if os.path.exists(filename):
+                if os.path.getsize(filename) < offset:
+                    raise ValueError((
+                        'Cannot resume, output {} is shorter than the ' +
+                        'reads recorded in index {}').format(
+                            filename, self.index_filename))
+                return
+        raise ValueError((
+            'Cannot resume, output {} for reads recorded in index {} does ' +
+            'not exist').format(filenames[0], self.index_filename))
+
+    def _shard_is_full(self):
+        return (self.reads_per_shard is not None and
+                self._nread_in_shard >= self.reads_per_shard)
+
+    def _finish_shard(self):
+        """ Close current shard and move on to next """
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        partial_filename = self.shard_filename(partial=True)
+        if os.path.exists(partial_filename):
+            os.rename(partial_filename, self.shard_filename())
+        self.shard += 1
+        self._nread_in_shard = 0
+
+    def _open(self):
+        """ Open current output file for writing
+
+        Shards are opened when their first read is written, so no empty
+        shard is created.
+        """
+        if self.output is None:
+            self._fh = sys.stdout.buffer
+        else:
+            self._fh = open(self.shard_filename(partial=True), 'wb')
+
+    def write(self, read_id, record):
+        """ Write record for a read
+
+        Args:
+            read_id (str): ID of read
+            record (str): Formatted record, e.g. fasta or fastq, for read.
+                May be empty, when nothing is written and the read is not
+                recorded as complete.
+        """
+        if len(record) == 0:
+            return
+        if self._fh is None:
+            self._open()
+        self._fh.write(record.encode())
+        self._nread_in_shard += 1
+        if self._index_fh is not None:
+            self._pending.append((read_id, self.shard, self._fh.tell()))
+        if self._shard_is_full():
+            self.checkpoint()
+            self._finish_shard()
+
+    def checkpoint(self):
+        """ Flush output and record reads written since last checkpoint """
+        if self._fh is not None:
+            self._fh.flush()
+        if self._index_fh is not None and len(self._pending) > 0:
+            self._index_fh.write(''.join(
+                '{}\t{}\t{}\n'.format(*entry) for entry in self._pending))
+            self._index_fh.flush()
+            self._pending = []
+
+    def close(self, complete=True):
+        """ Checkpoint and close output
+
+        Args:
+            complete (bool, optional): No more reads will be written, so the
+                current shard is finished.
+        """
+        self.checkpoint()
+        if complete and self.reads_per_shard is not None:
+            self._finish_shard()
+        elif self._fh is not None and self.output is not None:
+            self._fh.close()
+        self._fh = None
+        if self._index_fh is not None:
+            self._index_fh.close()
+            self._index_fh = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
@@ -4,6 +4,7 @@
 from collections import defaultdict, namedtuple
 import numpy as np
 from taiyaki.maths import med_mad
+from taiyaki.signal_mapping import Chunk
 
 
 class FILTER_PARAMETERS(namedtuple(
@@ -26,10 +27,182 @@ class FILTER_PARAMETERS(namedtuple(
     """
 
 
+def _range_max(x, starts, ends):
+    """ Maximum of each range of an array, using a sparse table
+
+    Args:
+        x (np array): values
+        starts (np int array): start of each range (inclusive)
+        ends (np int array): end of each range (exclusive), each greater
+            than the corresponding start
+
+    Returns:
+        np array: maximum of x[start:end] for each range
+    """
+    levels = np.log2(ends - starts).astype(int)
+    #  table[k][i] is the maximum of x[i : i + 2 ** k]
+    table = [x]
+    for k in range(1, levels.max(initial=0) + 1):
+        width = 1 << (k - 1)
+        table.append(np.maximum(table[-1][:-width], table[-1][width:]))
+    result = np.empty(len(starts), dtype=x.dtype)
+    for k in np.unique(levels):
+        sel = levels == k
+        result[sel] = np.maximum(table[k][starts[sel]],
+                                 table[k][ends[sel] - (1 << k)])
+    return result
+
+
+def _accepted_starts(read, chunk_len, filter_params):
+    """ Find start positions in a read of chunks that would be accepted
+
+    The reference region of a chunk, as found by
+    signal_mapping.SignalMapping.get_chunk_with_sample_length(), only changes
+    where the start or end of the chunk crosses a position in the mapping, so
+    the start positions are divided into segments within which the chunk
+    sequence, and so its mean and maximum dwell, is constant.
+
+    Args:
+        read: signal_mapping.SignalMapping object
+        chunk_len: length of chunk in samples
+        filter_params: taiyaki.chunk_selection.FILTER_PARAMETERS namedtuple
+
+    Returns:
+        tuple of np int array, np int array, int: start and end (exclusive)
+            of each run of accepted start positions, relative to the start of
+            the mapped region, and number of possible start positions.
+    """
+    no_runs = np.zeros(0, dtype=np.int64)
+    mapped_dacs_region = read.get_mapped_dacs_region()
+    spare_length = (
+        mapped_dacs_region[1] - mapped_dacs_region[0] - chunk_len)
+    if spare_length <= 0:
+        return no_runs, no_runs, 0
+
+    ref_to_signal = read.Ref_to_signal.astype(np.int64)
+    first, last = mapped_dacs_region[0], mapped_dacs_region[0] + spare_length
+    #  Start of chunk passes mapping position or end of chunk reaches one
+    breaks = np.unique(np.concatenate(
+        (ref_to_signal, ref_to_signal + 1 - chunk_len)))
+    breaks = breaks[np.logical_and(breaks > first, breaks < last)]
+    seg_starts = np.concatenate(([first], breaks))
+    seg_ends = np.concatenate((breaks, [last]))
+
+    seq_start = np.searchsorted(ref_to_signal, seg_starts, 'right') - 1
+    seq_end = np.searchsorted(ref_to_signal, seg_starts + chunk_len, 'left')
+    seq_len = seq_end - seq_start
+    accepted = seq_len > 0
+
+    if not (filter_params.median_meandwell is None or
+            filter_params.mad_meandwell is None or
+            filter_params.model_stride is None or
+            filter_params.path_buffer is None):
+        #  Filters as Chunk.apply_filters
+        max_dwell = np.ones(len(seq_len), dtype=np.int64)
+        has_dwells = seq_len > 1
+        max_dwell[has_dwells] = _range_max(
+            np.diff(ref_to_signal), seq_start[has_dwells],
+            seq_end[has_dwells] - 1)
+        with np.errstate(divide='ignore'):
+            path_ratio = chunk_len / (seq_len * filter_params.model_stride)
+        mean_dwell = chunk_len / (seq_len + Chunk._tiny)
+        accepted &= path_ratio > filter_params.path_buffer
+        accepted &= (np.abs(mean_dwell - filter_params.median_meandwell) <=
+                     filter_params.filter_mean_dwell *
+                     filter_params.mad_meandwell)
+        accepted &= (max_dwell <= filter_params.filter_max_dwell *
+                     filter_params.median_meandwell)
+
+    #  Merge adjacent accepted segments into runs
+    edges = np.diff(np.concatenate(([0], accepted.astype(np.int8), [0])))
+    run_first = np.flatnonzero(edges == 1)
+    run_last = np.flatnonzero(edges == -1) - 1
+    return (seg_starts[run_first] - mapped_dacs_region[0],
+            seg_ends[run_last] - mapped_dacs_region[0], spare_length)
+
+
+class ChunkIndex(object):
+    """ Index of the chunks of a given length that pass filters
+
+    Chunks sampled from the index have the same distribution as those
+    accepted by sample_chunks(), which samples a read and then a start
+    position uniformly, but are found without constructing and filtering
+    chunks that are rejected.
+
+    Args:
+        read_data: list of signal_mapping.SignalMapping objects
+        chunk_len: length of chunk in samples
+        filter_params: taiyaki.chunk_selection.FILTER_PARAMETERS namedtuple
+
+    Attributes:
+        chunk_len (int): length of chunk in samples
+        nchunks (int): number of distinct chunks that pass filters
+        pass_fraction (float): expected fraction of chunks passing filters
+            when sampled by sample_chunks() without an index
+    """
+
+    def __init__(self, read_data, chunk_len, filter_params):
+        self.chunk_len = chunk_len
+        no_runs = np.zeros(0, dtype=np.int64)
+        run_starts, run_ends, run_reads = [no_runs], [no_runs], [no_runs]
+        read_weights = np.zeros(len(read_data))
+        for read_number, read in enumerate(read_data):
+            starts, ends, spare_length = _accepted_starts(
+                read, chunk_len, filter_params)
+            run_starts.append(starts)
+            run_ends.append(ends)
+            run_reads.append(np.full(len(starts), read_number,
+                                     dtype=np.int64))
+            if spare_length > 0:
+                read_weights[read_number] = \
+                    np.sum(ends - starts) / spare_length
+        self._run_starts = np.concatenate(run_starts)
+        self._run_lengths = np.concatenate(run_ends) - self._run_starts
+        self._run_reads = np.concatenate(run_reads)
+        #  Accepted start positions are numbered consecutively over runs
+        self._run_cumlen = np.cumsum(self._run_lengths)
+        self._read_lengths = np.bincount(
+            self._run_reads, weights=self._run_lengths,
+            minlength=len(read_data)).astype(np.int64)
+        self._read_offsets = np.cumsum(self._read_lengths) - \
+            self._read_lengths
+        self._read_weights = np.cumsum(read_weights)
+        self.nchunks = int(np.sum(self._read_lengths))
+        self.pass_fraction = (self._read_weights[-1] / len(read_data)
+                              if len(read_data) > 0 else 0.0)
+
+    def sample(self, number_to_sample):
+        """ Sample chunks from index
+
+        Args:
+            number_to_sample (int): number of chunks to sample
+
+        Returns:
+            tuple of two np int arrays: index of read and start of chunk,
+                relative to the start of the mapped region of the read, for
+                each chunk.  Empty if no chunks pass filters.
+        """
+        if self.nchunks == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        #  Read is chosen with probability proportional to the fraction of
+        #  its chunks that pass, then an accepted start position uniformly
+        read_numbers = np.searchsorted(
+            self._read_weights,
+            np.random.uniform(0, self._read_weights[-1], number_to_sample),
+            'right')
+        positions = self._read_offsets[read_numbers] + np.floor(
+            np.random.uniform(size=number_to_sample) *
+            self._read_lengths[read_numbers]).astype(np.int64)
+        runs = np.searchsorted(self._run_cumlen, positions, 'right')
+        starts = self._run_starts[runs] + positions - (
+            self._run_cumlen[runs] - self._run_lengths[runs])
+        return self._run_reads[runs], starts
+
+
 def sample_chunks(read_data, number_to_sample, chunk_len, filter_params,
                   chunk_len_means_sequence_len=False,
                   standardize=True, select_strands_randomly=True,
-                  first_strand_index=0):
+                  first_strand_index=0, chunk_index=None):
     """ Sample <number_to_sample> chunks from a list of read_data, returning
     a tuple (chunklist, rejection_dict).
 
@@ -62,12 +235,22 @@ def sample_chunks(read_data, number_to_sample, chunk_len, filter_params,
             in read_data.
         first_strand_index : When select_strands_randomly=False, begin
             selecting strands at this index.
+        chunk_index : taiyaki.chunk_selection.ChunkIndex for read_data and
+            chunk_len, from which accepted chunks are sampled directly rather
+            than by rejection.  Requires select_strands_randomly and chunk_len
+            to be a length in samples.
     """
     nreads = len(read_data)
     if number_to_sample is None or number_to_sample == 0:
         number_to_sample_used = nreads
     else:
         number_to_sample_used = number_to_sample
+    if chunk_index is not None:
+        assert select_strands_randomly and not chunk_len_means_sequence_len
+        assert chunk_index.chunk_len == chunk_len
+        return _sample_indexed_chunks(
+            read_data, number_to_sample_used, chunk_len, filter_params,
+            standardize, chunk_index)
     maximum_attempts_allowed = int(
         number_to_sample_used / filter_params.filter_min_pass_fraction)
     chunks = []
@@ -95,6 +278,24 @@ def sample_chunks(read_data, number_to_sample, chunk_len, filter_params,
     return chunks, rejection_reasons
 
 
+def _sample_indexed_chunks(read_data, number_to_sample, chunk_len,
+                           filter_params, standardize, chunk_index):
+    """ Sample chunks from index, as sample_chunks() """
+    chunks = []
+    rejection_reasons = defaultdict(lambda: 0)
+    for read_number, start_sample in zip(
+            *chunk_index.sample(number_to_sample)):
+        chunk = read_data[read_number].get_chunk_with_sample_length(
+            chunk_len, start_sample=start_sample, standardize=standardize)
+        #  Chunks from index have already passed filters, so this is a check
+        chunk.apply_filters(filter_params)
+        rejection_reasons[chunk.reject_reason] += 1
+        if chunk.accepted:
+            chunks.append(chunk)
+
+    return chunks, rejection_reasons
+
+
 def sample_filter_parameters(read_data, number_to_sample, chunk_len,
                              filter_mean_dwell, filter_max_dwell,
                              filter_min_pass_fraction,
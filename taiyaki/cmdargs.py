@@ -242,6 +242,27 @@ def probability(p):
     return proportion(p)
 
 
+def cpu_list(cpus):
+    """An argparse type accepting a list of CPUs, as used by taskset
+
+    Examples:
+        >>> cpu_list('0-3,8,10-11')
+        [0, 1, 2, 3, 8, 10, 11]
+    """
+    res = set()
+    try:
+        for field in cpus.split(','):
+            bounds = [int(cpu) for cpu in field.split('-')]
+            first, last = bounds[0], bounds[-1]
+            if len(bounds) > 2 or first < 0 or last < first:
+                raise ValueError(field)
+            res.update(range(first, last + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'Invalid list of CPUs {}, expected e.g. 0-3,8'.format(cpus))
+    return sorted(res)
+
+
 def Vector(mytype):
     """Creates an argparse.Action that converts a list of values into a numpy
     array of given type
@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 
 from taiyaki import flipflopfings
@@ -11,8 +12,14 @@ try:
 except ImportError:
     _cupy_is_available = False
 
+try:
+    from taiyaki import decodeutil
+    _native_is_available = True
+except ImportError:
+    _native_is_available = False
 
-def flipflop_viterbi(scores, _never_use_cupy=False):
+
+def flipflop_viterbi(scores, _never_use_cupy=False, _never_use_native=False):
     """ Find highest scoring flipflop paths for a batch of score matrices.
     Args:
         scores (:torch:`Tensor`): batch of score matrices with dimensions
@@ -23,6 +30,9 @@ def flipflop_viterbi(scores, _never_use_cupy=False):
             determined by summing the scores of the individual transitions.
         _never_use_cupy (bool): this method delegates to cupy implementation if
             possible, unless _never_use_cupy=True, defaults to False
+        _never_use_native (bool): for scores on the CPU, this method delegates
+            to a native multi-threaded implementation if possible, unless
+            _never_use_native=True, defaults to False
 
     Returns:
         tuple(:torch:`Tensor`, :torch:`Tensor`, :torch:`Tensor`):
@@ -33,13 +43,21 @@ def flipflop_viterbi(scores, _never_use_cupy=False):
         scores.device.type == 'cuda',
         not _never_use_cupy,
     ])
+    use_native = all([
+        _native_is_available,
+        scores.device.type == 'cpu',
+        not _never_use_native,
+    ])
     if use_cupy:
         return cuff.flipflop_viterbi(scores)
+    elif use_native:
+        return _flipflop_viterbi_native(scores)
     else:
         return _flipflop_viterbi(scores)
 
 
-def flipflop_make_trans(scores, _never_use_cupy=False):
+def flipflop_make_trans(scores, _never_use_cupy=False,
+                        _never_use_native=False):
     """ Calculates posterior probabilities (not logs!) from raw model output.
 
     Args:
@@ -50,6 +68,9 @@ def flipflop_make_trans(scores, _never_use_cupy=False):
             globally normalised transition scores for a flipflop CRF.
         _never_use_cupy (bool): this method delegates to cupy implementation if
             possible, unless _never_use_cupy=True, defaults to False
+        _never_use_native (bool): for scores on the CPU, this method delegates
+            to a native multi-threaded implementation if possible, unless
+            _never_use_native=True, defaults to False
 
     Returns:
         :torch:`Tensor`: floats of shape (T x batch size x S) containing
@@ -62,8 +83,17 @@ def flipflop_make_trans(scores, _never_use_cupy=False):
         scores.device.type == 'cuda',
         not _never_use_cupy,
     ])
+    use_native = all([
+        _native_is_available,
+        scores.device.type == 'cpu',
+        not _never_use_native,
+    ])
     if use_cupy:
         return cuff.flipflop_make_trans(scores)[0].softmax(2)
+    elif use_native:
+        np_scores = np.ascontiguousarray(scores.detach().numpy(), dtype='f4')
+        trans = decodeutil.posterior(np_scores)
+        return torch.from_numpy(trans).to(scores.dtype)
     else:
         scores = scores.detach().requires_grad_()
         with torch.enable_grad():
@@ -72,6 +102,25 @@ def flipflop_make_trans(scores, _never_use_cupy=False):
         return trans.detach()
 
 
+def _flipflop_viterbi_native(scores):
+    """ Find highest scoring flipflop paths for a batch of score matrices
+        using the native implementation from :mod:`taiyaki.decodeutil`.
+
+    Args:
+        scores (:torch:`Tensor`): batch of score matrices with dimensions
+            [T, batch size, S] where T is the number of blocks (time axis) and
+            S is the number of distinct flipflop transitions, on the CPU.
+
+    Returns:
+        tuple(:torch:`Tensor`, :torch:`Tensor`, :torch:`Tensor`):
+            fwd scores tensor, traceback tensor, flipflop path tensor
+    """
+    np_scores = np.ascontiguousarray(scores.detach().numpy(), dtype='f4')
+    fwd, traceback, path = decodeutil.viterbi(np_scores)
+    return (torch.from_numpy(fwd).to(scores.dtype),
+            torch.from_numpy(traceback), torch.from_numpy(path))
+
+
 @torch.no_grad()
 def _flipflop_viterbi(scores):
     """ Find highest scoring flipflop paths for a batch of score matrices. This
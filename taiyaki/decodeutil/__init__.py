@@ -1,7 +1,11 @@
-from .decodeutil import beamsearch, forward, backward
+from .decodeutil import (backward, beamsearch, beamsearch_batch, forward,
+                         posterior, viterbi)
 
 if False:
     #  Keep flake8 happy
     backward
     beamsearch
+    beamsearch_batch
     forward
+    posterior
+    viterbi
@@ -4,6 +4,8 @@
 
 #include "c_flipflopfwdbwd.h"
 
+#define LARGE_LOG_VAL 50000.0f
+
 
 /**
  *  Functions to calculate log-partition functions, forward and backward. The backward function is used in guiding beam search,
@@ -150,3 +152,172 @@ float flipflop_forward(const float * score, size_t nbase, size_t nblock, float *
 
     return total_score;
 }
+
+
+/**   Posterior probabilities of transitions for a single flip-flop score matrix
+ *
+ *    The backward scores are calculated and stored, normalised at each block for
+ *    numerical stability, then a forward sweep combines forward scores, transition
+ *    scores and backward scores.  Normalising the result at each block gives the
+ *    posterior probability of each transition, so the partition function itself
+ *    is never required.  The sums over transitions needed to update the forward
+ *    scores are accumulated while calculating the posterior, so only one
+ *    exponential is calculated per transition and block in each sweep.
+ *
+ *    The initial state is a flip state and the final state is unconstrained.
+ *
+ *    @param score      Array containing scores (nblock, ldscore) -- strided!
+ *    @param nbase      Number of bases
+ *    @param nblock     Number of block (time-points) in score
+ *    @param ldscore    Stride between blocks of `score` and `trans`
+ *    @param bwd        Workspace for backward scores (nblock + 1, nstate)
+ *    @param trans [out]  Array for posterior probabilities (nblock, ldscore)
+ *
+ *    @returns void
+ **/
+static void flipflop_posterior(const float * score, size_t nbase, size_t nblock,
+                               size_t ldscore, float * bwd, float * trans){
+    const size_t nstate = nbase + nbase;
+    const size_t ntrans = nstate * (nbase + 1);
+    const size_t flopidx = nstate * nbase;
+    float fwd[nstate];
+    float sum[nstate];
+
+    //  Backward sweep, normalised at each block
+    for(size_t st=0 ; st < nstate ; st++){
+        bwd[nblock * nstate + st] = 0.0f;
+    }
+    for(size_t blk=nblock ; blk > 0 ; blk--){
+        const float * pbwd = bwd + blk * nstate;
+        float * cbwd = bwd + (blk - 1) * nstate;
+        const float * cscore = score + (blk - 1) * ldscore;
+
+        //  Maximum over transitions from each state, then sum relative to it
+        for(size_t from_state=0 ; from_state < nstate ; from_state++){
+            cbwd[from_state] = cscore[flopidx + from_state] + pbwd[nbase + from_state % nbase];
+        }
+        for(size_t to_base=0 ; to_base < nbase ; to_base++){
+            for(size_t from_state=0 ; from_state < nstate ; from_state++){
+                cbwd[from_state] = fmaxf(cbwd[from_state],
+                                         cscore[to_base * nstate + from_state] + pbwd[to_base]);
+            }
+        }
+        for(size_t from_state=0 ; from_state < nstate ; from_state++){
+            sum[from_state] = expf(cscore[flopidx + from_state] + pbwd[nbase + from_state % nbase]
+                                   - cbwd[from_state]);
+        }
+        for(size_t to_base=0 ; to_base < nbase ; to_base++){
+            for(size_t from_state=0 ; from_state < nstate ; from_state++){
+                sum[from_state] += expf(cscore[to_base * nstate + from_state] + pbwd[to_base]
+                                        - cbwd[from_state]);
+            }
+        }
+        float norm = -HUGE_VALF;
+        for(size_t st=0 ; st < nstate ; st++){
+            cbwd[st] += logf(sum[st]);
+            norm = fmaxf(norm, cbwd[st]);
+        }
+        for(size_t st=0 ; st < nstate ; st++){
+            cbwd[st] -= norm;
+        }
+    }
+
+    //  Forward sweep, calculating posteriors
+    for(size_t st=0 ; st < nstate ; st++){
+        fwd[st] = (st < nbase) ? 0.0f : -LARGE_LOG_VAL;
+    }
+    for(size_t blk=0 ; blk < nblock ; blk++){
+        const float * pbwd = bwd + (blk + 1) * nstate;
+        const float * cscore = score + blk * ldscore;
+        float * ctrans = trans + blk * ldscore;
+
+        float tmax = -HUGE_VALF;
+        for(size_t to_base=0 ; to_base < nbase ; to_base++){
+            for(size_t from_state=0 ; from_state < nstate ; from_state++){
+                const size_t idx = to_base * nstate + from_state;
+                ctrans[idx] = fwd[from_state] + cscore[idx] + pbwd[to_base];
+                tmax = fmaxf(tmax, ctrans[idx]);
+            }
+        }
+        for(size_t from_state=0 ; from_state < nstate ; from_state++){
+            const size_t idx = flopidx + from_state;
+            ctrans[idx] = fwd[from_state] + cscore[idx] + pbwd[nbase + from_state % nbase];
+            tmax = fmaxf(tmax, ctrans[idx]);
+        }
+
+        //  Unnormalised posterior, summed by destination state
+        for(size_t st=0 ; st < nstate ; st++){
+            sum[st] = 0.0f;
+        }
+        for(size_t to_base=0 ; to_base < nbase ; to_base++){
+            for(size_t from_state=0 ; from_state < nstate ; from_state++){
+                const size_t idx = to_base * nstate + from_state;
+                ctrans[idx] = expf(ctrans[idx] - tmax);
+                sum[to_base] += ctrans[idx];
+            }
+        }
+        for(size_t from_state=0 ; from_state < nstate ; from_state++){
+            const size_t idx = flopidx + from_state;
+            ctrans[idx] = expf(ctrans[idx] - tmax);
+            sum[nbase + from_state % nbase] += ctrans[idx];
+        }
+
+        float total = 0.0f;
+        for(size_t st=0 ; st < nstate ; st++){
+            total += sum[st];
+        }
+        const float rtotal = 1.0f / total;
+        for(size_t i=0 ; i < ntrans ; i++){
+            ctrans[i] *= rtotal;
+        }
+
+        //  Update forward scores, removing contribution of backward scores
+        float norm = -HUGE_VALF;
+        for(size_t st=0 ; st < nstate ; st++){
+            fwd[st] = logf(sum[st]) + tmax - pbwd[st];
+            norm = fmaxf(norm, fwd[st]);
+        }
+        for(size_t st=0 ; st < nstate ; st++){
+            fwd[st] -= norm;
+        }
+    }
+}
+
+
+/**   Posterior probabilities of transitions for a batch of flip-flop score matrices
+ *
+ *    Equivalent to the derivative of the log-partition function with respect to
+ *    the scores.  Elements of the batch are processed in parallel.
+ *
+ *    @param score      Array containing scores (nblock, nbatch, ntrans)
+ *    @param nbase      Number of bases
+ *    @param nblock     Number of block (time-points) in score
+ *    @param nbatch     Number of elements in batch
+ *    @param trans [out]  Array for posterior probabilities (nblock, nbatch, ntrans)
+ *
+ *    @returns 0 on success, -1 if memory could not be allocated
+ **/
+int flipflop_posterior_batch(const float * score, size_t nbase, size_t nblock,
+                             size_t nbatch, float * trans){
+    assert(NULL != score);
+    assert(NULL != trans);
+
+    const size_t nstate = nbase + nbase;
+    const size_t ntrans = nstate * (nbase + 1);
+    int ret = 0;
+
+#pragma omp parallel for schedule(dynamic, 1)
+    for(size_t batch=0 ; batch < nbatch ; batch++){
+        float * bwd = malloc((nblock + 1) * nstate * sizeof(float));
+        if(NULL == bwd){
+#pragma omp atomic write
+            ret = -1;
+            continue;
+        }
+        flipflop_posterior(score + batch * ntrans, nbase, nblock,
+                           nbatch * ntrans, bwd, trans + batch * ntrans);
+        free(bwd);
+    }
+
+    return ret;
+}
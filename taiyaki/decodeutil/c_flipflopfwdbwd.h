@@ -7,6 +7,8 @@
 
 float flipflop_forward(const float * score, size_t nbase, size_t nblock, float * out);
 float flipflop_backward(const float * score, size_t nbase, size_t nblock, float * out);
+int flipflop_posterior_batch(const float * score, size_t nbase, size_t nblock,
+                             size_t nbatch, float * trans);
 
 #endif  /*  FLIPFLOPBWD_H  */
 
@@ -0,0 +1,134 @@
+#include <assert.h>
+#include <math.h>
+#include <stdint.h>
+#include <stdlib.h>
+
+#include "c_flipflopviterbi.h"
+
+#define LARGE_VAL 1e30f
+
+
+/**
+ *  Viterbi decoding of flip-flop CRF for a batch of score matrices.
+
+ * Finds the highest scoring path through the flip-flop states for each element of the batch.  The result
+ * is identical to `taiyaki.decode._flipflop_viterbi`, including the handling of ties (the first state
+ * with the maximum score is chosen), but elements of the batch are processed in parallel.
+
+**/
+
+
+/**   Viterbi step for a single element of the batch
+ *
+ *        From base (flip uppercase, flop lowercase)
+ *      A C G T a c g t
+ *  A   0     ---     7
+ *  C   8     ---    15
+ *  G  16     ---    23
+ *  T  24     ---    31
+ *  X  32     ---    39
+ *
+ *  X = lower(from)
+ *
+ *    @param cscore     Array containing scores for block (ntrans)
+ *    @param nbase      Number of bases
+ *    @param pfwd       Forward scores for previous block (nstate)
+ *    @param cfwd [out]  Forward scores for current block (nstate)
+ *    @param tb [out]   Traceback for current block (nstate)
+ *
+ *    @returns void
+ **/
+static inline void viterbi_step(const float * restrict cscore, size_t nbase,
+                                const float * restrict pfwd, float * restrict cfwd,
+                                int64_t * restrict tb){
+    const size_t nstate = nbase + nbase;
+    float tmp[nstate];
+
+    for(size_t to_base=0 ; to_base < nbase ; to_base++){
+        //  Scores going to flip base.  Sum computed separately so loop vectorises
+        const float * tscore = cscore + to_base * nstate;
+        for(size_t from_state=0 ; from_state < nstate ; from_state++){
+            tmp[from_state] = pfwd[from_state] + tscore[from_state];
+        }
+        int64_t imax = 0;
+        float vmax = tmp[0];
+        for(size_t from_state=1 ; from_state < nstate ; from_state++){
+            if(tmp[from_state] > vmax){
+                vmax = tmp[from_state];
+                imax = from_state;
+            }
+        }
+        cfwd[to_base] = vmax;
+        tb[to_base] = imax;
+    }
+
+    const float * fscore = cscore + nstate * nbase;
+    for(size_t b=0 ; b < nbase ; b++){
+        //  Scores to flop base (from flip and flop)
+        const float flip_score = pfwd[b] + fscore[b];
+        const float flop_score = pfwd[b + nbase] + fscore[b + nbase];
+        const int from_flop = flop_score > flip_score;
+        cfwd[b + nbase] = from_flop ? flop_score : flip_score;
+        tb[b + nbase] = from_flop ? (int64_t)(b + nbase) : (int64_t)b;
+    }
+}
+
+
+/**   Viterbi decoding for a batch of flip-flop score matrices
+ *
+ *    All arrays are C ordered with the batch as the second dimension, matching the
+ *    layout of the network output.
+ *
+ *    @param score      Array containing scores (nblock, nbatch, ntrans)
+ *    @param nbase      Number of bases
+ *    @param nblock     Number of block (time-points) in score
+ *    @param nbatch     Number of elements in batch
+ *    @param fwd [out]  Array for forwards scores (nblock + 1, nbatch, nstate)
+ *    @param traceback [out]  Array for traceback (nblock, nbatch, nstate)
+ *    @param path [out]  Array for best path (nblock + 1, nbatch)
+ *
+ *    @returns void
+ **/
+void flipflop_viterbi_batch(const float * score, size_t nbase, size_t nblock,
+                            size_t nbatch, float * fwd, int64_t * traceback,
+                            int64_t * path){
+    assert(NULL != score);
+    assert(NULL != fwd);
+    assert(NULL != traceback);
+    assert(NULL != path);
+
+    const size_t nstate = nbase + nbase;
+    const size_t ntrans = nstate * (nbase + 1);
+
+#pragma omp parallel for schedule(dynamic, 1)
+    for(size_t batch=0 ; batch < nbatch ; batch++){
+        //  Must start in flip state
+        float * fwd0 = fwd + batch * nstate;
+        for(size_t st=0 ; st < nbase ; st++){
+            fwd0[st] = 0.0f;
+            fwd0[st + nbase] = -LARGE_VAL;
+        }
+
+        for(size_t blk=0 ; blk < nblock ; blk++){
+            const size_t offset = blk * nbatch + batch;
+            viterbi_step(score + offset * ntrans, nbase,
+                         fwd + offset * nstate, fwd + (offset + nbatch) * nstate,
+                         traceback + offset * nstate);
+        }
+
+        //  Best final state
+        const float * fwdT = fwd + (nblock * nbatch + batch) * nstate;
+        int64_t imax = 0;
+        for(size_t st=1 ; st < nstate ; st++){
+            if(fwdT[st] > fwdT[imax]){
+                imax = st;
+            }
+        }
+        path[nblock * nbatch + batch] = imax;
+
+        for(size_t blk=nblock ; blk > 0 ; blk--){
+            const size_t offset = (blk - 1) * nbatch + batch;
+            path[offset] = traceback[offset * nstate + path[offset + nbatch]];
+        }
+    }
+}
@@ -0,0 +1,13 @@
+#pragma once
+
+#ifndef FLIPFLOPVITERBI_H
+#define FLIPFLOPVITERBI_H
+
+#include <stdint.h>
+#include <stdlib.h>
+
+void flipflop_viterbi_batch(const float * score, size_t nbase, size_t nblock,
+                            size_t nbatch, float * fwd, int64_t * traceback,
+                            int64_t * path);
+
+#endif  /*  FLIPFLOPVITERBI_H  */
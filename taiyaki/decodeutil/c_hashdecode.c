@@ -2,12 +2,13 @@
 #include <assert.h>
 #include <math.h>
 #include <stdbool.h>
+#include <stdint.h>
 #include <stdlib.h>
 
+#include "c_flipflopfwdbwd.h"
 #include "c_hashdecode.h"
 #include "fasthash.h"
 #include "qsort.h"
-#include "yastring.h"
 
 /**
  * Functions for beam search basecalling using hash function for fast prefix comparison
@@ -75,10 +76,27 @@ size_t ntrans_from_nbase(size_t nbase){
 }
 
 
+/**  Base of a sequence in the beam
+ *
+ *   Elements of the beam share most of their sequence, so sequences are stored
+ *   as a tree where each node links to the node for the previous base.
+ *   Extending an element of the beam adds a single node rather than copying
+ *   its whole sequence.
+ **/
+typedef struct _seqnode {
+    size_t parent;   //  Index of node for previous base or NO_PARENT
+    size_t pos;      //  Position in path, number of blocks before base emitted
+    base_t base;     //  Base
+} seqnode;
+
+#define NO_PARENT SIZE_MAX
+
+
 /**  Element of beam
  **/
 typedef struct _beamelt {
-    yastring seq;    //  Sequence
+    size_t node;     //  Index of node for last base of sequence
+    base_t base;     //  Last base of sequence
     uint64_t hash;   //  Hash of sequence
     float score;     //  Score of sequence
 } beamelt;
@@ -111,13 +129,15 @@ static const char ALPHA[9] = "ACGTacgt";
  *
  *   @param fh     File handle
  *   @param elt    Beam element
+ *   @param nodes  Array of nodes of sequences in beam
  *
  *   @returns void
  **/
-void beamelt_fprint(FILE * fh, const beamelt elt){
+void beamelt_fprint(FILE * fh, const beamelt elt, const seqnode * nodes){
     fprintf(fh, "%lx has score %f\n", elt.hash, elt.score);
-    for(size_t i=0 ; i < elt.seq.len ; i++){
-        fputc(ALPHA[elt.seq.str[i]], fh);
+    //  Sequence is printed last base first
+    for(size_t node=elt.node ; NO_PARENT != node ; node=nodes[node].parent){
+        fputc(ALPHA[nodes[node].base], fh);
     }
     fputc('\n', fh);
 }
@@ -236,40 +256,41 @@ int beamrec_cmpscore(const void * rec1, const void *rec2){
  *
  *   @param state   Initial state of beam
  *   @param seed    Seed for hash
+ *   @param nodes   Array of nodes of sequences in beam
+ *   @param nnode [in/out]  Number of nodes used, incremented
  *
  *   @returns new beam element
  **/
-beamelt beamelt_init(char state, uint64_t seed){
-    return (beamelt){.seq=yastring_append(yastring_new(), state),
+beamelt beamelt_init(base_t state, uint64_t seed, seqnode * nodes,
+                     size_t * nnode){
+    nodes[*nnode] = (seqnode){.parent=NO_PARENT, .pos=0, .base=state};
+    *nnode += 1;
+    return (beamelt){.node=*nnode - 1,
+                     .base=state,
                      .hash=chainfasthash64(seed, state),
                      .score=0.0f};
 }
 
 
-/**  Free beam element
+/**  Extend beam element by a base
  *
- *   After freeing, the pointer in the input beam element is
- *     no longer valid.
+ *   @param elt     Beam element to extend
+ *   @param base    Base to extend by
+ *   @param hash    Hash of extended sequence
+ *   @param blk     Block at which base is emitted
+ *   @param nodes   Array of nodes of sequences in beam
+ *   @param nnode [in/out]  Number of nodes used, incremented
  *
- *   @param elt  beam element to free
- *
- *   @returns void
+ *   @returns extended beam element, with the same score as `elt`
  **/
-void beamelt_free(beamelt elt){
-    yastring_free(elt.seq);
-}
-
-
-/**  Copy beam element
- *
- *   @param elt  beam element to copy
- *
- *   @returns void
- **/
-beamelt beamelt_copy(const beamelt elt){
-    return (beamelt){.seq = yastring_copy(elt.seq),
-                     .hash = elt.hash,
-                     .score = elt.score};
+beamelt beamelt_extend(const beamelt elt, base_t base, uint64_t hash,
+                       size_t blk, seqnode * nodes, size_t * nnode){
+    nodes[*nnode] = (seqnode){.parent=elt.node, .pos=blk + 1, .base=base};
+    *nnode += 1;
+    return (beamelt){.node=*nnode - 1,
+                     .base=base,
+                     .hash=hash,
+                     .score=elt.score};
 }
 
 
@@ -339,12 +360,16 @@ bool isordered(void * x, size_t nelt, size_t size, int (*cmp)(const void *, cons
  *   @param bwd             Array [nblock x nstate] of backwards scores
  *   @param max_beam_width  Width of beam (number of values retained between steps).
  *   @param seq [out]       Buffer to write-out sequence found.  Should contain
- *      sufficient space for output (maximum nblock).
+ *      sufficient space for output (maximum nblock + 1).  Elements after the
+ *      sequence are set to -1.
+ *   @param path [out]      Buffer [nblock + 1] to write-out flip-flop state
+ *      of best sequence after each block, as for Viterbi decoding, or NULL.
  *
  *   @Returns score of best sequence found.  Best sequence is written to `seq`
  **/
 float flipflop_beamsearch(const float * score, size_t nbase, size_t nblock,
-        const float * bwd, int max_beam_width, float beamcut, base_t * seq){
+        const float * bwd, int max_beam_width, float beamcut, base_t * seq,
+        base_t * path){
     assert(NULL != score);
     assert(NULL != seq);
     const float logbeamcut = logf(beamcut);
@@ -361,8 +386,11 @@ float flipflop_beamsearch(const float * score, size_t nbase, size_t nblock,
 
     beamelt * currbeam = calloc(real_max_beam_width, sizeof(beamelt));
     beamelt * prevbeam = calloc(real_max_beam_width, sizeof(beamelt));
+    //  Each block adds at most one node for each element of beam
+    seqnode * nodes = calloc(nbase + nblock * real_max_beam_width, sizeof(seqnode));
+    size_t nnode = 0;
     for(size_t i=0 ; i < nbase ; i++){
-        currbeam[i] = beamelt_init(i, seed);
+        currbeam[i] = beamelt_init(i, seed, nodes, &nnode);
     }
     size_t beam_width = nbase;
 
@@ -381,7 +409,7 @@ float flipflop_beamsearch(const float * score, size_t nbase, size_t nblock,
         //  Good lower bound on max score for beam cutting
         float max_score = NAN;
         {
-            size_t prevbase = yastring_lastchar(prevbeam[0].seq);
+            size_t prevbase = prevbeam[0].base;
             // Transition to flop state
             max_score = currscore[nbase * nstate + prevbase]
                       + bwdscore[(prevbase < nbase) ? (prevbase + nbase) : prevbase];
@@ -398,7 +426,7 @@ float flipflop_beamsearch(const float * score, size_t nbase, size_t nblock,
             //  Iterate through all element of beam trying all extensions
             //  Since elements of beam are unique, so are the extensions
             const beamelt pelt = prevbeam[i];
-            const base_t prevbase = yastring_lastchar(pelt.seq);
+            const base_t prevbase = pelt.base;
             for(size_t base=0 ; base < nbase ; base++){
                 //  Try extension with base.  `newbase` is flip-flop encoding
                 uint64_t newbase = (base != prevbase) ? base : (prevbase + nbase);
@@ -421,7 +449,7 @@ float flipflop_beamsearch(const float * score, size_t nbase, size_t nblock,
             //  Iterate through all element of beam trying all stays
             //  May be equal (by hash) to a previous record, merged later
             const beamelt pelt = prevbeam[i];
-            const base_t base = yastring_lastchar(pelt.seq);
+            const base_t base = pelt.base;
             const float newscore = pelt.score + currscore[STAY_IDX(base, nbase)] + bwdscore[base];
             if(newscore < max_score + logbeamcut){
                 // Cut beam
@@ -456,39 +484,46 @@ float flipflop_beamsearch(const float * score, size_t nbase, size_t nblock,
         size_t new_beam_width = MIN(max_beam_width, nelt_uniq);
         for(size_t i=0 ; i < new_beam_width ; i++){
             // Copy best elements into current beam
-            currbeam[i] = beamelt_copy(prevbeam[beamext[i].origbeam]);
+            currbeam[i] = prevbeam[beamext[i].origbeam];
             if(beamext[i].base != -1){
                 // Not a stay -- hash and state sequence have changed
-                currbeam[i].hash = beamext[i].hash;
-                currbeam[i].seq = yastring_append(currbeam[i].seq,
-                                                  beamext[i].base);
+                currbeam[i] = beamelt_extend(currbeam[i], beamext[i].base,
+                                             beamext[i].hash, blk, nodes,
+                                             &nnode);
             }
             // Copy score, removing backwards contribution
-            currbeam[i].score = beamext[i].score - bwdscore[yastring_lastchar(currbeam[i].seq)];
-        }
-        for(size_t i=0 ; i < beam_width ; i++){
-            //  Free previous beam
-            beamelt_free(prevbeam[i]);
+            currbeam[i].score = beamext[i].score - bwdscore[currbeam[i].base];
         }
         beam_width = new_beam_width;
     }
 
-    //  Copy best result to output
+    //  Copy best result to output, following links from last base
     const float final_score = currbeam[0].score;
-    const size_t seqlen = currbeam[0].seq.len;
-    for(size_t i=0 ; i < seqlen ; i++){
-        seq[i] = currbeam[0].seq.str[i];
+    size_t seqlen = 0;
+    for(size_t node=currbeam[0].node ; NO_PARENT != node ; node=nodes[node].parent){
+        seqlen += 1;
+    }
+    assert(seqlen <= nblock + 1);
+    for(size_t node=currbeam[0].node, i=seqlen ; NO_PARENT != node ; node=nodes[node].parent){
+        i -= 1;
+        seq[i] = nodes[node].base;
     }
-    for(size_t i=seqlen ; i < nblock ; i++){
+    for(size_t i=seqlen ; i <= nblock ; i++){
         seq[i] = -1;
     }
+    if(NULL != path){
+        //  State changes when each base is emitted, constant in between
+        for(size_t node=currbeam[0].node, pos=nblock + 1 ; NO_PARENT != node ; node=nodes[node].parent){
+            for( ; pos > nodes[node].pos ; pos--){
+                path[pos - 1] = nodes[node].base;
+            }
+        }
+    }
 
     //  Clear-up
-    for(size_t i=0 ; i < beam_width ; i++){
-        beamelt_free(currbeam[i]);
-    }
+    free(nodes);
     free(currbeam);
-    free(prevbeam);  // elements already free'd in loop above
+    free(prevbeam);
     free(beamext);
 
     return final_score;
@@ -496,6 +531,68 @@ float flipflop_beamsearch(const float * score, size_t nbase, size_t nblock,
 
 
 
+/**  Beam-search for a batch of flip-flop score matrices
+ *
+ *   Elements of the batch are decoded in parallel, with the backwards scores
+ *   used to guide each search calculated by the same thread.  Matrices may
+ *   have different numbers of blocks; threads take the next matrix to decode
+ *   as they finish, so the longest should be first.
+ *
+ *   @param score           Array [nbatch] of arrays [nblock[i] x ntrans] of scores
+ *   @param nblock          Array [nbatch] of number of blocks in each score
+ *   @param nbatch          Number of elements in batch
+ *   @param nbase           Number of bases for flip-flop
+ *   @param guided          Guide search using backwards scores
+ *   @param max_beam_width  Width of beam (number of values retained between steps).
+ *   @param beamcut         Bayes factor for cutting beam
+ *   @param seq [out]       Array [nbatch] of buffers to write-out sequences
+ *      found.  Each should contain space for `nblock[i] + 1` elements.
+ *   @param seqlen [out]    Array [nbatch] for length of each sequence
+ *   @param seqscore [out]  Array [nbatch] for score of each sequence
+ *   @param path [out]      Array [nbatch] of buffers [nblock[i] + 1] to
+ *      write-out flip-flop state after each block, or NULL.
+ *
+ *   @Returns 0 on success, -1 if memory could not be allocated
+ **/
+int flipflop_beamsearch_batch(const float * const * score, const size_t * nblock,
+        size_t nbatch, size_t nbase, bool guided, int max_beam_width,
+        float beamcut, base_t * const * seq, size_t * seqlen, float * seqscore,
+        base_t * const * path){
+    assert(NULL != score);
+    assert(NULL != nblock);
+    assert(NULL != seq);
+    assert(NULL != seqlen);
+    assert(NULL != seqscore);
+    const size_t nstate = nstate_from_nbase(nbase);
+    int ret = 0;
+
+#pragma omp parallel for schedule(dynamic, 1)
+    for(size_t batch=0 ; batch < nbatch ; batch++){
+        //  Backward scores, initial state at end of read is zero
+        float * bwd = calloc((nblock[batch] + 1) * nstate, sizeof(float));
+        if(NULL == bwd){
+#pragma omp atomic write
+            ret = -1;
+            continue;
+        }
+        if(guided){
+            flipflop_backward(score[batch], nbase, nblock[batch], bwd);
+        }
+        seqscore[batch] = flipflop_beamsearch(score[batch], nbase, nblock[batch],
+                                              bwd, max_beam_width, beamcut,
+                                              seq[batch],
+                                              (NULL != path) ? path[batch] : NULL);
+        size_t len = 0;
+        for( ; len <= nblock[batch] && seq[batch][len] != -1 ; len++);
+        seqlen[batch] = len;
+        free(bwd);
+    }
+
+    return ret;
+}
+
+
+
 #ifdef DECODEUTIL_TEST
 #include <stdio.h>
 
@@ -572,9 +669,9 @@ int main(int argc, char * argv[]){
     float * zerobwd = calloc(nstate * (test_nblock + 1), sizeof(float));
 
     for(int i=0 ; i < ntimes ; i++){
-        base_t * seq = calloc(test_nblock, sizeof(base_t));
+        base_t * seq = calloc(test_nblock + 1, sizeof(base_t));
         float score = flipflop_beamsearch(test_score, nbase, test_nblock, zerobwd,
-                beam_width, beamcut, seq);
+                beam_width, beamcut, seq, NULL);
         size_t seqlen = 0;
         for( ; seqlen < test_nblock && seq[seqlen] != -1 ; seqlen++);
         printf("Score is %f.  Seq length is %zu\n", score, seqlen);
@@ -3,11 +3,18 @@
 #ifndef DECODEUTIL_H
 #define DECODEUTIL_H
 
+#include <stdbool.h>
+#include <stdint.h>
 #include <stdlib.h>
 
 //  Type to represent bases by.  Use single byte, since not many bases expected
 typedef int8_t base_t;
 
-float flipflop_beamsearch(const float * score, size_t nbase, size_t nblock, const float * bwd, int beam_width, float beamcut, base_t * seq);
+float flipflop_beamsearch(const float * score, size_t nbase, size_t nblock, const float * bwd, int beam_width, float beamcut, base_t * seq, base_t * path);
+int flipflop_beamsearch_batch(const float * const * score, const size_t * nblock,
+                              size_t nbatch, size_t nbase, bool guided,
+                              int beam_width, float beamcut,
+                              base_t * const * seq, size_t * seqlen,
+                              float * seqscore, base_t * const * path);
 
 #endif  /*  DECODEUTIL_H  */
@@ -1,17 +1,17 @@
 cimport libdecodeutil
+from libc.stdint cimport int8_t, int64_t
 import cython
 import numpy as np
 cimport numpy as np
 from taiyaki.flipflopfings import nbase_flipflop
 
-@cython.boundscheck(False)
-@cython.wraparound(False)
 def beamsearch(np.ndarray[np.float32_t, ndim=2, mode="c"] score,
                beam_cut=0.0, beam_width=5, guided=True):
     """  Conduct beam search for flip-flop model
 
     Beam search decoding for best sequence, optionally guided by backwards
-      calls.
+      calls.  See :func:`beamsearch_batch` to decode several score matrices
+      in parallel.
 
     Notes:
         Beams are cut in log-space, so `beam_cut` of 0.0 means no beams are cut.
@@ -32,23 +32,87 @@ def beamsearch(np.ndarray[np.float32_t, ndim=2, mode="c"] score,
         Tuple[:class:`ndarray`, float]: Decoded sequence (integer encoded) and
           score for read
     """
-    cdef size_t nbase, nt, nf, seqlen
-    cdef float read_score
-    nt, nf = score.shape[0], score.shape[1]
-    nbase = nbase_flipflop(nf)
+    return beamsearch_batch([score], beam_cut, beam_width, guided)[0]
 
-    cdef np.ndarray[np.float32_t, ndim=2, mode="c"] bwd
-    if guided:
-        bwd = backward(score)[0]
-    else:
-        bwd = np.zeros((nt + 1, nbase + nbase), dtype=np.float32)
 
-    cdef np.ndarray[np.int8_t, ndim=1, mode="c"] res = np.zeros((nt,), dtype=np.int8)
-    read_score = libdecodeutil.flipflop_beamsearch(&score[0,0], nbase, nt, &bwd[0,0],
-                                                   beam_width, beam_cut, &res[0])
-    seqlen = np.nonzero(res == -1)[0][0]
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def beamsearch_batch(scores, beam_cut=0.0, beam_width=5, guided=True,
+                     with_path=False):
+    """  Conduct beam search for a batch of flip-flop score matrices
+
+    Score matrices are decoded in parallel using OpenMP, longest first, with
+    the GIL released.  The backwards scores used to guide the search are
+    calculated by the thread decoding each matrix.  Results are identical to
+    calling :func:`beamsearch` for each matrix.
+
+    Args:
+        scores (list of :class:`ndarray`): input scores (output of network)
+            for decoding, each with dimensions [T, S].  Matrices may have
+            different lengths T but must have the same number of transitions.
+        beam_cut (float): discard beam extensions whose score is `beam_cut` or
+           more worse than the best found.
+        beam_width (int): Maximum width (number of elements) in beam
+        guided (bool): Whether to inform decoding using backwards scores
+        with_path (bool): Also return the flip-flop state of the decoded
+            sequence after each block
+
+    Returns:
+        list of Tuple[:class:`ndarray`, float]: Decoded sequence (integer
+          encoded) and score for each matrix.  If `with_path` is True, each
+          tuple also contains the path [T + 1] through the flip-flop states,
+          in the same form as the best path from Viterbi decoding.
+    """
+    cdef size_t i, j, nbase, nbatch
+    cdef int ret
+    cdef int c_beam_width = beam_width
+    cdef float c_beam_cut = beam_cut
+    cdef bint c_guided = guided
+    scores = [np.ascontiguousarray(score, dtype=np.float32)
+              for score in scores]
+    nbatch = len(scores)
+    if nbatch == 0:
+        return []
+    assert all(score.ndim == 2 for score in scores), \
+        'Score matrices must have two dimensions'
+    nf = scores[0].shape[1]
+    assert all(score.shape[1] == nf for score in scores), \
+        'Score matrices must have the same number of transitions'
+    nbase = nbase_flipflop(nf)
 
-    return res[:seqlen], read_score
+    #  Longest first, so threads are not left idle waiting for a long matrix
+    order = np.argsort([-score.shape[0] for score in scores], kind='stable')
+    seqs = [np.empty(scores[i].shape[0] + 1, dtype=np.int8) for i in order]
+    cdef np.ndarray[np.uintp_t, ndim=1, mode="c"] score_ptrs = np.array(
+        [scores[i].ctypes.data for i in order], dtype=np.uintp)
+    cdef np.ndarray[np.uintp_t, ndim=1, mode="c"] seq_ptrs = np.array(
+        [seq.ctypes.data for seq in seqs], dtype=np.uintp)
+    paths = [np.empty(scores[i].shape[0] + 1, dtype=np.int8) for i in order]
+    cdef np.ndarray[np.uintp_t, ndim=1, mode="c"] path_ptrs = np.array(
+        [path.ctypes.data for path in paths], dtype=np.uintp)
+    cdef int8_t ** c_paths = <int8_t **>&path_ptrs[0] if with_path else NULL
+    cdef np.ndarray[np.uintp_t, ndim=1, mode="c"] nblock = np.array(
+        [scores[i].shape[0] for i in order], dtype=np.uintp)
+    cdef np.ndarray[np.uintp_t, ndim=1, mode="c"] seqlen = np.empty(
+        nbatch, dtype=np.uintp)
+    cdef np.ndarray[np.float32_t, ndim=1, mode="c"] seqscore = np.empty(
+        nbatch, dtype=np.float32)
+
+    with nogil:
+        ret = libdecodeutil.flipflop_beamsearch_batch(
+            <const float **>&score_ptrs[0], <size_t *>&nblock[0], nbatch,
+            nbase, c_guided, c_beam_width, c_beam_cut,
+            <int8_t **>&seq_ptrs[0], <size_t *>&seqlen[0], &seqscore[0],
+            c_paths)
+    if ret != 0:
+        raise MemoryError('Failed to allocate memory for beam search')
+
+    res = [None] * nbatch
+    for j, i in enumerate(order):
+        res[i] = (seqs[j][:seqlen[j]], float(seqscore[j]))
+        if with_path:
+            res[i] += (paths[j],)
+    return res
 
 
 @cython.boundscheck(False)
@@ -109,3 +173,77 @@ def forward(np.ndarray[np.float32_t, ndim=2, mode="c"] score, init=None):
     read_score = libdecodeutil.flipflop_forward(&score[0,0], nbase, nt, &res[0, 0])
 
     return res, read_score
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def viterbi(np.ndarray[np.float32_t, ndim=3, mode="c"] score):
+    """  Viterbi decoding for a batch of flipflop score matrices
+
+    Elements of the batch are decoded in parallel using OpenMP.  Results are
+    identical to `taiyaki.decode._flipflop_viterbi`.
+
+    Args:
+        score (:class:`ndarray`): input scores (output of network) for
+            decoding, dimensions [T, batch size, S].
+
+    Returns:
+        Tuple[:class:`ndarray`, :class:`ndarray`, :class:`ndarray`]: forward
+          scores [T + 1, batch size, nstate], traceback [T, batch size,
+          nstate] and best path [T + 1, batch size].
+    """
+    cdef size_t nbase, nt, nbatch, nf
+    nt, nbatch, nf = score.shape[0], score.shape[1], score.shape[2]
+    nbase = nbase_flipflop(nf)
+
+    cdef np.ndarray[np.float32_t, ndim=3, mode="c"] fwd = np.empty(
+        (nt + 1, nbatch, nbase + nbase), dtype=np.float32)
+    cdef np.ndarray[np.int64_t, ndim=3, mode="c"] traceback = np.empty(
+        (nt, nbatch, nbase + nbase), dtype=np.int64)
+    cdef np.ndarray[np.int64_t, ndim=2, mode="c"] path = np.empty(
+        (nt + 1, nbatch), dtype=np.int64)
+    if nbatch == 0:
+        return fwd, traceback, path
+
+    with nogil:
+        libdecodeutil.flipflop_viterbi_batch(
+            &score[0, 0, 0], nbase, nt, nbatch, &fwd[0, 0, 0],
+            <int64_t *>&traceback[0, 0, 0], <int64_t *>&path[0, 0])
+
+    return fwd, traceback, path
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def posterior(np.ndarray[np.float32_t, ndim=3, mode="c"] score):
+    """  Posterior probabilities of transitions for a batch of flipflop scores
+
+    Elements of the batch are processed in parallel using OpenMP.  Equivalent
+    to the derivative of the log-partition function with respect to the
+    scores, as calculated by `taiyaki.decode.flipflop_make_trans`.
+
+    Args:
+        score (:class:`ndarray`): input scores (output of network),
+            dimensions [T, batch size, S].
+
+    Returns:
+        :class:`ndarray`: posterior probabilities (not logs) of transitions,
+            dimensions [T, batch size, S].
+    """
+    cdef size_t nbase, nt, nbatch, nf
+    cdef int ret
+    nt, nbatch, nf = score.shape[0], score.shape[1], score.shape[2]
+    nbase = nbase_flipflop(nf)
+
+    cdef np.ndarray[np.float32_t, ndim=3, mode="c"] trans = np.empty_like(
+        score)
+    if nt == 0 or nbatch == 0:
+        return trans
+
+    with nogil:
+        ret = libdecodeutil.flipflop_posterior_batch(
+            &score[0, 0, 0], nbase, nt, nbatch, &trans[0, 0, 0])
+    if ret != 0:
+        raise MemoryError('Failed to allocate memory for posterior')
+
+    return trans
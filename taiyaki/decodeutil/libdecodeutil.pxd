@@ -1,12 +1,26 @@
-from libc.stdint cimport int8_t
+from libc.stdint cimport int8_t, int64_t
 cdef extern from "c_hashdecode.h":
-    size_t flipflop_beamsearch(const float * score, size_t nbase, size_t n,
-                               const float * bwd, int beam_size, float beamcut,
-                               int8_t * seq)
+    float flipflop_beamsearch(const float * score, size_t nbase, size_t n,
+                              const float * bwd, int beam_size, float beamcut,
+                              int8_t * seq, int8_t * path)
+    int flipflop_beamsearch_batch(const float * const * score,
+                                  const size_t * nblock, size_t nbatch,
+                                  size_t nbase, bint guided, int beam_size,
+                                  float beamcut, int8_t * const * seq,
+                                  size_t * seqlen, float * seqscore,
+                                  int8_t * const * path) nogil
 
 cdef extern from "c_flipflopfwdbwd.h":
     float flipflop_forward(const float * score, size_t nbase, size_t nblock,
                            float * out)
     float flipflop_backward(const float * score, size_t nbase, size_t nblock,
                             float * out)
+    int flipflop_posterior_batch(const float * score, size_t nbase,
+                                 size_t nblock, size_t nbatch,
+                                 float * trans) nogil
 
+
+cdef extern from "c_flipflopviterbi.h":
+    void flipflop_viterbi_batch(const float * score, size_t nbase,
+                                size_t nblock, size_t nbatch, float * fwd,
+                                int64_t * traceback, int64_t * path) nogil
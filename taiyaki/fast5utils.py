@@ -1,6 +1,7 @@
 # Utilities to read and write information from HDF5 files,
 # including ONT fast5 files.
 # ONT fast5 access is built on top of the ont_fast5_api
+from itertools import groupby
 import os
 import sys
 from ont_fast5_api.conversion_tools.conversion_utils import get_fast5_file_list
@@ -180,6 +181,45 @@ def iterate_fast5_reads(
         yield y
 
 
+def iterate_read_lengths(reads):
+    """ Find number of samples in each read from the metadata of fast5 files
+
+    The length of the raw signal is read from the shape of its dataset, so no
+    signal is loaded.  Consecutive reads from the same file share a single
+    opening of the file.
+
+    Args:
+        reads (iterable of tuple(str, str)): filepath and read_id for each
+            read, as yielded by :func:`iterate_fast5_reads`.
+
+    Yields:
+        tuple(str, str, int): filepath, read_id and number of samples for
+            each read.  The number of samples is zero if the read could not
+            be found.
+    """
+    for filepath, file_reads in groupby(reads, key=lambda read: read[0]):
+        read_ids = [read_id for _, read_id in file_reads]
+        nsamples = [0] * len(read_ids)
+        try:
+            with get_fast5_file(filepath, 'r') as f5file:
+                for i, read_id in enumerate(read_ids):
+                    try:
+                        read = f5file.get_read(read_id)
+                        nsamples[i] = \
+                            read.handle[read.raw_dataset_name].shape[0]
+                    except Exception as e:
+                        sys.stderr.write((
+                            "Warning: Unable to obtain length of read {} " +
+                            "from {}:\n{}\n").format(
+                                read_id, filepath, str(e)))
+        except Exception as e:
+            sys.stderr.write((
+                "Warning: Unable to obtain length of reads from {}:\n" +
+                "{}\n").format(filepath, str(e)))
+        for read_id, nsample in zip(read_ids, nsamples):
+            yield filepath, read_id, nsample
+
+
 ######################################################
 # FUNCTIONS TO READ INFORMATION FROM ONT FAST5 FILES #
 ######################################################
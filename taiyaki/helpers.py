@@ -1,10 +1,13 @@
 import datetime
 import hashlib
 import imp
+import inspect
+import json
 import os
 import platform
 import sys
 import warnings
+import zipfile
 
 import numpy as np
 import torch
@@ -14,6 +17,10 @@ from taiyaki.fileio import readtsv
 from taiyaki.layers import MODEL_VERSION
 
 
+#  Name of file in a TorchScript archive holding the metadata of the model
+TORCHSCRIPT_METADATA = 'taiyaki_metadata.json'
+
+
 def _load_python_model(model_file, **model_kwargs):
     """Load network model structure from python file.
 
@@ -79,17 +86,107 @@ def save_model(network, output, index=None, model_skeleton=None):
     return model_file
 
 
+def export_model(network, output, example_len=1000):
+    """Trace a model into a frozen TorchScript module for inference.
+
+    The module is saved along with the metadata of the model, and its stride,
+    and may be loaded using :func:`load_model`.  The traced module runs
+    without the Python implementation of the layers.  Freezing requires
+    torch 1.8 or later; with older versions the traced module is saved
+    without freezing.
+
+    Args:
+        network (pytorch Module) : model to export, with metadata.  Layers
+            using native code outside of torch, e.g. the sparse layers, cannot
+            be traced.
+        output (str) : file to save module to.
+        example_len (int) : length of example input used for tracing.
+
+    Returns:
+        torch.jit.ScriptModule : the frozen, if supported, module, with
+            metadata
+    """
+    network = network.eval()
+    device = get_model_device(network)
+    get_model_stride(network)
+    metadata = dict(network.metadata)
+    with torch.no_grad():
+        traced = torch.jit.trace(
+            network, torch.randn(example_len, 1, 1, device=device),
+            check_trace=False)
+    if hasattr(torch.jit, 'freeze'):
+        traced = torch.jit.freeze(traced)
+    torch.jit.save(traced, output, _extra_files={
+        TORCHSCRIPT_METADATA: json.dumps(metadata)})
+    traced.metadata = metadata
+    return traced
+
+
+def is_torchscript_model(model_file):
+    """Whether file contains a model exported by :func:`export_model`.
+
+    Args:
+        model_file (str) : file name
+
+    Returns:
+        bool : True if file is a TorchScript archive with taiyaki metadata
+    """
+    if not zipfile.is_zipfile(model_file):
+        return False
+    with zipfile.ZipFile(model_file) as zh:
+        return any(name.endswith('/extra/' + TORCHSCRIPT_METADATA)
+                   for name in zh.namelist())
+
+
+def _load_checkpoint(filename, map_location=None):
+    """ Load model checkpoint, which is a pickled module rather than only its
+    weights
+
+    Versions of torch that only load weights by default must be told to load
+    the whole module.
+    """
+    if 'weights_only' in inspect.signature(torch.load).parameters:
+        return torch.load(filename, map_location=map_location,
+                          weights_only=False)
+    return torch.load(filename, map_location=map_location)
+
+
+def _load_torchscript_model(model_file, map_location='cpu'):
+    """Load TorchScript module exported by :func:`export_model`.
+
+    Args:
+        model_file (str) : where to load from
+        map_location (str or torch.device) : device to load module onto
+
+    Returns:
+        torch.jit.ScriptModule : the module, with its metadata.  Frozen
+            modules have no parameters, so the device they were loaded onto
+            is recorded as `loaded_device`.
+    """
+    extra_files = {TORCHSCRIPT_METADATA: ''}
+    network = torch.jit.load(model_file, map_location=map_location,
+                             _extra_files=extra_files)
+    network.metadata = json.loads(extra_files[TORCHSCRIPT_METADATA])
+    network.loaded_device = torch.device(map_location)
+    return network
+
+
 def load_model(
-        model_file, params_file=None, model_metadata=None, **model_kwargs):
-    """Load model from either python or checkpoint file.
+        model_file, params_file=None, model_metadata=None, map_location='cpu',
+        **model_kwargs):
+    """Load model from either python, checkpoint or TorchScript file.
 
     Args:
         model_file (str)  : where to load from
         params_file (str) : if this is supplied, then load a parameter
                             dict from this location and fill in the
-                            parameters in the model.
+                            parameters in the model.  Not supported for
+                            TorchScript models.
         model_metadata : dict containing metadata to be stored along with
             model.
+        map_location (str or torch.device) : device to load checkpoint or
+            TorchScript model onto.  Frozen TorchScript models cannot be
+            moved once loaded.
         **model_kwargs : passed on to the constructor of a python model.
 
     Returns :
@@ -102,7 +199,12 @@ def load_model(
         network.metadata = {} if model_metadata is None else model_metadata
         network.metadata['version'] = MODEL_VERSION
     else:
-        network = torch.load(model_file, map_location='cpu')
+        if is_torchscript_model(model_file):
+            assert params_file is None, \
+                'Cannot load parameters into a TorchScript model'
+            network = _load_torchscript_model(model_file, map_location)
+        else:
+            network = _load_checkpoint(model_file, map_location)
         assert hasattr(network, 'metadata'), \
             """Attempted to load unversioned model checkpoint.
             Please run misc/upgrade_model.py
@@ -138,13 +240,21 @@ def load_model(
 
 def get_model_device(net):
     """ Get device on which network is resident
+
+    Networks without parameters, for example those converted for int8
+    inference by :func:`taiyaki.quantization.convert_to_int8`, are resident
+    on the CPU, unless they are frozen TorchScript modules loaded onto
+    another device by :func:`load_model`.
+
     Args:
         net (pytorch Module) : the network model
 
     Returns:
         torch.device: Device on which network resides
     """
-    return next(net.parameters()).device
+    for param in net.parameters():
+        return param.device
+    return getattr(net, 'loaded_device', torch.device('cpu'))
 
 
 def guess_model_stride(net, input_shape=(720, 1, 1)):
@@ -162,6 +272,29 @@ def guess_model_stride(net, input_shape=(720, 1, 1)):
     return int(round(input_shape[0] / out.size()[0]))
 
 
+def get_model_stride(net):
+    """Stride of a pytorch network, from its metadata.
+
+    The stride is found by :func:`guess_model_stride` the first time it is
+    needed and stored in the metadata of the network, if it has any, so is
+    saved with any checkpoint of the model.  Later calls, and models
+    exported by :func:`export_model`, need no forward pass.
+
+    Args:
+        net (pytorch Module) : the network model
+
+    Returns:
+        int : stride of the network model
+    """
+    metadata = getattr(net, 'metadata', None)
+    if metadata is not None and 'stride' in metadata:
+        return metadata['stride']
+    stride = guess_model_stride(net)
+    if metadata is not None:
+        metadata['stride'] = stride
+    return stride
+
+
 def get_kwargs(args, names):
     """Get specified args from an ArgParse argument namespace, return as dict.
 
@@ -5,10 +5,15 @@ https://docs.python.org/2/library/itertools.html#recipes
 because its all so useful!
 
 """
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from itertools import tee
 from functools import partial
 from multiprocessing import Pool
 import sys
+from threading import Lock
+import time
 import traceback
 
 
@@ -122,3 +127,108 @@ def imap_mp(
             yield r
         pool.close()
         pool.join()
+
+
+def prefetch_map(function, iterable, threads=1, maxsize=1):
+    """ Map a function over an iterable using background threads
+
+    Results are yielded in the same order as the input.  At most `maxsize`
+    calls are outstanding at any time, so a slow consumer applies
+    backpressure to the stage feeding it rather than allowing an unbounded
+    number of results to accumulate in memory.
+
+    Elements of `iterable` are requested from the consuming thread, so
+    chaining calls to `prefetch_map` creates a pipeline where each stage runs
+    concurrently with the others.
+
+    Args:
+        function (Callable): Function to apply.
+        iterable (Iterable): iterable of argument values of function to map
+            over
+        threads (int): number of threads applying `function`
+        maxsize (int): maximum number of results that can be pending.
+
+    Yields:
+        Results from function calls
+    """
+    assert maxsize > 0, 'Must allow at least one pending result'
+    with ThreadPoolExecutor(threads) as executor:
+        pending = deque()
+        for arg in iterable:
+            pending.append(executor.submit(function, arg))
+            if len(pending) >= maxsize:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+class StageTimer(object):
+    """ Record the number of items processed, and the time spent processing
+    them, by a stage of a pipeline.  Safe to use from multiple threads and
+    may be pickled to return results from another process.
+
+    Example:
+        timer = StageTimer('reads')
+        with timer.time():
+            process_read()
+        print(timer)
+
+    Attributes:
+        unit (str): Description of items processed by stage.
+        nitem (int): Number of items processed.
+        seconds (float): Total time spent processing items.
+    """
+
+    def __init__(self, unit='items'):
+        self.unit = unit
+        self.nitem = 0
+        self.seconds = 0.0
+        self._lock = Lock()
+
+    def __getstate__(self):
+        return (self.unit, self.nitem, self.seconds)
+
+    def __setstate__(self, state):
+        self.unit, self.nitem, self.seconds = state
+        self._lock = Lock()
+
+    def __str__(self):
+        return '{} {} in {:.2f}s ({:.2f} {} / s)'.format(
+            self.nitem, self.unit, self.seconds, self.rate, self.unit)
+
+    @property
+    def rate(self):
+        """ Items processed per second spent in stage """
+        return self.nitem / self.seconds if self.seconds > 0 else 0.0
+
+    def add(self, nitem, seconds):
+        """ Add items and time to stage
+
+        Args:
+            nitem (int): Number of items processed.
+            seconds (float): Time taken.
+        """
+        with self._lock:
+            self.nitem += nitem
+            self.seconds += seconds
+
+    def update(self, other):
+        """ Add items and time from another timer to this one
+
+        Args:
+            other (:class:`StageTimer`): timer to add.
+        """
+        self.add(other.nitem, other.seconds)
+
+    @contextmanager
+    def time(self, nitem=1):
+        """ Context manager to time processing of items
+
+        Args:
+            nitem (int): Number of items processed within context.
+        """
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.add(nitem, time.time() - t0)
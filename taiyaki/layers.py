@@ -7,10 +7,17 @@ from scipy.stats import truncnorm
 import torch
 from torch import nn
 from torch.nn import Parameter
+import torch.nn.quantized.dynamic as nnqd
 
 from taiyaki import activation, flipflopfings
 from taiyaki.constants import LARGE_LOG_VAL
 
+try:
+    from taiyaki import sparse
+    _sparse_is_available = True
+except ImportError:
+    _sparse_is_available = False
+
 
 #quantization functions applied to convolution, gru and linear layers
 #quant_tensor=namedtuple('quant_tensor',['tensor','scale','zero_point'])
@@ -20,13 +27,12 @@ def calc_scale_zeropoint(min_val,max_val,num_bits=4):
         qmax=2.**num_bits-1
         scale=(max_val - min_val)/(qmax-qmin)
         initial_zero_point=qmin-min_val/scale
-        zero_point=0#does shifting
-        if initial_zero_point<qmin:
-            zero_point=qmin
-        elif initial_zero_point>qmax:
-            zero_point=qmax
+        #does shifting.  Clamp rather than branch on the value of a tensor,
+        #so the calculation is recorded when the model is traced
+        if isinstance(initial_zero_point, torch.Tensor):
+            zero_point=initial_zero_point.clamp(qmin,qmax)
         else:
-            zero_point=initial_zero_point
+            zero_point=min(max(initial_zero_point,qmin),qmax)
 
        # zero_point=int(zero_point)
         return scale,zero_point
@@ -57,6 +63,130 @@ def dequantize(q_x,scale,zero_point):
     
 
 
+def _int8_qconfig():
+    """  Quantisation configuration for int8 layers
+
+    Weights are quantised to int8 with a scale and zero-point for each output
+    channel; activations are quantised dynamically, from their observed range,
+    when the layer is run.
+
+    Returns:
+        :class:`torch.quantization.QConfigDynamic`: configuration
+    """
+    return torch.quantization.per_channel_dynamic_qconfig
+
+
+def _int8_linear(weight, bias=None):
+    """  Create dynamically quantised linear transform from float parameters
+
+    Args:
+        weight (:torch:`Tensor`): weight matrix (out features x in features).
+        bias (:torch:`Tensor`, optional): bias vector, or None.
+
+    Returns:
+        :class:`nnqd.Linear`: linear transform with int8 weights.
+    """
+    linear = nn.Linear(weight.shape[1], weight.shape[0],
+                       bias=bias is not None)
+    with torch.no_grad():
+        linear.weight.copy_(weight)
+        if bias is not None:
+            linear.bias.copy_(bias)
+    linear.qconfig = _int8_qconfig()
+    return nnqd.Linear.from_float(linear)
+
+
+def _output_scale_zeropoint(x, input_range=None):
+    """  Scale and zero-point used by _Quant layers to transform their output
+
+    The simulated quantisation layers calculate a 4-bit scale and zero-point
+    from the range of their input and apply it to their output, see
+    :func:`quantize_tensor` and :func:`dequantize`.  The int8 versions of the
+    layers must do the same to agree with the layers they were converted from.
+
+    Args:
+        x (:torch:`Tensor`): input to layer
+        input_range (tuple of float and float, optional): range of input
+            determined by calibration, see
+            :func:`taiyaki.quantization.calibrate`.  If None, the range of
+            `x` is used and the output depends on the other inputs in the
+            batch.
+
+    Returns:
+        tuple of :torch:`Tensor` and :torch:`Tensor`: scale and zero-point
+    """
+    if input_range is not None:
+        return calc_scale_zeropoint(*input_range)
+    return calc_scale_zeropoint(x.min(), x.max())
+
+
+def _register_blocksparse(module, name, weight):
+    """  Store matrix in block sparse format as buffers of module
+
+    Args:
+        module (:nn:`Module`): module to store matrix in
+        name (str): prefix for names of buffers
+        weight (:torch:`Tensor`): dense matrix
+
+    Returns:
+        None: buffers `<name>_rowptr`, `<name>_col` and `<name>_val` of
+            `module` created or replaced.
+    """
+    rowptr, col, val = sparse.from_dense(weight.detach().cpu().numpy())
+    module.register_buffer(name + '_rowptr', torch.from_numpy(rowptr))
+    module.register_buffer(name + '_col', torch.from_numpy(col))
+    module.register_buffer(name + '_val', torch.from_numpy(val))
+
+
+def _get_blocksparse(module, name):
+    """  Retrieve matrix stored by :func:`_register_blocksparse`
+
+    Args:
+        module (:nn:`Module`): module matrix is stored in
+        name (str): prefix for names of buffers
+
+    Returns:
+        tuple of :class:`ndarray`: block sparse matrix, see
+            :func:`taiyaki.sparse.from_dense`.
+    """
+    return tuple(getattr(module, name + suffix).numpy()
+                 for suffix in ('_rowptr', '_col', '_val'))
+
+
+def _blocksparse_density(module, name, nrow, ncol):
+    """  Fraction of matrix stored by :func:`_register_blocksparse` in blocks
+
+    Args:
+        module (:nn:`Module`): module matrix is stored in
+        name (str): prefix for names of buffers
+        nrow (int): number of rows of matrix
+        ncol (int): number of columns of matrix
+
+    Returns:
+        float: number of elements in stored blocks, as a fraction of the
+            size of the dense matrix.
+    """
+    return getattr(module, name + '_val').numel() / float(nrow * ncol)
+
+
+def _batch_last(x, ncol):
+    """  Copy input to array with batch last, padded for sparse kernels
+
+    Args:
+        x (:torch:`Tensor`): input, time x batch x features
+        ncol (int): number of elements of padded batch, a multiple of
+            :data:`taiyaki.sparse.TILE`.
+
+    Returns:
+        :class:`ndarray`: array time x features x ncol, elements past the
+            batch size are zero.
+    """
+    nt, nbatch, nfeature = x.shape
+    res = np.zeros((nt, nfeature, ncol), dtype=np.float32)
+    res[:, :, :nbatch] = x.detach().cpu().numpy().transpose(0, 2, 1)
+    return res
+
+
 """  Convention: inMat row major (C ordering) as (time, batch, state)
 """
 _FORGET_BIAS = 2.0
@@ -818,6 +948,220 @@ class GruMod_Quant(nn.Module):
         return res
 
 
+class GruMod_Int8(nn.Module):
+    """  Integer inference version of :class:`GruMod_Quant`
+
+    Weights are stored as int8 with per-channel scale and zero-point and the
+    matrix multiplications are performed in integer arithmetic using the
+    dynamically quantised GRU from PyTorch.  Output is transformed in the same
+    way as :class:`GruMod_Quant`.  For inference only; create using
+    :meth:`from_float`.
+
+    Attributes:
+        gru (:nn:`Module`): Dynamically quantised Pytorch GRU module
+        insize (int):  Size (number of neurons) expected in layer input.
+        size (int):  Size (number of neurons) of layer output.
+        has_bias (bool): Whether layer has bias.
+        input_range (tuple of float and float): Range of input used to
+            transform output, or None to use range of each input.
+    """
+
+    def __init__(self, insize, size, has_bias=True):
+        """  Constructor for `GruMod_Int8` layer
+
+        Args:
+            insize (int):  Size (number of neurons) of layer input.
+            size (int):  Size(number of neurons) of layer output.
+            has_bias (bool, optional): Whether layer has bias.
+        """
+        super().__init__()
+        if not hasattr(nnqd, 'GRU'):
+            raise NotImplementedError(
+                'Dynamically quantised GRU not available in this version ' +
+                'of PyTorch')
+        self.insize = insize
+        self.size = size
+        self.has_bias = has_bias
+        #  Bias is always present in quantised GRU, zero if not used
+        self.gru = nnqd.GRU(insize, size)
+        self.input_range = None
+
+    @classmethod
+    def from_float(cls, layer):
+        """  Create int8 layer from a trained layer
+
+        Args:
+            layer (:class:`GruMod_Quant`): Layer to convert
+
+        Returns:
+            :class:`GruMod_Int8`: converted layer
+        """
+        res = cls(layer.insize, layer.size, layer.has_bias)
+        gru = nn.GRU(layer.insize, layer.size)
+        with torch.no_grad():
+            for name, param in gru.named_parameters():
+                if hasattr(layer.cudnn_gru, name):
+                    param.copy_(getattr(layer.cudnn_gru, name))
+                else:
+                    param.zero_()
+        gru.qconfig = _int8_qconfig()
+        res.gru = nnqd.GRU.from_float(gru)
+        return res
+
+    def forward(self, x):
+        """  Forward method for layer
+
+        Args:
+            x (:torch:`Tensor`):  Input to layer
+
+        Returns:
+            :torch:`Tensor`: Output of layer
+        """
+        scale, zero_point = _output_scale_zeropoint(x, self.input_range)
+        y, _ = self.gru(x)
+        return dequantize(y, scale, zero_point)
+
+    def json(self):
+        """  Create structured output describing layer for converting to json
+
+        Weights are dequantised.
+
+        Returns:
+            :collections:`OrderedDict`: Structured description of layer.
+        """
+        weights = self.gru.get_weight()
+        biases = self.gru.get_bias()
+        res = OrderedDict([('type', "GruMod_Quant"),
+                           ('activation', "tanh"),
+                           ('gate', "sigmoid"),
+                           ('size', self.size),
+                           ('insize', self.insize),
+                           ('bias', self.has_bias)])
+        iW = _cudnn_to_guppy_gru(weights['weight_ih_l0'].dequantize())
+        sW = _cudnn_to_guppy_gru(weights['weight_hh_l0'].dequantize())
+        b = _cudnn_to_guppy_gru(biases['bias_ih_l0'])
+        res['params'] = OrderedDict([
+            ('iW', _reshape(iW, (3, self.size, self.insize))),
+            ('sW', _reshape(sW, (3, self.size, self.size))),
+            ('b', _reshape(b, (3, self.size)))])
+        return res
+
+
+class GruMod_Sparse(nn.Module):
+    """  Sparse inference version of :class:`GruMod_Quant`
+
+    Weights are stored in the block sparse format of :mod:`taiyaki.sparse`
+    and the layer is run by a native kernel that skips blocks of weights that
+    are zero, so layers pruned with :mod:`taiyaki.pruning` run faster.  Output
+    is transformed in the same way as :class:`GruMod_Quant`.  For inference
+    on the CPU only; create using :meth:`from_float`.
+
+    Attributes:
+        insize (int):  Size (number of neurons) expected in layer input.
+        size (int):  Size (number of neurons) of layer output.
+        has_bias (bool): Whether layer has bias.
+        input_range (tuple of float and float): Range of input used to
+            transform output, or None to use range of each input.
+    """
+
+    def __init__(self, insize, size, has_bias=True):
+        """  Constructor for `GruMod_Sparse` layer
+
+        Args:
+            insize (int):  Size (number of neurons) of layer input.
+            size (int):  Size(number of neurons) of layer output.
+            has_bias (bool, optional): Whether layer has bias.
+        """
+        super().__init__()
+        if not _sparse_is_available:
+            raise NotImplementedError(
+                'Native sparse kernels from taiyaki.sparse not available')
+        self.insize = insize
+        self.size = size
+        self.has_bias = has_bias
+        _register_blocksparse(self, 'weight_ih', torch.zeros(3 * size, insize))
+        _register_blocksparse(self, 'weight_hh', torch.zeros(3 * size, size))
+        self.register_buffer('bias_ih', torch.zeros(3 * size))
+        self.register_buffer('bias_hh', torch.zeros(3 * size))
+        self.input_range = None
+
+    @classmethod
+    def from_float(cls, layer):
+        """  Create sparse layer from a trained layer
+
+        Args:
+            layer (:class:`GruMod_Quant`): Layer to convert
+
+        Returns:
+            :class:`GruMod_Sparse`: converted layer
+        """
+        res = cls(layer.insize, layer.size, layer.has_bias)
+        gru = layer.cudnn_gru
+        _register_blocksparse(res, 'weight_ih', gru.weight_ih_l0)
+        _register_blocksparse(res, 'weight_hh', gru.weight_hh_l0)
+        if layer.has_bias:
+            res.bias_ih.copy_(gru.bias_ih_l0.detach())
+            res.bias_hh.copy_(gru.bias_hh_l0.detach())
+        return res
+
+    def density(self):
+        """  Fraction of weights that are stored and used in calculation
+
+        Returns:
+            float: density of weights
+        """
+        stored = (
+            _blocksparse_density(self, 'weight_ih', 3 * self.size,
+                                 self.insize) * self.insize +
+            _blocksparse_density(self, 'weight_hh', 3 * self.size,
+                                 self.size) * self.size)
+        return stored / (self.insize + self.size)
+
+    def forward(self, x):
+        """  Forward method for layer
+
+        Args:
+            x (:torch:`Tensor`):  Input to layer
+
+        Returns:
+            :torch:`Tensor`: Output of layer
+        """
+        scale, zero_point = _output_scale_zeropoint(x, self.input_range)
+        nbatch = x.shape[1]
+        ncol = nbatch + (-nbatch) % sparse.TILE
+        y = sparse.gru(_batch_last(x, ncol), self.size,
+                       _get_blocksparse(self, 'weight_hh'),
+                       self.bias_hh.numpy(),
+                       _get_blocksparse(self, 'weight_ih'),
+                       self.bias_ih.numpy())
+        y = torch.from_numpy(y[:, :, :nbatch]).permute(0, 2, 1)
+        return dequantize(y, scale, zero_point)
+
+    def json(self):
+        """  Create structured output describing layer for converting to json
+
+        Returns:
+            :collections:`OrderedDict`: Structured description of layer.
+        """
+        insize, size = self.insize, self.size
+        iW = torch.from_numpy(sparse.to_dense(
+            _get_blocksparse(self, 'weight_ih'), insize)[:3 * size])
+        sW = torch.from_numpy(sparse.to_dense(
+            _get_blocksparse(self, 'weight_hh'), size)[:3 * size])
+        res = OrderedDict([('type', "GruMod_Quant"),
+                           ('activation', "tanh"),
+                           ('gate', "sigmoid"),
+                           ('size', size),
+                           ('insize', insize),
+                           ('bias', self.has_bias)])
+        res['params'] = OrderedDict([
+            ('iW', _reshape(_cudnn_to_guppy_gru(iW), (3, size, insize))),
+            ('sW', _reshape(_cudnn_to_guppy_gru(sW), (3, size, size))),
+            ('b', _reshape(_cudnn_to_guppy_gru(self.bias_ih.clone()),
+                           (3, size)))])
+        return res
+
+
 def _cudnn_to_guppy_gru(p):
     """  Reorder GRU params from CUDNN to Guppy ordering
 
@@ -970,6 +1314,240 @@ class Convolution_Quant(nn.Module):
         return res
 
 
+class Convolution_Int8(nn.Module):
+    """  Integer inference version of :class:`Convolution_Quant`
+
+    The convolution is performed as a matrix multiplication over windows of
+    the input, with int8 weights (per-channel scale and zero-point) and
+    dynamically quantised input.  Output is transformed in the same way as
+    :class:`Convolution_Quant`.  For inference only; create using
+    :meth:`from_float`.
+
+    Attributes:
+        has_bias (bool): Whether layer has bias.
+        insize (int):  number of features in expected input tensor
+        size (int): number of feature in output tensor
+        winlen (int): size of window over input
+        stride (int): step size between successive windows.
+        padding (tuple of int and int): padding applied to start and
+            end of input.
+        pad (:nn:`Module`):  Pytorch module applying `padding` to time
+            dimension of input Tensor.
+        linear (:nn:`Module`):  Dynamically quantised linear transform
+            applied to each window of input.
+        activation (<function>): function applying activation elementwise to
+            result of convolution.
+        input_range (tuple of float and float): Range of input used to
+            transform output, or None to use range of each input.
+    """
+
+    def __init__(self, insize, size, winlen, stride=1, pad=None,
+                 fun=activation.tanh, has_bias=True):
+        """  Constructor for `Convolution_Int8` layer
+
+        See :class:`Convolution_Quant` for description of arguments.
+        """
+        super().__init__()
+        self.has_bias = has_bias
+        self.insize = insize
+        self.size = size
+        self.stride = stride
+        self.winlen = winlen
+        if pad is None:
+            pad = (winlen // 2, (winlen - 1) // 2)
+        self.padding = pad
+        self.pad = nn.ConstantPad1d(pad, 0)
+        self.linear = _int8_linear(torch.zeros(size, insize * winlen),
+                                   torch.zeros(size) if has_bias else None)
+        self.activation = fun
+        self.input_range = None
+
+    @classmethod
+    def from_float(cls, layer):
+        """  Create int8 layer from a trained layer
+
+        Args:
+            layer (:class:`Convolution_Quant`): Layer to convert
+
+        Returns:
+            :class:`Convolution_Int8`: converted layer
+        """
+        res = cls(layer.insize, layer.size, layer.winlen, layer.stride,
+                  layer.padding, layer.activation, layer.has_bias)
+        weight = layer.conv.weight.detach()
+        res.linear = _int8_linear(
+            weight.reshape(weight.shape[0], -1),
+            layer.conv.bias.detach() if layer.has_bias else None)
+        return res
+
+    def forward(self, x):
+        """  Forward method for layer
+
+        Args:
+            x (:torch:`Tensor`):  Input to layer
+
+        Returns:
+            :torch:`Tensor`: Output of layer
+        """
+        scale, zero_point = _output_scale_zeropoint(x, self.input_range)
+        #  Windows of padded input, batch x time x (features * winlen)
+        windows = self.pad(x.permute(1, 2, 0)).unfold(
+            2, self.winlen, self.stride).permute(0, 2, 1, 3)
+        windows = windows.reshape(windows.shape[:2] + (-1,))
+        out = self.activation(self.linear(windows))
+        out = dequantize(out, scale, zero_point)
+        return out.permute(1, 0, 2)
+
+    def json(self):
+        """  Create structured output describing layer for converting to json
+
+        Weights are dequantised.
+
+        Returns:
+            :collections:`OrderedDict`: Structured description of layer.
+        """
+        weight = self.linear.weight().dequantize().reshape(
+            self.size, self.insize, self.winlen).clone()
+        res = OrderedDict([("type", "convolution_Quant"),
+                           ("insize", self.insize),
+                           ("size", self.size),
+                           ("bias", self.has_bias),
+                           ("winlen", self.winlen),
+                           ("stride", self.stride),
+                           ("padding", self.padding),
+                           ("activation", self.activation.__name__)])
+        res['params'] = OrderedDict(
+            [("W", weight)] +
+            ([("b", self.linear.bias())] if self.has_bias else []))
+        return res
+
+
+class Convolution_Sparse(nn.Module):
+    """  Sparse inference version of :class:`Convolution_Quant`
+
+    The convolution is performed as a matrix multiplication over windows of
+    the input, with weights stored in the block sparse format of
+    :mod:`taiyaki.sparse` so blocks of weights that are zero are skipped.
+    Output is transformed in the same way as :class:`Convolution_Quant`.  For
+    inference on the CPU only; create using :meth:`from_float`.
+
+    Attributes:
+        has_bias (bool): Whether layer has bias.
+        insize (int):  number of features in expected input tensor
+        size (int): number of feature in output tensor
+        winlen (int): size of window over input
+        stride (int): step size between successive windows.
+        padding (tuple of int and int): padding applied to start and
+            end of input.
+        pad (:nn:`Module`):  Pytorch module applying `padding` to time
+            dimension of input Tensor.
+        activation (<function>): function applying activation elementwise to
+            result of convolution.
+        input_range (tuple of float and float): Range of input used to
+            transform output, or None to use range of each input.
+    """
+
+    def __init__(self, insize, size, winlen, stride=1, pad=None,
+                 fun=activation.tanh, has_bias=True):
+        """  Constructor for `Convolution_Sparse` layer
+
+        See :class:`Convolution_Quant` for description of arguments.
+        """
+        super().__init__()
+        if not _sparse_is_available:
+            raise NotImplementedError(
+                'Native sparse kernels from taiyaki.sparse not available')
+        self.has_bias = has_bias
+        self.insize = insize
+        self.size = size
+        self.stride = stride
+        self.winlen = winlen
+        if pad is None:
+            pad = (winlen // 2, (winlen - 1) // 2)
+        self.padding = pad
+        self.pad = nn.ConstantPad1d(pad, 0)
+        _register_blocksparse(self, 'weight', torch.zeros(size,
+                                                          insize * winlen))
+        self.register_buffer('bias', torch.zeros(size))
+        self.activation = fun
+        self.input_range = None
+
+    @classmethod
+    def from_float(cls, layer):
+        """  Create sparse layer from a trained layer
+
+        Args:
+            layer (:class:`Convolution_Quant`): Layer to convert
+
+        Returns:
+            :class:`Convolution_Sparse`: converted layer
+        """
+        res = cls(layer.insize, layer.size, layer.winlen, layer.stride,
+                  layer.padding, layer.activation, layer.has_bias)
+        weight = layer.conv.weight
+        _register_blocksparse(res, 'weight',
+                              weight.reshape(weight.shape[0], -1))
+        if layer.has_bias:
+            res.bias.copy_(layer.conv.bias.detach())
+        return res
+
+    def density(self):
+        """  Fraction of weights that are stored and used in calculation
+
+        Returns:
+            float: density of weights
+        """
+        return _blocksparse_density(self, 'weight', self.size,
+                                    self.insize * self.winlen)
+
+    def forward(self, x):
+        """  Forward method for layer
+
+        Args:
+            x (:torch:`Tensor`):  Input to layer
+
+        Returns:
+            :torch:`Tensor`: Output of layer
+        """
+        scale, zero_point = _output_scale_zeropoint(x, self.input_range)
+        #  Windows of padded input, (features * winlen) x time x batch
+        windows = self.pad(x.permute(1, 2, 0)).unfold(
+            2, self.winlen, self.stride).permute(1, 3, 2, 0)
+        nt, nbatch = windows.shape[2:]
+        windows = windows.reshape(-1, nt * nbatch)
+        ncol = windows.shape[1] + (-windows.shape[1]) % sparse.TILE
+        #  Matrix multiplication needs columns padded to multiple of TILE
+        xs = np.zeros((windows.shape[0], ncol), dtype=np.float32)
+        xs[:, :windows.shape[1]] = windows.detach().cpu().numpy()
+        out = sparse.matmul(_get_blocksparse(self, 'weight'), xs)
+        out = torch.from_numpy(out[:self.size, :nt * nbatch])
+        out = out.reshape(self.size, nt, nbatch).permute(1, 2, 0)
+        out = self.activation(out + self.bias)
+        return dequantize(out, scale, zero_point)
+
+    def json(self):
+        """  Create structured output describing layer for converting to json
+
+        Returns:
+            :collections:`OrderedDict`: Structured description of layer.
+        """
+        weight = sparse.to_dense(_get_blocksparse(self, 'weight'),
+                                 self.insize * self.winlen)[:self.size]
+        res = OrderedDict([("type", "convolution_Quant"),
+                           ("insize", self.insize),
+                           ("size", self.size),
+                           ("bias", self.has_bias),
+                           ("winlen", self.winlen),
+                           ("stride", self.stride),
+                           ("padding", self.padding),
+                           ("activation", self.activation.__name__)])
+        res['params'] = OrderedDict(
+            [("W", torch.from_numpy(weight.reshape(
+                self.size, self.insize, self.winlen)))] +
+            ([("b", self.bias.clone())] if self.has_bias else []))
+        return res
+
+
 class Parallel(nn.Module):
     """  Apply several layers to same input and concatenate results
 
@@ -1553,6 +2131,97 @@ class GlobalNormFlipFlop_Quant(nn.Module):
         return dequantize(y,scale,zero_point)
 
 
+class GlobalNormFlipFlop_Int8(nn.Module):
+    """  Integer inference version of :class:`GlobalNormFlipFlop_Quant`
+
+    Weights are stored as int8 with per-channel scale and zero-point and the
+    linear transform is performed in integer arithmetic with dynamically
+    quantised input.  Output is transformed in the same way as
+    :class:`GlobalNormFlipFlop_Quant`.  For inference only; create using
+    :meth:`from_float`.
+
+    Attributes:
+        insize (int):  Size (number of features) expected for input tensor
+        nbase (int):  Number bases
+        size (int):  Size of output tensor
+        activation (<function>):  Function that applies elementwise activation
+            to output of linear transform.
+        has_bias (bool):  Whether layer has bias.
+        linear (:nn:`Module`):  Dynamically quantised linear transform.
+        scale (float):  Scaling factor to apply.
+        input_range (tuple of float and float): Range of input used to
+            transform output, or None to use range of each input.
+    """
+
+    def __init__(self, insize, nbase, has_bias=True,
+                 fun=activation.tanh, scale=5.0):
+        """  Constructor for `GlobalNormFlipFlop_Int8` layer
+
+        See :class:`GlobalNormFlipFlop_Quant` for description of arguments.
+        """
+        super().__init__()
+        self.insize = insize
+        self.nbase = nbase
+        self.size = flipflopfings.nstate_flipflop(nbase)
+        self.activation = fun
+        self.has_bias = has_bias
+        self.linear = _int8_linear(torch.zeros(self.size, insize),
+                                   torch.zeros(self.size) if has_bias
+                                   else None)
+        self.scale = scale
+        self.input_range = None
+
+    @classmethod
+    def from_float(cls, layer):
+        """  Create int8 layer from a trained layer
+
+        Args:
+            layer (:class:`GlobalNormFlipFlop_Quant`): Layer to convert
+
+        Returns:
+            :class:`GlobalNormFlipFlop_Int8`: converted layer
+        """
+        res = cls(layer.insize, layer.nbase, layer.has_bias,
+                  layer.activation, layer.scale)
+        res.linear = _int8_linear(
+            layer.linear.weight.detach(),
+            layer.linear.bias.detach() if layer.has_bias else None)
+        return res
+
+    def json(self):
+        """  Create structured output describing layer for converting to json
+
+        Weights are dequantised.
+
+        Returns:
+            :collections:`OrderedDict`: Structured description of layer.
+        """
+        res = OrderedDict([
+            ('type', 'GlobalNormTwoState'),
+            ('size', self.size),
+            ('insize', self.insize),
+            ('bias', self.has_bias),
+            ('scale', self.scale),
+            ("activation", self.activation.__name__)])
+        res['params'] = OrderedDict(
+            [('W', self.linear.weight().dequantize())] +
+            ([('b', self.linear.bias())] if self.has_bias else []))
+        return res
+
+    def forward(self, x):
+        """  Forward method for layer
+
+        Args:
+            x (:torch:`Tensor`):  Input to layer
+
+        Returns:
+            :torch:`Tensor`: Output of layer
+        """
+        scale, zero_point = _output_scale_zeropoint(x, self.input_range)
+        y = self.scale * self.activation(self.linear(x))
+        return dequantize(y, scale, zero_point)
+
+
 class GlobalNormFlipFlopCatMod(nn.Module):
     """ Flip-flop layer with additional modified base output stream
 
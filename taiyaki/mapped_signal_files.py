@@ -5,11 +5,14 @@
 # (for example, Per_read_Fast5 or Per_read_SQLite)
 
 from abc import ABC, abstractmethod
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import h5py
+from itertools import islice
 import numpy as np
+import os
 import posixpath
 import sys
+import tempfile
 
 from taiyaki.alphabet import AlphabetInfo
 from taiyaki.signal_mapping import SignalMapping
@@ -20,6 +23,8 @@ READS_ROOT_TEXT = 'Reads'
 BATCH_ROOT_TEXT = 'Batches'
 BATCH_TMPLT = 'Batch_{}'
 BATCH_LENGTH_SUFFIX = '_lengths'
+COLUMN_ROOT_TEXT = 'Columns'
+COLUMN_OFFSETS_SUFFIX = '_offsets'
 VAR_LEN_STR_DT = h5py.special_dtype(vlen=str)
 
 
@@ -678,11 +683,384 @@ class BatchHDF5Writer(AbstractMappedSignalWriter):
         self.hdf5.attrs['version'] = _version
 
 
+def _data_type(key):
+    """ Type of a field of :class:`signal_mapping.SignalMapping`
+
+    Args:
+        key (str): name of field.
+
+    Returns:
+        type: numpy dtype for array fields, otherwise python type.
+    """
+    if key in SignalMapping.req_data_types._fields:
+        return getattr(SignalMapping.req_data_types, key)
+    return getattr(SignalMapping.opt_data_types, key)
+
+
+def _memmap_dataset(filename, dataset):
+    """ Map contents of a contiguous, uncompressed HDF5 dataset into memory
+
+    Args:
+        filename (str): name of file containing dataset.
+        dataset (:class:`h5py.Dataset`): dataset to map.
+
+    Returns:
+        :class:`np.memmap`: read-only view of dataset.  An empty array is
+            returned if storage for the dataset has not been allocated.
+    """
+    assert dataset.chunks is None and dataset.compression is None, \
+        'Dataset {} must be contiguous to be memory mapped'.format(
+            dataset.name)
+    offset = dataset.id.get_offset()
+    if offset is None:
+        return np.zeros(dataset.shape, dtype=dataset.dtype)
+    return np.memmap(filename, mode='r', dtype=dataset.dtype, offset=offset,
+                     shape=dataset.shape)
+
+
+class ColumnarHDF5Reader(AbstractMappedSignalReader):
+    """ A file storing mapped data as flat columns so that any read can be
+    accessed without decoding any other.
+
+    NOT using a derivative of the fast5 format.
+    This is an HDF5 file with structure below.
+    version is an attr, and the read data are stored in a single
+    "Columns" group.
+
+    Global level attributes are version, alphabet, collapse_alphabet, and
+    mod_long_names.  Each array field of the reads, e.g. Dacs, is stored
+    concatenated over reads as a single contiguous and uncompressed dataset,
+    which is memory mapped, alongside a dataset of the offset of each read
+    into it (suffixed "_offsets").  Scalar fields are stored as a dataset
+    with one element per read and loaded into memory when the file is opened.
+
+    Attributes:
+        hdf5 (:class:`h5py.File`): File handle of HDF5 file
+        version (int): Version of file
+        read_id_to_row (dict): mapping from read ID string to index of read
+            in columns
+    """
+
+    def __init__(self, filename):
+        """ Open file and initialise
+
+        Args:
+            filename (str): name of file to open.
+        """
+        self.hdf5 = h5py.File(filename, 'r')
+        assert self.version == _version, (
+            'Incorrect file version, got {} expected {}').format(
+                self.version, _version)
+        columns = self.hdf5[COLUMN_ROOT_TEXT]
+        self._arrays, self._offsets, self._scalars = {}, {}, {}
+        for k, ds in columns.items():
+            if k.endswith(COLUMN_OFFSETS_SUFFIX):
+                continue
+            k_type = _data_type(k)
+            if k_type.__module__ == 'numpy':
+                self._arrays[k] = _memmap_dataset(filename, ds)
+                self._offsets[k] = columns[k + COLUMN_OFFSETS_SUFFIX][()]
+            elif k_type is str:
+                #  h5py >= 3 reads variable length strings as bytes
+                if hasattr(ds, 'asstr'):
+                    ds = ds.asstr()
+                self._scalars[k] = ds[()].tolist()
+            else:
+                self._scalars[k] = ds[()].tolist()
+        self.read_id_to_row = {read_id: i for i, read_id in enumerate(
+            self._scalars.get('read_id', []))}
+
+    def __iter__(self):
+        self.rows_iter = iter(range(len(self.read_id_to_row)))
+        return self
+
+    def __next__(self):
+        return self._get_read(next(self.rows_iter))
+
+    def _some_reads(self, read_ids):
+        rows = sorted(self.read_id_to_row[read_id] for read_id in
+                      set(read_ids).intersection(self.read_id_to_row))
+        for row in rows:
+            yield self._get_read(row)
+
+    def close(self):
+        #  Views of memory mapped columns may outlive the file
+        self._arrays = {}
+        self.hdf5.close()
+
+    def get_read(self, read_id):
+        return self._get_read(self.read_id_to_row[read_id])
+
+    def _get_read(self, row):
+        """ Return a read object containing all elements of the read.
+
+        Args:
+            row (int): index of read in columns
+
+        Returns:
+            :class:`signal_mapping.SignalMapping`: information about read
+                mapping.
+        """
+        d = {k: v[row] for k, v in self._scalars.items()}
+        for k, v in self._arrays.items():
+            start, end = self._offsets[k][row:row + 2]
+            d[k] = np.array(v[start:end])
+        return SignalMapping(**d)
+
+    def get_read_ids(self):
+        return list(self.read_id_to_row.keys())
+
+    def get_alphabet_information(self):
+        mod_long_names = self.hdf5.attrs['mod_long_names'].splitlines()
+        return AlphabetInfo(
+            self.hdf5.attrs['alphabet'], self.hdf5.attrs['collapse_alphabet'],
+            mod_long_names)
+
+    @property
+    def version(self):
+        return self.hdf5.attrs['version']
+
+
+class ColumnarHDF5Writer(AbstractMappedSignalWriter):
+    """ A file storing mapped data as flat columns so that any read can be
+    accessed without decoding any other.  See :class:`ColumnarHDF5Reader`
+    for the structure of the file.
+
+    Array fields are appended to temporary files, alongside the output, as
+    reads are written and copied into the HDF5 file when it is closed, since
+    a dataset must have a fixed size to be stored contiguously.
+
+    Attributes:
+       hdf5 (:class:`h5py.File`):  File handle of HDF5 file to write to
+       read_ids (list): Read ID written to file.
+    """
+    #  Number of elements copied from temporary files at once
+    copy_block_size = 1 << 24
+
+    def __init__(self, filename, alphabet_info):
+        """ Open file and initialise
+
+        Args:
+            filename (str): name of file to open.
+            alphabet_info (:class:`alphabet.AlphabetInfo`):  Alphabet to write
+        """
+        # mode 'w' to preserve behaviour, 'x' would be more appropraite
+        self.hdf5 = h5py.File(filename, 'w')
+        self._write_version()
+        self._write_alphabet_info(alphabet_info)
+        self.read_ids = []
+        self._tmpdir = os.path.dirname(os.path.abspath(filename))
+        #  Temporary file and lengths of each read for array fields
+        self._arrays, self._lengths = {}, {}
+        #  Values of each read for scalar fields
+        self._scalars = {}
+
+    def close(self):
+        g = self.hdf5.create_group(COLUMN_ROOT_TEXT)
+        for k, tmp in self._arrays.items():
+            k_type = np.dtype(_data_type(k))
+            offsets = np.zeros(len(self.read_ids) + 1, dtype=np.int64)
+            np.cumsum(self._lengths[k], out=offsets[1:])
+            ds = g.create_dataset(k, (offsets[-1],), dtype=k_type)
+            tmp.seek(0)
+            for start in range(0, offsets[-1], self.copy_block_size):
+                block = np.frombuffer(
+                    tmp.read(self.copy_block_size * k_type.itemsize),
+                    dtype=k_type)
+                ds[start:start + len(block)] = block
+            tmp.close()
+            g.create_dataset(k + COLUMN_OFFSETS_SUFFIX, data=offsets)
+        for k, vals in self._scalars.items():
+            if _data_type(k) is str:
+                vals = np.array(vals, dtype=VAR_LEN_STR_DT)
+                k_ds = g.create_dataset(k, vals.shape, dtype=VAR_LEN_STR_DT)
+                k_ds[...] = vals
+            else:
+                g.create_dataset(k, data=np.array(vals, dtype=_data_type(k)))
+
+        self.hdf5.close()
+
+    def write_read(self, readdict):
+        nread = len(self.read_ids)
+        self.read_ids.append(readdict['read_id'])
+        for k, v in readdict.items():
+            k_type = _data_type(k)
+            if k_type.__module__ == 'numpy':
+                if k not in self._arrays:
+                    self._arrays[k] = tempfile.TemporaryFile(
+                        dir=self._tmpdir)
+                    self._lengths[k] = [0] * nread
+                self._arrays[k].write(
+                    np.ascontiguousarray(v, dtype=k_type).tobytes())
+                self._lengths[k].append(len(v))
+            else:
+                if k not in self._scalars:
+                    self._scalars[k] = ['' if k_type is str else 0] * nread
+                self._scalars[k].append(v)
+        # fill in fields missing from this read
+        for k, lengths in self._lengths.items():
+            if len(lengths) == nread:
+                lengths.append(0)
+        for k, vals in self._scalars.items():
+            if len(vals) == nread:
+                vals.append('' if _data_type(k) is str else 0)
+
+    def _write_alphabet_info(self, alphabet_info):
+        self.hdf5.attrs['alphabet'] = alphabet_info.alphabet
+        self.hdf5.attrs['collapse_alphabet'] = alphabet_info.collapse_alphabet
+        self.hdf5.attrs['mod_long_names'] = '\n'.join(
+            alphabet_info.mod_long_names)
+
+    def _write_version(self):
+        self.hdf5.attrs['version'] = _version
+
+
+class MappedReadCollection(object):
+    """ Sequence of the reads in a mapped signal file, supporting `len` and
+    indexing as a list of :class:`signal_mapping.SignalMapping` would.
+
+    Reads are either all loaded when the collection is created or, if
+    `cache_size` is given, loaded from the file when indexed.  The most
+    recently used `cache_size` reads are kept, so memory used scales with
+    the reads in use rather than the size of the file.  The file is closed
+    once the collection has been created and is opened, when reads are next
+    loaded, separately in each process using the collection.  A collection
+    sent to another process does not take its cache with it.
+
+    Random access is fastest for files in columnar format, see
+    :class:`ColumnarHDF5Reader`; each read loaded from a batched file
+    requires its whole batch to be read.
+
+    Attributes:
+        filename (str): name of mapped signal file.
+        read_ids (list of str): ID of each read in collection, in order.
+        cache_size (int or None): number of reads kept in memory, or None if
+            all reads are loaded.
+    """
+
+    def __init__(self, filename, read_ids=None, limit=None, cache_size=None):
+        """ Find reads in file and, unless `cache_size` is set, load them
+
+        Args:
+            filename (str): name of mapped signal file.
+            read_ids (list of str, optional): IDs of reads to include.
+                Default: all reads in file.
+            limit (int, optional): Maximum number of reads to include.
+            cache_size (int, optional): Load reads when used, keeping at most
+                this many in memory.  Default: load all reads.
+        """
+        self.filename = filename
+        self.cache_size = cache_size
+        self._reads = None
+        self._reset()
+        msr = self._reader()
+        self._alphabet_info = msr.get_alphabet_information()
+        if cache_size is None:
+            self._reads = list(islice(msr.reads(read_ids), limit))
+            self.read_ids = [read.read_id for read in self._reads]
+        else:
+            self.read_ids = msr.get_read_ids()
+            if read_ids is not None:
+                read_ids = frozenset(read_ids)
+                self.read_ids = [read_id for read_id in self.read_ids
+                                 if read_id in read_ids]
+            self.read_ids = self.read_ids[:limit]
+        self.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_msr'], state['_cache'], state['_pid']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def __getitem__(self, i):
+        if self._reads is not None:
+            return self._reads[i]
+        read_id = self.read_ids[i]
+        if os.getpid() != self._pid:
+            #  Process has been forked, handle to file cannot be shared
+            self._reset()
+        try:
+            self._cache.move_to_end(read_id)
+            return self._cache[read_id]
+        except KeyError:
+            read = self._reader().get_read(read_id)
+            self._cache[read_id] = read
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return read
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __len__(self):
+        return len(self.read_ids)
+
+    def _reader(self):
+        """ Reader for file, opened on first use in each process
+
+        Returns:
+            :class:`AbstractMappedSignalReader`
+        """
+        if self._msr is None:
+            self._msr = MappedSignalReader(self.filename)
+        return self._msr
+
+    def _reset(self):
+        """ Forget handle to file and cached reads """
+        self._msr = None
+        self._cache = OrderedDict()
+        self._pid = os.getpid()
+
+    def close(self):
+        """ Close file, if open, and empty cache.  The file is reopened if
+        further reads are required.
+        """
+        if self._msr is not None and self._pid == os.getpid():
+            self._msr.close()
+        self._reset()
+
+    def get_alphabet_information(self):
+        """ Get information about alphabet of mapping, read when the
+        collection was created
+
+        Returns:
+            :class:`alphabet.AlphabetInfo`
+        """
+        return self._alphabet_info
+
+    def subset(self, read_ids):
+        """ Collection of some reads of this one
+
+        Args:
+            read_ids (iterable of str): IDs of reads to include.
+
+        Returns:
+            :class:`MappedReadCollection`: collection containing reads in
+                `read_ids`, in the order they occur in this collection.  If
+                reads have been loaded, they are shared with this collection.
+        """
+        read_ids = frozenset(read_ids)
+        subset = MappedReadCollection.__new__(MappedReadCollection)
+        subset.__setstate__({
+            'filename': self.filename, 'cache_size': self.cache_size,
+            '_alphabet_info': self._alphabet_info,
+            'read_ids': [read_id for read_id in self.read_ids
+                         if read_id in read_ids],
+            '_reads': None if self._reads is None else [
+                read for read in self._reads if read.read_id in read_ids]})
+        return subset
+
+
 def HDF5Reader(filename, load_in_mem=False):
     """ A file should contain mapped signal data written by the
     :class:`HDF5Writer`.
-    This function opens either a per-read or batched HDF5 file for reading
-    signal mappings.
+    This function opens either a per-read, batched or columnar HDF5 file for
+    reading signal mappings.
 
     Args:
         filename (str): name of file to open.
@@ -691,24 +1069,25 @@ def HDF5Reader(filename, load_in_mem=False):
             per-read format files.
 
     Returns:
-        Either :class:`PerReadHDF5Reader` or :class:`BatchHDF5Reader` object
+        Either :class:`PerReadHDF5Reader`, :class:`BatchHDF5Reader` or
+            :class:`ColumnarHDF5Reader` object
     """
     with h5py.File(filename, 'r') as map_sig_hdf5:
-        try:
-            _ = map_sig_hdf5[BATCH_ROOT_TEXT]
-            is_batch = True
-        except KeyError:
-            is_batch = False
+        is_batch = BATCH_ROOT_TEXT in map_sig_hdf5
+        is_columnar = COLUMN_ROOT_TEXT in map_sig_hdf5
 
     if is_batch:
         return BatchHDF5Reader(filename)
+    if is_columnar:
+        return ColumnarHDF5Reader(filename)
     return PerReadHDF5Reader(filename, load_in_mem)
 
 
-def HDF5Writer(filename, alphabet_info, batch_format=True):
+def HDF5Writer(filename, alphabet_info, batch_format=True,
+               columnar_format=False):
     """ A file storing mapped signal data in an HDF5 file.
-    This function opens either a per-read or batched HDF5 file for storing
-    signal mappings.
+    This function opens either a per-read, batched or columnar HDF5 file for
+    storing signal mappings.
 
     Args:
         filename (str): name of file to open.
@@ -717,10 +1096,16 @@ def HDF5Writer(filename, alphabet_info, batch_format=True):
             can significantly improve I/O performance and use less disk space.
             An entire batch must be loaded into memory in order access any read
             potentailly increasing RAM requirements.
+        columnar_format (bool): Output columnar mapped signal file format,
+            taking precedence over `batch_format`.  Data are not compressed
+            but any read can be accessed without reading any other.
 
     Returns:
-        Either :class:`PerReadHDF5Writer` or :class:`BatchHDF5Writer` object
+        Either :class:`PerReadHDF5Writer`, :class:`BatchHDF5Writer` or
+            :class:`ColumnarHDF5Writer` object
     """
+    if columnar_format:
+        return ColumnarHDF5Writer(filename, alphabet_info)
     if batch_format:
         return BatchHDF5Writer(filename, alphabet_info)
     return PerReadHDF5Writer(filename, alphabet_info)
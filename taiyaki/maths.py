@@ -101,6 +101,36 @@ def rle(x, tol=0):
     return (x[starts], runlength)
 
 
+def edit_distance(seq1, seq2):
+    """  Levenshtein distance between two sequences
+
+    Each row of the dynamic programming matrix is calculated with vectorised
+    operations, insertions being accounted for using a cumulative minimum.
+
+    Args:
+        seq1: str or array containing first sequence
+        seq2: str or array containing second sequence
+
+    Returns:
+        int: minimum number of substitutions, insertions and deletions
+            required to transform `seq1` into `seq2`
+    """
+    if isinstance(seq1, str):
+        seq1 = np.frombuffer(seq1.encode(), dtype=np.uint8)
+    if isinstance(seq2, str):
+        seq2 = np.frombuffer(seq2.encode(), dtype=np.uint8)
+    seq2 = np.asarray(seq2)
+
+    offset = np.arange(len(seq2) + 1)
+    row = offset.copy()
+    for i, x in enumerate(seq1, 1):
+        new_row = np.empty_like(row)
+        new_row[0] = i
+        new_row[1:] = np.minimum(row[:-1] + (seq2 != x), row[1:] + 1)
+        row = np.minimum.accumulate(new_row - offset) + offset
+    return int(row[-1])
+
+
 class RollingQuantile:
     """Calculate rolling quantile of time series over a specified window"""
 
@@ -1,5 +1,6 @@
 from collections import defaultdict
 import enum
+from functools import lru_cache
 import sys
 
 import numpy as np
@@ -21,6 +22,19 @@ class RemapResult(enum.Enum):
     REF_TOO_LONG = 'Reference exceeded maximum allowed read length.'
 
 
+@lru_cache(maxsize=1)
+def _load_model_once(model_file):
+    """ Load model, once per process
+
+    Args:
+        model_file (str): checkpoint or TorchScript file containing model
+
+    Returns:
+        pytorch Module : the network model
+    """
+    return helpers.load_model(model_file)
+
+
 def oneread_remap(
         read_tuple, model, per_read_params_dict, alphabet_info,
         max_read_length, device='cpu', localpen=0.0):
@@ -29,7 +43,9 @@ def oneread_remap(
     Args:
         read_tuple (tuple) : read, identified by a tuple
                                   (filepath, read_id, read reference)
-        model (pytorch Module): pytorch model
+        model (pytorch Module or str): pytorch model, or name of file from
+            which model is loaded once per process.  TorchScript models
+            cannot be sent to worker processes so must be given by name.
         device (int or float): integer specifying which GPU to use for
                                 remapping, or 'cpu' to use CPU
         per_read_params_dict (dict) : dictionary where keys are UUIDs,
@@ -47,6 +63,8 @@ def oneread_remap(
         2. message string indicating an error if one occured
     """
     filename, read_id, read_ref = read_tuple
+    if isinstance(model, str):
+        model = _load_model_once(model)
 
     if read_ref is None:
         return None, RemapResult.NO_REF_FOUND
@@ -96,7 +114,7 @@ def oneread_remap(
     # What we need is a mapping between the signal and the reference.
     # To resolve this we need to know the stride of the model (how many samples
     # for each network output)
-    model_stride = helpers.guess_model_stride(model)
+    model_stride = helpers.get_model_stride(model)
     int_ref = signal_mapping.SignalMapping.get_integer_reference(
         read_ref, alphabet_info.alphabet)
     sig_mapping = signal_mapping.SignalMapping.from_remapping_path(
@@ -109,7 +127,8 @@ def oneread_remap(
 
 
 def generate_output_from_results(
-        results, output, alphabet_info, verbose=True, batch_format=True):
+        results, output, alphabet_info, verbose=True, batch_format=True,
+        columnar_format=False):
     """
     Given an iterable of dictionaries, each representing the results of mapping
     a single read, output a mapped-read file.
@@ -123,10 +142,13 @@ def generate_output_from_results(
         alphabet_info (AlphabetInfo object): alphabet
         verbose (bool): Write progress
         batch_format (bool): Write signal mappings in batched format
+        columnar_format (bool): Write signal mappings in columnar format,
+            taking precedence over `batch_format`
     """
     progress = helpers.Progress(quiet=not verbose)
     err_types = defaultdict(int)
-    with MappedSignalWriter(output, alphabet_info, batch_format) as msw:
+    with MappedSignalWriter(output, alphabet_info, batch_format,
+                            columnar_format) as msw:
         for resultdict, mesg in results:
             # filter out error messages for reporting later
             if resultdict is None:
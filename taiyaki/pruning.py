@@ -0,0 +1,251 @@
+"""  Pruning of model weights and conversion for sparse inference
+
+Weights of the recurrent and convolutional layers are pruned, set to zero, by
+multiplying them by a mask.  During fine-tuning, the masks are re-applied
+after each step of the optimiser so pruned weights remain zero.  Pruned models
+are converted for inference by replacing layers with versions that store
+their weights in the block sparse format of :mod:`taiyaki.sparse`.
+
+The native kernels skip blocks of `BLOCK_ROWS` consecutive rows of a single
+column of the weight matrix, so the speed of a pruned layer depends on the
+fraction of blocks that are zero rather than the fraction of weights:
+
+    magnitude   Unstructured, smallest weights are pruned.  Few blocks are
+                entirely zero, so pruning gives little increase in speed.
+    block       Blocks with the smallest L1 norm are pruned.  Time is
+                roughly proportional to the fraction of weights remaining.
+    structured  Columns, inputs of the layer, with the smallest L2 norm are
+                pruned.
+"""
+import copy
+from collections import OrderedDict
+
+import torch
+
+from taiyaki import layers
+
+
+PRUNING_METHODS = ('magnitude', 'block', 'structured')
+
+#  Rows in each block of weights, same as `taiyaki.sparse.BLOCK_ROWS`
+BLOCK_ROWS = 4
+
+#  Layers with prunable weights, mapping to attribute names of weights
+PRUNABLE_LAYERS = {
+    layers.Convolution_Quant: ('conv.weight',),
+    layers.GruMod_Quant: ('cudnn_gru.weight_ih_l0', 'cudnn_gru.weight_hh_l0'),
+}
+
+#  Layers with a sparse version, mapping to class used for inference
+SPARSE_LAYERS = {
+    layers.Convolution_Quant: layers.Convolution_Sparse,
+    layers.GruMod_Quant: layers.GruMod_Sparse,
+}
+
+
+def _prune_smallest(score, sparsity):
+    """  Mask retaining elements with the largest score
+
+    Args:
+        score (:torch:`Tensor`): score for each element
+        sparsity (float): fraction of elements to prune
+
+    Returns:
+        :torch:`Tensor`: boolean mask of same shape as `score`, True for
+            elements that are retained.
+    """
+    nprune = int(round(sparsity * score.numel()))
+    mask = torch.ones(score.numel(), dtype=torch.bool, device=score.device)
+    if nprune > 0:
+        mask[torch.argsort(score.flatten())[:nprune]] = False
+    return mask.reshape(score.shape)
+
+
+def magnitude_mask(weight, sparsity):
+    """  Mask pruning weights with the smallest magnitude
+
+    Args:
+        weight (:torch:`Tensor`): weight matrix
+        sparsity (float): fraction of weights to prune
+
+    Returns:
+        :torch:`Tensor`: boolean mask of same shape as `weight`
+    """
+    return _prune_smallest(weight.detach().abs(), sparsity)
+
+
+def block_mask(weight, sparsity, block_rows=BLOCK_ROWS):
+    """  Mask pruning blocks of weights with the smallest L1 norm
+
+    Each block is `block_rows` consecutive rows of a single column of the
+    weight matrix, the unit skipped by the native sparse kernels.  Weights of
+    higher dimension are treated as a matrix with the first dimension as rows.
+
+    Args:
+        weight (:torch:`Tensor`): weight matrix
+        sparsity (float): fraction of blocks to prune
+        block_rows (int, optional): number of rows in each block
+
+    Returns:
+        :torch:`Tensor`: boolean mask of same shape as `weight`
+    """
+    w = weight.detach().abs().reshape(weight.shape[0], -1)
+    nrow, ncol = w.shape
+    nrowblk = (nrow + block_rows - 1) // block_rows
+    padded = w.new_zeros((nrowblk * block_rows, ncol))
+    padded[:nrow] = w
+    score = padded.reshape(nrowblk, block_rows, ncol).sum(1)
+    mask = _prune_smallest(score, sparsity)
+    mask = mask.repeat_interleave(block_rows, dim=0)[:nrow]
+    return mask.reshape(weight.shape)
+
+
+def structured_mask(weight, sparsity):
+    """  Mask pruning columns of weights with the smallest L2 norm
+
+    Columns are the inputs of the layer; for a convolution, each input
+    feature at each position in the window is a column.
+
+    Args:
+        weight (:torch:`Tensor`): weight matrix
+        sparsity (float): fraction of columns to prune
+
+    Returns:
+        :torch:`Tensor`: boolean mask of same shape as `weight`
+    """
+    w = weight.detach().reshape(weight.shape[0], -1)
+    mask = _prune_smallest(w.norm(dim=0), sparsity)
+    return mask.expand_as(w).reshape(weight.shape)
+
+
+_MASK_FUNCTIONS = {
+    'magnitude': magnitude_mask,
+    'block': block_mask,
+    'structured': structured_mask,
+}
+
+
+def prunable_weights(model):
+    """  Weights of model that may be pruned
+
+    Args:
+        model (:nn:`Module`): model
+
+    Returns:
+        :collections:`OrderedDict`: mapping from name of parameter, as
+            an attribute path relative to `model`, to parameter.
+    """
+    res = OrderedDict()
+    for prefix, module in model.named_modules():
+        for attr in PRUNABLE_LAYERS.get(type(module), ()):
+            name = prefix + '.' + attr if prefix else attr
+            param = module
+            for field in attr.split('.'):
+                param = getattr(param, field)
+            res[name] = param
+    return res
+
+
+def prune_model(model, sparsity, method='block'):
+    """  Prune weights of recurrent and convolutional layers in-place
+
+    Each weight matrix is pruned to the same sparsity.
+
+    Args:
+        model (:nn:`Module`): model to prune
+        sparsity (float): fraction of weights in each matrix to prune,
+            between 0 and 1.
+        method (str, optional): one of `PRUNING_METHODS`
+
+    Returns:
+        dict: mapping from name of pruned parameter to boolean mask of
+            weights that are retained, for use with :func:`apply_masks`.
+    """
+    assert 0.0 <= sparsity <= 1.0, 'Sparsity must be between 0 and 1'
+    if method not in _MASK_FUNCTIONS:
+        raise ValueError('Unknown pruning method {}, must be one of {}'.format(
+            method, ', '.join(PRUNING_METHODS)))
+    masks = {name: _MASK_FUNCTIONS[method](param, sparsity)
+             for name, param in prunable_weights(model).items()}
+    apply_masks(model, masks)
+    return masks
+
+
+def apply_masks(model, masks):
+    """  Set pruned weights of model to zero
+
+    Args:
+        model (:nn:`Module`): model
+        masks (dict): mapping from name of parameter to mask, as returned by
+            :func:`prune_model`.
+
+    Returns:
+        None: parameters of `model` altered in-place
+    """
+    params = prunable_weights(model)
+    with torch.no_grad():
+        for name, mask in masks.items():
+            param = params[name]
+            param.mul_(mask.to(device=param.device, dtype=param.dtype))
+
+
+def sparsity_report(model):
+    """  Fraction of weights that are zero in each prunable weight matrix
+
+    Args:
+        model (:nn:`Module`): model
+
+    Returns:
+        :collections:`OrderedDict`: mapping from name of parameter to
+            fraction of its elements that are zero.
+    """
+    return OrderedDict(
+        (name, float((param == 0).float().mean()))
+        for name, param in prunable_weights(model).items())
+
+
+def _convert_children(module):
+    """  Replace children of module with sparse versions in-place, recursively
+
+    Args:
+        module (:nn:`Module`): module to convert
+
+    Returns:
+        int: number of layers replaced
+    """
+    nconverted = 0
+    for name, child in module.named_children():
+        if type(child) in SPARSE_LAYERS:
+            setattr(module, name, SPARSE_LAYERS[type(child)].from_float(child))
+            nconverted += 1
+        else:
+            nconverted += _convert_children(child)
+    return nconverted
+
+
+def convert_to_sparse(model, inplace=False):
+    """  Convert model to store weights in block sparse format for inference
+
+    Model metadata, if present, is preserved.  Layers without a sparse
+    version are left unchanged.  The output of each layer is transformed
+    using the range of its input, see
+    :func:`taiyaki.quantization.calibrate`.
+
+    Args:
+        model (:nn:`Module`): trained model to convert.
+        inplace (bool, optional): convert the model in-place rather than
+            a copy of it.
+
+    Returns:
+        tuple of :nn:`Module` and int: converted model and number of layers
+            converted.
+    """
+    model = model if inplace else copy.deepcopy(model)
+    model = model.cpu().eval()
+    if type(model) in SPARSE_LAYERS:
+        metadata = getattr(model, 'metadata', None)
+        model = SPARSE_LAYERS[type(model)].from_float(model)
+        if metadata is not None:
+            model.metadata = metadata
+        return model, 1
+    return model, _convert_children(model)
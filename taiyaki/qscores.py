@@ -1,12 +1,20 @@
 """ Functions to help out with calculation and calibration of qscores for
 basecalls
 """
+from functools import lru_cache
 import numpy as np
 import torch
 from taiyaki import flipflopfings
 from taiyaki.constants import SMALL_VAL
 
 
+#  Range of ASCII characters used to encode q scores in fastq
+_MIN_QCHAR = 33
+_MAX_QCHAR = 126
+#  Smallest probability of error, avoids taking log of zero
+_MIN_ERRPROB = 1e-30
+
+
 def qchar_from_qscore(score, zerochar=33):
     """Return ASCII character(s) encoding q score from score.
 
@@ -24,7 +32,7 @@ def qchar_from_qscore(score, zerochar=33):
         rounding score to nearest int.
     """
     asciicodes = (np.array(score) + zerochar + 0.5).astype(np.int8)
-    return asciicodes.tostring().decode('ascii')
+    return asciicodes.tobytes().decode('ascii')
 
 
 def qscore_from_errprob(errprob):
@@ -42,6 +50,10 @@ def qscore_from_errprob(errprob):
 def qchar_from_errprob(errprob, qscore_scale, qscore_offset):
     """Return character(s) representing quality score from errorprob.
 
+    Characters are limited to the range valid in a fastq file ('!' to '~').
+    Negative probabilities of error, from rounding, are given the highest
+    quality and NaN the lowest.
+
     Args:
         errprob (scalar or :np:`ndarray`) : probability of error
         qscore_scale (scalar): qscore <-- qscore*qscore_scale + qscore_offset,
@@ -51,8 +63,12 @@ def qchar_from_errprob(errprob, qscore_scale, qscore_offset):
     Returns:
         str : representing quality score(s)
     """
+    errprob = np.maximum(errprob, _MIN_ERRPROB)
     qscore = qscore_scale * qscore_from_errprob(errprob) + qscore_offset
-    return qchar_from_qscore(qscore)
+    #  fmax replaces NaN with lowest quality
+    asciicodes = np.fmax(qscore + _MIN_QCHAR + 0.5, _MIN_QCHAR)
+    asciicodes = np.minimum(asciicodes, _MAX_QCHAR).astype(np.uint8)
+    return asciicodes.tobytes().decode('ascii')
 
 
 def transitions_into_base(b, nbases, device):
@@ -85,6 +101,28 @@ def transitions_into_base(b, nbases, device):
     return torch.cat((toflip, toflop))
 
 
+@lru_cache(maxsize=16)
+def _transitions_into_bases(nbases, device, dtype=torch.float):
+    """Return matrix indicating which transitions are into each base (flip or
+    flop), see :func:`transitions_into_base`.
+
+    Args:
+        nbases (int): number of bases (4 for ACGT)
+        device (str or :torch:`device`): device to create matrix on.
+        dtype (:torch:`dtype`, optional): type of matrix.
+
+    Returns:
+        :torch:`Tensor` : matrix of shape (ntransitions x nbases) with
+            element [t, b] equal to 1 if transition t is into base b and 0
+            otherwise.
+    """
+    m = torch.zeros((flipflopfings.nstate_flipflop(nbases), nbases),
+                    dtype=dtype, device=device)
+    for destbase in range(nbases):
+        m[transitions_into_base(destbase, nbases, device), destbase] = 1.0
+    return m
+
+
 def errprobs_from_trans(trans, path):
     """Calculate error probs from (batch of) posterior trans weights and path
 
@@ -117,26 +155,19 @@ def errprobs_from_trans(trans, path):
     nblocks, batchsize, flip_flop_transitions = trans.shape
     nbases = flipflopfings.nbase_flipflop(flip_flop_transitions)
     # baseprobs will contain total probability for emission of each base
-    # at each block normalised by prob of emitting any base.
-    baseprobs = torch.zeros((nblocks, batchsize, nbases), dtype=torch.float,
-                            device=trans.device)
-    # Calculate total probability of transition into base b at block n
-    for destbase in range(nbases):
-        t = transitions_into_base(destbase, nbases, device=trans.device)
-        m = torch.zeros(flip_flop_transitions, dtype=torch.float,
-                        device=trans.device)
-        m[t] = 1.0
-        baseprobs[:, :, destbase] = torch.matmul(trans, m)
-
-    # Normalise
-    baseprobs = baseprobs / (baseprobs.sum(dim=2, keepdim=True) + SMALL_VAL)
+    # at each block, calculated for all bases at once.  Results agree with
+    # summing over each base separately only to float rounding.
+    baseprobs = torch.matmul(
+        trans, _transitions_into_bases(nbases, trans.device, trans.dtype))
 
-    # Calculate matrix p (see docstring)
+    # Calculate matrix p (see docstring), normalising by the probability of
+    # emitting any base
     p = torch.empty_like(path, dtype=torch.float)
     # baseprobs is nblocks x batchsize x nbases, path is (nblocks+1) x
     # batchsize
     ix = path[1:].unsqueeze(2) % nbases
-    p[1:] = torch.gather(baseprobs, 2, ix).squeeze(2)
+    p[1:] = (torch.gather(baseprobs, 2, ix).squeeze(2) /
+             (baseprobs.sum(dim=2) + SMALL_VAL))
     # errprob at block 0 set to -1
     p[0] = 2.0
     return 1.0 - p
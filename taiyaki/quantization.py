@@ -0,0 +1,159 @@
+"""  Conversion of trained models for integer inference
+
+Layers that simulate quantisation during training (the `_Quant` layers) are
+replaced by versions that store their weights as int8 and perform their
+matrix multiplications using integer arithmetic.  The linear transforms and
+recurrent units of other taiyaki layers are replaced by their dynamically
+quantised PyTorch equivalents.  Converted models are for inference on the
+CPU only and cannot be trained further; only the int8 layers support
+conversion to JSON.
+"""
+import copy
+
+import numpy as np
+import torch
+from torch import nn
+import torch.nn.quantized.dynamic as nnqd
+
+from taiyaki import layers
+
+
+#  Layers with an integer version, mapping to class used for inference
+INT8_LAYERS = {
+    layers.Convolution_Quant: layers.Convolution_Int8,
+    layers.GruMod_Quant: layers.GruMod_Int8,
+    layers.GlobalNormFlipFlop_Quant: layers.GlobalNormFlipFlop_Int8,
+}
+
+#  PyTorch modules, used inside other taiyaki layers, with a dynamically
+#  quantised version
+DYNAMIC_MODULES = {
+    nn.Linear: nnqd.Linear,
+    nn.LSTM: nnqd.LSTM,
+}
+if hasattr(nnqd, 'GRU'):
+    DYNAMIC_MODULES[nn.GRU] = nnqd.GRU
+
+
+def _dynamic_module(module):
+    """  Create dynamically quantised version of PyTorch module
+
+    Recurrent units without bias are given a bias of zero, since the
+    quantised versions require one.
+
+    Args:
+        module (:nn:`Module`): `nn.Linear`, `nn.LSTM` or `nn.GRU` module
+
+    Returns:
+        :nn:`Module`: quantised module
+    """
+    if isinstance(module, nn.RNNBase) and not module.bias:
+        biased = type(module)(module.input_size, module.hidden_size)
+        with torch.no_grad():
+            for name, param in biased.named_parameters():
+                if hasattr(module, name):
+                    param.copy_(getattr(module, name))
+                else:
+                    param.zero_()
+        module = biased
+    module.qconfig = torch.quantization.per_channel_dynamic_qconfig
+    return DYNAMIC_MODULES[type(module)].from_float(module)
+
+
+def _convert_children(module):
+    """  Replace children of module in-place, recursively
+
+    Args:
+        module (:nn:`Module`): module to convert
+
+    Returns:
+        int: number of layers replaced
+    """
+    nconverted = 0
+    for name, child in module.named_children():
+        if type(child) in INT8_LAYERS:
+            setattr(module, name, INT8_LAYERS[type(child)].from_float(child))
+        elif type(child) in DYNAMIC_MODULES:
+            setattr(module, name, _dynamic_module(child))
+        else:
+            nconverted += _convert_children(child)
+            continue
+        nconverted += 1
+    return nconverted
+
+
+def convert_to_int8(model, inplace=False):
+    """  Convert model to use int8 weights and arithmetic
+
+    Model metadata, if present, is preserved.  Layers without parameters, or
+    without an integer version, are left unchanged.
+
+    Args:
+        model (:nn:`Module`): trained model to convert.
+        inplace (bool, optional): convert the model in-place rather than
+            a copy of it.
+
+    Returns:
+        tuple of :nn:`Module` and int: converted model and number of layers
+            converted.
+    """
+    model = model if inplace else copy.deepcopy(model)
+    model = model.cpu().eval()
+    if type(model) in INT8_LAYERS:
+        metadata = getattr(model, 'metadata', None)
+        model = INT8_LAYERS[type(model)].from_float(model)
+        if metadata is not None:
+            model.metadata = metadata
+        return model, 1
+    return model, _convert_children(model)
+
+
+def calibrate(model, batches):
+    """  Fix range of input used by int8 layers to transform their output
+
+    The `_Quant` layers, and so their int8 versions, transform their output
+    using the range of their input.  When calculated for each input, the
+    output for a chunk depends on which other chunks are in the same batch.
+    Calibration fixes the range to the average of the ranges seen for each
+    batch, as during training, so the output of the model only depends on
+    the chunk being called.
+
+    Layers converted for sparse inference, see
+    :func:`taiyaki.pruning.convert_to_sparse`, are calibrated in the same way.
+
+    Args:
+        model (:nn:`Module`): model converted by :func:`convert_to_int8`.
+        batches (iterable of :torch:`Tensor`): batches of input for model,
+            each of shape time x batch x features.
+
+    Returns:
+        int: number of layers calibrated
+    """
+    calibrated_layers = [layer for layer in model.modules()
+                         if hasattr(layer, 'input_range')]
+    ranges = {layer: [] for layer in calibrated_layers}
+
+    def record_range(layer, inputs):
+        x = inputs[0]
+        ranges[layer].append((float(x.min()), float(x.max())))
+
+    handles = []
+    for layer in calibrated_layers:
+        #  Use range calculated from each input while calibrating
+        layer.input_range = None
+        handles.append(layer.register_forward_pre_hook(record_range))
+    try:
+        with torch.no_grad():
+            for x in batches:
+                model(x)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    ncalibrated = 0
+    for layer, layer_ranges in ranges.items():
+        if len(layer_ranges) > 0:
+            layer.input_range = tuple(
+                float(v) for v in np.mean(layer_ranges, axis=0))
+            ncalibrated += 1
+    return ncalibrated
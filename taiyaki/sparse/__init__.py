@@ -0,0 +1,10 @@
+from .sparse import BLOCK_ROWS, TILE, from_dense, gru, matmul, to_dense
+
+if False:
+    #  Keep flake8 happy
+    BLOCK_ROWS
+    TILE
+    from_dense
+    gru
+    matmul
+    to_dense
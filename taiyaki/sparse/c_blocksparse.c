@@ -0,0 +1,232 @@
+#include <assert.h>
+#include <immintrin.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "c_blocksparse.h"
+#include "../ctc/avx_mathfun.h"
+
+
+/**
+ *  Block sparse matrix multiplication and recurrent layers
+ *
+ *  Sparse matrices are stored in a block compressed row format where each
+ *  block is BLOCKSPARSE_ROWS consecutive rows of a single column, so one
+ *  row of the dense right-hand side is loaded for every four multiply-adds.
+ *  The right-hand side is processed in tiles of BLOCKSPARSE_TILE columns
+ *  (e.g. elements of the batch) that are held in registers.
+ *
+ *  For a matrix with M rows, where M is a multiple of BLOCKSPARSE_ROWS:
+ *      rowptr  [M / BLOCKSPARSE_ROWS + 1] offset into `col` of first block
+ *              in each block-row
+ *      col     [nblock] column of each block
+ *      val     [nblock, BLOCKSPARSE_ROWS] values of each block
+**/
+
+
+/**  Multiply block sparse matrix by tile of dense matrix
+ *
+ *    @param w          Block sparse matrix
+ *    @param x          Start of tile in dense matrix
+ *    @param ldx        Stride between rows of `x`
+ *    @param out [out]  Start of tile in output matrix
+ *    @param ldout      Stride between rows of `out`
+ *
+ *    @returns void
+ **/
+static void blocksparse_tile(const blocksparse_matrix * w, const float * x,
+                             size_t ldx, float * out, size_t ldout){
+    for(size_t r=0 ; r < w->nrowblk ; r++){
+        __m256 acc00 = _mm256_setzero_ps(), acc01 = _mm256_setzero_ps();
+        __m256 acc10 = _mm256_setzero_ps(), acc11 = _mm256_setzero_ps();
+        __m256 acc20 = _mm256_setzero_ps(), acc21 = _mm256_setzero_ps();
+        __m256 acc30 = _mm256_setzero_ps(), acc31 = _mm256_setzero_ps();
+        for(int32_t k=w->rowptr[r] ; k < w->rowptr[r + 1] ; k++){
+            const float * xrow = x + ldx * w->col[k];
+            const __m256 x0 = _mm256_loadu_ps(xrow);
+            const __m256 x1 = _mm256_loadu_ps(xrow + 8);
+            const float * v = w->val + BLOCKSPARSE_ROWS * k;
+            const __m256 v0 = _mm256_broadcast_ss(v);
+            const __m256 v1 = _mm256_broadcast_ss(v + 1);
+            const __m256 v2 = _mm256_broadcast_ss(v + 2);
+            const __m256 v3 = _mm256_broadcast_ss(v + 3);
+            acc00 = _mm256_fmadd_ps(v0, x0, acc00);
+            acc01 = _mm256_fmadd_ps(v0, x1, acc01);
+            acc10 = _mm256_fmadd_ps(v1, x0, acc10);
+            acc11 = _mm256_fmadd_ps(v1, x1, acc11);
+            acc20 = _mm256_fmadd_ps(v2, x0, acc20);
+            acc21 = _mm256_fmadd_ps(v2, x1, acc21);
+            acc30 = _mm256_fmadd_ps(v3, x0, acc30);
+            acc31 = _mm256_fmadd_ps(v3, x1, acc31);
+        }
+        float * orow = out + BLOCKSPARSE_ROWS * r * ldout;
+        _mm256_storeu_ps(orow, acc00);
+        _mm256_storeu_ps(orow + 8, acc01);
+        _mm256_storeu_ps(orow + ldout, acc10);
+        _mm256_storeu_ps(orow + ldout + 8, acc11);
+        _mm256_storeu_ps(orow + 2 * ldout, acc20);
+        _mm256_storeu_ps(orow + 2 * ldout + 8, acc21);
+        _mm256_storeu_ps(orow + 3 * ldout, acc30);
+        _mm256_storeu_ps(orow + 3 * ldout + 8, acc31);
+    }
+}
+
+
+/**  Multiply block sparse matrix by dense matrix
+ *
+ *  Tiles of the dense matrix are processed in parallel.
+ *
+ *    @param w          Block sparse matrix
+ *    @param x          Dense matrix [ncolumns of sparse matrix, ncol]
+ *    @param ncol       Number of columns of dense matrix, a multiple of
+ *                      BLOCKSPARSE_TILE
+ *    @param out [out]  Product [w->nrowblk * BLOCKSPARSE_ROWS, ncol]
+ *
+ *    @returns void
+ **/
+void blocksparse_matmul(const blocksparse_matrix * w, const float * x,
+                        size_t ncol, float * out){
+    assert(0 == ncol % BLOCKSPARSE_TILE);
+    const size_t ntile = ncol / BLOCKSPARSE_TILE;
+
+#pragma omp parallel for schedule(static)
+    for(size_t tile=0 ; tile < ntile ; tile++){
+        const size_t offset = tile * BLOCKSPARSE_TILE;
+        blocksparse_tile(w, x + offset, ncol, out + offset, ncol);
+    }
+}
+
+
+static inline __m256 sigmoid256_ps(__m256 x){
+    const __m256 one = _mm256_set1_ps(1.0f);
+    return _mm256_div_ps(one, _mm256_add_ps(one, exp256_ps(
+        _mm256_sub_ps(_mm256_setzero_ps(), x))));
+}
+
+
+static inline __m256 tanh256_ps(__m256 x){
+    //  tanh(x) = 2 sigmoid(2x) - 1
+    const __m256 one = _mm256_set1_ps(1.0f);
+    const __m256 s = sigmoid256_ps(_mm256_add_ps(x, x));
+    return _mm256_sub_ps(_mm256_add_ps(s, s), one);
+}
+
+
+static inline __m256 bias256_ps(const float * bias, size_t i){
+    return _mm256_set1_ps((NULL != bias) ? bias[i] : 0.0f);
+}
+
+
+/**  GRU layer with block sparse weights
+ *
+ *  Uses the same formulation as `torch.nn.GRU`, with the gates in the order
+ *  reset (r), update (z) and new (n):
+ *      r = sigmoid(W_ir x + b_ir + W_hr h + b_hr)
+ *      z = sigmoid(W_iz x + b_iz + W_hz h + b_hz)
+ *      n = tanh(W_in x + b_in + r * (W_hn h + b_hn))
+ *      h' = (1 - z) n + z h
+ *  and the initial state is zero.  Tiles of the batch are processed in
+ *  parallel over the whole sequence.
+ *
+ *  Input and output are stored with the batch as the fastest changing
+ *  dimension, so the output of one layer may be used as the input to the
+ *  next without rearrangement.
+ *
+ *    @param x          Input [nt, insize, nbatch]. If `w_ih` is NULL, the
+ *                      input contribution to the gates [nt, 3 * size, nbatch]
+ *    @param nt         Number of time steps
+ *    @param nbatch     Number of elements in batch, a multiple of
+ *                      BLOCKSPARSE_TILE
+ *    @param insize     Size of input
+ *    @param size       Size of hidden state
+ *    @param w_ih       Input weights [3 * size, insize] or NULL
+ *    @param b_ih       Bias of input contribution [3 * size] or NULL
+ *    @param w_hh       Recurrent weights [3 * size, size]
+ *    @param b_hh       Bias of recurrent contribution [3 * size] or NULL
+ *    @param out [out]  Hidden state for each time step [nt, size, nbatch]
+ *
+ *    @returns 0 on success, -1 if memory could not be allocated
+ **/
+int blocksparse_gru(const float * x, size_t nt, size_t nbatch, size_t insize,
+                    size_t size, const blocksparse_matrix * w_ih,
+                    const float * b_ih, const blocksparse_matrix * w_hh,
+                    const float * b_hh, float * out){
+    assert(0 == nbatch % BLOCKSPARSE_TILE);
+    assert(NULL != w_ih || insize == 3 * size);
+    assert(NULL == w_ih || BLOCKSPARSE_ROWS * w_ih->nrowblk >= 3 * size);
+    assert(BLOCKSPARSE_ROWS * w_hh->nrowblk >= 3 * size);
+    const size_t ntile = nbatch / BLOCKSPARSE_TILE;
+    const size_t ldx = insize * nbatch;
+    const size_t ldo = size * nbatch;
+    int failed = 0;
+
+#pragma omp parallel for schedule(static)
+    for(size_t tile=0 ; tile < ntile ; tile++){
+        const size_t offset = tile * BLOCKSPARSE_TILE;
+        float * state = calloc(size * BLOCKSPARSE_TILE, sizeof(float));
+        float * hw = calloc(BLOCKSPARSE_ROWS * w_hh->nrowblk *
+                            BLOCKSPARSE_TILE, sizeof(float));
+        float * xw = (NULL == w_ih) ? NULL :
+                     calloc(BLOCKSPARSE_ROWS * w_ih->nrowblk *
+                            BLOCKSPARSE_TILE, sizeof(float));
+        if(NULL == state || NULL == hw || (NULL != w_ih && NULL == xw)){
+            free(xw);
+            free(hw);
+            free(state);
+#pragma omp atomic write
+            failed = 1;
+            continue;
+        }
+
+        for(size_t t=0 ; t < nt ; t++){
+            //  Input contribution to gates, stride between rows `ldxw`
+            const float * xt = x + t * ldx + offset;
+            size_t ldxw = nbatch;
+            if(NULL != w_ih){
+                blocksparse_tile(w_ih, xt, nbatch, xw, BLOCKSPARSE_TILE);
+                xt = xw;
+                ldxw = BLOCKSPARSE_TILE;
+            }
+            blocksparse_tile(w_hh, state, BLOCKSPARSE_TILE, hw,
+                             BLOCKSPARSE_TILE);
+
+            float * ot = out + t * ldo + offset;
+            for(size_t i=0 ; i < size ; i++){
+                const size_t ir = i, iz = size + i, in = 2 * size + i;
+                const __m256 br = _mm256_add_ps(bias256_ps(b_ih, ir),
+                                                bias256_ps(b_hh, ir));
+                const __m256 bz = _mm256_add_ps(bias256_ps(b_ih, iz),
+                                                bias256_ps(b_hh, iz));
+                const __m256 bin = bias256_ps(b_ih, in);
+                const __m256 bhn = bias256_ps(b_hh, in);
+                for(size_t j=0 ; j < BLOCKSPARSE_TILE ; j += 8){
+                    const __m256 xr = _mm256_loadu_ps(xt + ir * ldxw + j);
+                    const __m256 xz = _mm256_loadu_ps(xt + iz * ldxw + j);
+                    const __m256 xn = _mm256_loadu_ps(xt + in * ldxw + j);
+                    const __m256 hr = _mm256_loadu_ps(hw + ir * BLOCKSPARSE_TILE + j);
+                    const __m256 hz = _mm256_loadu_ps(hw + iz * BLOCKSPARSE_TILE + j);
+                    const __m256 hn = _mm256_loadu_ps(hw + in * BLOCKSPARSE_TILE + j);
+
+                    const __m256 r = sigmoid256_ps(
+                        _mm256_add_ps(_mm256_add_ps(xr, hr), br));
+                    const __m256 z = sigmoid256_ps(
+                        _mm256_add_ps(_mm256_add_ps(xz, hz), bz));
+                    const __m256 n = tanh256_ps(_mm256_fmadd_ps(
+                        r, _mm256_add_ps(hn, bhn), _mm256_add_ps(xn, bin)));
+                    float * h = state + i * BLOCKSPARSE_TILE + j;
+                    const __m256 hnew = _mm256_fmadd_ps(
+                        z, _mm256_sub_ps(_mm256_loadu_ps(h), n), n);
+                    _mm256_storeu_ps(h, hnew);
+                    _mm256_storeu_ps(ot + i * nbatch + j, hnew);
+                }
+            }
+        }
+
+        free(xw);
+        free(hw);
+        free(state);
+    }
+
+    return failed ? -1 : 0;
+}
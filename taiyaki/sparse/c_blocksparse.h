@@ -0,0 +1,30 @@
+#pragma once
+
+#ifndef BLOCKSPARSE_H
+#define BLOCKSPARSE_H
+
+#include <stdint.h>
+#include <stdlib.h>
+
+//  Number of rows in each block of a block sparse matrix
+#define BLOCKSPARSE_ROWS 4
+//  Number of columns of dense right-hand side processed together
+#define BLOCKSPARSE_TILE 16
+
+//  Matrix stored in block compressed row format, see c_blocksparse.c
+typedef struct {
+    size_t nrowblk;         // Number of block-rows
+    const int32_t * rowptr; // Start of each block-row in col [nrowblk + 1]
+    const int32_t * col;    // Column of each block [nblock]
+    const float * val;      // Values of each block [nblock, BLOCKSPARSE_ROWS]
+} blocksparse_matrix;
+
+void blocksparse_matmul(const blocksparse_matrix * w, const float * x,
+                        size_t ncol, float * out);
+
+int blocksparse_gru(const float * x, size_t nt, size_t nbatch, size_t insize,
+                    size_t size, const blocksparse_matrix * w_ih,
+                    const float * b_ih, const blocksparse_matrix * w_hh,
+                    const float * b_hh, float * out);
+
+#endif  /*  BLOCKSPARSE_H  */
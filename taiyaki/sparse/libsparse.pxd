@@ -0,0 +1,16 @@
+from libc.stdint cimport int32_t
+cdef extern from "c_blocksparse.h":
+    enum: BLOCKSPARSE_ROWS
+    enum: BLOCKSPARSE_TILE
+    ctypedef struct blocksparse_matrix:
+        size_t nrowblk
+        const int32_t * rowptr
+        const int32_t * col
+        const float * val
+    void blocksparse_matmul(const blocksparse_matrix * w, const float * x,
+                            size_t ncol, float * out) nogil
+    int blocksparse_gru(const float * x, size_t nt, size_t nbatch,
+                        size_t insize, size_t size,
+                        const blocksparse_matrix * w_ih, const float * b_ih,
+                        const blocksparse_matrix * w_hh, const float * b_hh,
+                        float * out) nogil
@@ -0,0 +1,191 @@
+cimport libsparse
+from libc.stdint cimport int32_t
+import cython
+import numpy as np
+cimport numpy as np
+
+#  Number of rows in each block of a block sparse matrix
+BLOCK_ROWS = libsparse.BLOCKSPARSE_ROWS
+#  Number of columns of dense matrices must be a multiple of TILE
+TILE = libsparse.BLOCKSPARSE_TILE
+
+
+def from_dense(weight):
+    """  Convert dense matrix to block sparse format
+
+    Each block is `BLOCK_ROWS` consecutive rows of a single column and is
+    stored if any of its elements are non-zero.  Rows are padded with zeros
+    to a multiple of `BLOCK_ROWS`.
+
+    Args:
+        weight (:class:`ndarray`): dense matrix [M, K]
+
+    Returns:
+        tuple of :class:`ndarray`: start of each block-row in columns
+            [M / BLOCK_ROWS + 1], column of each block [nblock] and values of
+            each block [nblock, BLOCK_ROWS].
+    """
+    weight = np.asarray(weight, dtype=np.float32)
+    nrow, ncol = weight.shape
+    nrowblk = (nrow + BLOCK_ROWS - 1) // BLOCK_ROWS
+    padded = np.zeros((nrowblk * BLOCK_ROWS, ncol), dtype=np.float32)
+    padded[:nrow] = weight
+    #  blocks [nrowblk, ncol, BLOCK_ROWS]
+    blocks = padded.reshape(nrowblk, BLOCK_ROWS, ncol).transpose(0, 2, 1)
+    rowblk, col = np.nonzero(np.any(blocks != 0, axis=2))
+    rowptr = np.zeros(nrowblk + 1, dtype=np.int32)
+    np.cumsum(np.bincount(rowblk, minlength=nrowblk), out=rowptr[1:])
+    val = np.ascontiguousarray(blocks[rowblk, col], dtype=np.float32)
+    return rowptr, col.astype(np.int32), val
+
+
+def to_dense(weight, ncol):
+    """  Convert block sparse matrix to dense format
+
+    Args:
+        weight (tuple of :class:`ndarray`): block sparse matrix, as returned
+            by :func:`from_dense`.
+        ncol (int): number of columns of matrix
+
+    Returns:
+        :class:`ndarray`: dense matrix [M, ncol], where M is the number of
+            rows padded to a multiple of `BLOCK_ROWS`.
+    """
+    rowptr, col, val = (np.asarray(w) for w in weight)
+    nrowblk = len(rowptr) - 1
+    rowblk = np.repeat(np.arange(nrowblk), np.diff(rowptr))
+    blocks = np.zeros((nrowblk, ncol, BLOCK_ROWS), dtype=np.float32)
+    blocks[rowblk, col] = val
+    return blocks.transpose(0, 2, 1).reshape(nrowblk * BLOCK_ROWS, ncol)
+
+
+cdef int _set_matrix(libsparse.blocksparse_matrix * mat, weight,
+                     size_t ncol) except -1:
+    """  Fill in C description of block sparse matrix
+
+    Args:
+        mat: structure to fill in
+        weight (tuple of :class:`ndarray`): block sparse matrix, as returned
+            by :func:`from_dense`.  Arrays must remain alive while `mat` is
+            used.
+        ncol (int): maximum number of columns of matrix
+    """
+    cdef np.ndarray[np.int32_t, ndim=1, mode="c"] rowptr = weight[0]
+    cdef np.ndarray[np.int32_t, ndim=1, mode="c"] col = weight[1]
+    cdef np.ndarray[np.float32_t, ndim=2, mode="c"] val = weight[2]
+    assert rowptr.shape[0] > 0, 'Block sparse matrix has no rows'
+    assert rowptr[rowptr.shape[0] - 1] == col.shape[0] == val.shape[0], \
+        'Inconsistent block sparse matrix'
+    assert val.shape[1] == BLOCK_ROWS, 'Blocks have wrong number of rows'
+    assert col.shape[0] == 0 or (col.min() >= 0 and col.max() < ncol), \
+        'Block sparse matrix has too many columns'
+    mat.nrowblk = rowptr.shape[0] - 1
+    mat.rowptr = <int32_t *>&rowptr[0]
+    mat.col = <int32_t *>&col[0] if col.shape[0] > 0 else NULL
+    mat.val = &val[0, 0] if val.shape[0] > 0 else NULL
+    return 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def matmul(weight, np.ndarray[np.float32_t, ndim=2, mode="c"] x):
+    """  Multiply block sparse matrix by dense matrix
+
+    Tiles of columns of `x` are processed in parallel using OpenMP.
+
+    Args:
+        weight (tuple of :class:`ndarray`): block sparse matrix [M, K], as
+            returned by :func:`from_dense`.
+        x (:class:`ndarray`): dense matrix [K, N] where N is a multiple of
+            `TILE`.
+
+    Returns:
+        :class:`ndarray`: product [M, N], where M is the number of rows of the
+            sparse matrix padded to a multiple of `BLOCK_ROWS`.
+    """
+    cdef libsparse.blocksparse_matrix w
+    cdef size_t ncol = x.shape[1]
+    assert ncol % TILE == 0, 'Columns of x must be a multiple of {}'.format(
+        TILE)
+    _set_matrix(&w, weight, x.shape[0])
+
+    cdef np.ndarray[np.float32_t, ndim=2, mode="c"] out = np.empty(
+        (w.nrowblk * BLOCK_ROWS, ncol), dtype=np.float32)
+    if ncol == 0 or w.nrowblk == 0:
+        return out
+
+    with nogil:
+        libsparse.blocksparse_matmul(&w, &x[0, 0], ncol, &out[0, 0])
+
+    return out
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def gru(np.ndarray[np.float32_t, ndim=3, mode="c"] x, size_t size, w_hh,
+        np.ndarray[np.float32_t, ndim=1, mode="c"] b_hh=None, w_ih=None,
+        np.ndarray[np.float32_t, ndim=1, mode="c"] b_ih=None):
+    """  GRU layer with block sparse weights
+
+    Same formulation as `torch.nn.GRU`, with initial state zero.  Tiles of
+    the batch are processed in parallel using OpenMP.  Input and output have
+    the batch as their last dimension, so the output of one layer can be
+    used directly as input to the next.
+
+    Args:
+        x (:class:`ndarray`): input [T, insize, B], where B is a multiple of
+            `TILE`.  If `w_ih` is None, the input contribution to the gates
+            [T, 3 * size, B], including its bias.
+        size (int): size of hidden state
+        w_hh (tuple of :class:`ndarray`): block sparse recurrent weights
+            [3 * size, size], as returned by :func:`from_dense`.
+        b_hh (:class:`ndarray`, optional): bias of recurrent contribution to
+            gates [3 * size].
+        w_ih (tuple of :class:`ndarray`, optional): block sparse input
+            weights [3 * size, insize].
+        b_ih (:class:`ndarray`, optional): bias of input contribution to
+            gates [3 * size].  Only used with `w_ih`.
+
+    Returns:
+        :class:`ndarray`: hidden state for each time step [T, size, B]
+    """
+    cdef libsparse.blocksparse_matrix wih, whh
+    cdef libsparse.blocksparse_matrix * wih_ptr = NULL
+    cdef float * b_ih_ptr = NULL
+    cdef float * b_hh_ptr = NULL
+    cdef size_t nt = x.shape[0]
+    cdef size_t insize = x.shape[1]
+    cdef size_t nbatch = x.shape[2]
+    cdef int ret
+    assert nbatch % TILE == 0, 'Batch must be a multiple of {}'.format(TILE)
+
+    _set_matrix(&whh, w_hh, size)
+    assert whh.nrowblk * BLOCK_ROWS >= 3 * size, \
+        'Recurrent weights have too few rows'
+    if b_hh is not None:
+        assert b_hh.shape[0] == 3 * size, 'Recurrent bias has wrong size'
+        b_hh_ptr = &b_hh[0]
+    if w_ih is None:
+        assert insize == 3 * size, 'Input contribution has wrong size'
+    else:
+        _set_matrix(&wih, w_ih, insize)
+        assert wih.nrowblk * BLOCK_ROWS >= 3 * size, \
+            'Input weights have too few rows'
+        wih_ptr = &wih
+        if b_ih is not None:
+            assert b_ih.shape[0] == 3 * size, 'Input bias has wrong size'
+            b_ih_ptr = &b_ih[0]
+
+    cdef np.ndarray[np.float32_t, ndim=3, mode="c"] out = np.empty(
+        (nt, size, nbatch), dtype=np.float32)
+    if nt == 0 or nbatch == 0 or size == 0:
+        return out
+
+    with nogil:
+        ret = libsparse.blocksparse_gru(
+            &x[0, 0, 0], nt, nbatch, insize, size, wih_ptr, b_ih_ptr, &whh,
+            b_hh_ptr, &out[0, 0, 0])
+    if ret != 0:
+        raise MemoryError('Failed to allocate memory for GRU state')
+
+    return out
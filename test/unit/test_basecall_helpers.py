@@ -0,0 +1,380 @@
+from collections import OrderedDict
+import io
+import json
+import numpy as np
+import os
+import tempfile
+import unittest
+
+import torch
+
+from taiyaki import basecall_helpers
+
+
+class TestChunking(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0xC0FFEE)
+        self.signal = np.random.normal(size=1037).astype('f4')
+        self.chunk_size = 100
+        self.overlap = 20
+
+    def test_strided_chunks_are_views(self):
+        """ Chunks are views onto the signal, agreeing with copying each
+        chunk, including when the last chunk falls on the regular grid
+        """
+        for nsample in [1037, 980, 100, 57]:
+            signal = self.signal[:nsample]
+            chunks, starts, ends = basecall_helpers.strided_chunks(
+                signal, self.chunk_size, self.overlap)
+            got_starts, got_ends = basecall_helpers.chunk_coordinates(
+                nsample, self.chunk_size, self.overlap)
+            np.testing.assert_array_equal(got_starts, starts)
+            np.testing.assert_array_equal(got_ends, ends)
+            self.assertEqual(sum(block.shape[1] for block in chunks),
+                             len(starts))
+            self.assertEqual(len(chunks), 1 if nsample in [980, 100, 57]
+                             else 2)
+            for block in chunks:
+                self.assertTrue(np.shares_memory(block, signal))
+            expected = np.stack([signal[start:end]
+                                 for start, end in zip(starts, ends)], 1)
+            np.testing.assert_array_equal(
+                np.concatenate(chunks, 1), expected[:, :, None])
+            got, _, _ = basecall_helpers.chunk_read(
+                signal, self.chunk_size, self.overlap)
+            np.testing.assert_array_equal(got, expected[:, :, None])
+
+    def test_windows(self):
+        chunks, starts, _ = basecall_helpers.strided_chunks(
+            self.signal, self.chunk_size, self.overlap)
+        expected = np.concatenate(chunks, 1)
+        windows = list(basecall_helpers.iterate_chunk_windows(chunks, 4))
+        self.assertEqual([first for first, _ in windows],
+                         list(range(0, len(starts), 4)))
+        self.assertTrue(all(window.shape[1] <= 4 for _, window in windows))
+        np.testing.assert_array_equal(
+            np.concatenate([window for _, window in windows], 1), expected)
+
+    def test_stitch_regions_abut(self):
+        """ Regions retained from consecutive chunks are contiguous and cover
+        the whole read
+        """
+        stride = 5
+        starts, ends = basecall_helpers.chunk_coordinates(
+            1035, self.chunk_size, self.overlap)
+        region_starts, region_ends = basecall_helpers.stitch_regions(
+            starts, ends, stride)
+        absolute_starts = starts // stride + region_starts
+        absolute_ends = starts // stride + region_ends
+        self.assertEqual(absolute_starts[0], 0)
+        np.testing.assert_array_equal(absolute_starts[1:], absolute_ends[:-1])
+        self.assertEqual(absolute_ends[-1], 1035 // stride)
+
+        out = torch.arange(len(starts))[None, :].expand(
+            self.chunk_size // stride, -1)
+        stitched = basecall_helpers.stitch_chunks(out, starts, ends, stride)
+        np.testing.assert_array_equal(
+            stitched.numpy(),
+            np.repeat(np.arange(len(starts)), region_ends - region_starts))
+
+    def test_stitch_chunks(self):
+        """ Stitching gathers the region of each chunk, for paths, which
+        include an extra block, as well as outputs with features
+        """
+        stride = 5
+        starts, ends = basecall_helpers.chunk_coordinates(
+            1035, self.chunk_size, self.overlap)
+        nblock = self.chunk_size // stride
+        for path_stitching in [False, True]:
+            region_starts, region_ends = basecall_helpers.stitch_regions(
+                starts, ends, stride, path_stitching)
+            for shape in [(nblock + path_stitching, len(starts)),
+                          (nblock, len(starts), 3)]:
+                out = torch.randn(*shape)
+                expected = torch.cat([
+                    out[start:end, i] for i, (start, end) in enumerate(
+                        zip(region_starts, region_ends))])
+                got = basecall_helpers.stitch_chunks(
+                    out, starts, ends, stride, path_stitching)
+                np.testing.assert_array_equal(got.numpy(), expected.numpy())
+                got = basecall_helpers.stitch_chunks(
+                    out.numpy(), starts, ends, stride, path_stitching)
+                np.testing.assert_array_equal(got, expected.numpy())
+
+
+class TestChunkBatcher(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0xC0FFEE)
+        self.chunk_size = 20
+        self.overlap = 5
+        #  Mixture of long reads and reads shorter than chunk size
+        self.signals = [np.random.normal(size=n).astype('f4')
+                        for n in [107, 12, 55, 12, 20, 9, 230]]
+
+    def test_batches_respect_size_and_length(self):
+        """ Batches are never larger than batch size and only contain chunks
+        of a single length
+        """
+        batcher = basecall_helpers.ChunkBatcher(4)
+        for i, signal in enumerate(self.signals):
+            chunks, _, _ = basecall_helpers.chunk_read(
+                signal, self.chunk_size, self.overlap)
+            batcher.add_read(i, chunks)
+        nchunks = batcher.nqueued
+        seen = 0
+        for batch, index in batcher.batches(flush=True):
+            self.assertLessEqual(batch.shape[1], 4)
+            self.assertEqual(batch.shape[1], len(index))
+            seen += len(index)
+        self.assertEqual(seen, nchunks)
+        self.assertEqual(batcher.nqueued, 0)
+
+    def test_outputs_returned_to_reads(self):
+        """ Outputs of batched chunks are returned to each read in order and
+        agree with calling each read separately
+        """
+        batcher = basecall_helpers.ChunkBatcher(3)
+        completed = dict()
+
+        def call_batches(flush=False):
+            for batch, index in batcher.batches(flush=flush):
+                out = torch.tensor(batch).cumsum(0)
+                for key, data, (read_out,) in batcher.add_outputs(index, out):
+                    completed[key] = (data, read_out)
+
+        for i, signal in enumerate(self.signals):
+            chunks, starts, ends = basecall_helpers.strided_chunks(
+                signal, self.chunk_size, self.overlap)
+            batcher.add_read(i, chunks, (starts, ends))
+            call_batches()
+        call_batches(flush=True)
+
+        self.assertEqual(len(batcher), 0)
+        self.assertEqual(sorted(completed.keys()),
+                         list(range(len(self.signals))))
+        for i, signal in enumerate(self.signals):
+            chunks, starts, ends = basecall_helpers.chunk_read(
+                signal, self.chunk_size, self.overlap)
+            expected = torch.tensor(chunks).cumsum(0)
+            (got_starts, got_ends), got = completed[i]
+            np.testing.assert_array_equal(got_starts, starts)
+            np.testing.assert_array_equal(got_ends, ends)
+            np.testing.assert_array_equal(got.numpy(), expected.numpy())
+
+
+class TestBasecallWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmpdir.name, 'calls.fa')
+        self.records = [
+            ('read{}'.format(i), '>read{}\n{}\n'.format(i, 'A' * (i + 1)))
+            for i in range(7)]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self, filename):
+        with open(os.path.join(self.tmpdir.name, filename)) as fh:
+            return fh.read()
+
+    def test_single_file(self):
+        with basecall_helpers.BasecallWriter(self.output) as writer:
+            for read_id, record in self.records:
+                writer.write(read_id, record)
+        self.assertEqual(os.listdir(self.tmpdir.name), ['calls.fa'])
+        self.assertEqual(self.read('calls.fa'),
+                         ''.join(record for _, record in self.records))
+
+    def test_shards(self):
+        """ Shards have a fixed number of reads and are marked as partial
+        until complete
+        """
+        with basecall_helpers.BasecallWriter(self.output, 3) as writer:
+            for read_id, record in self.records[:5]:
+                writer.write(read_id, record)
+            self.assertEqual(sorted(os.listdir(self.tmpdir.name)),
+                             ['calls.00000.fa', 'calls.00001.fa.partial'])
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)),
+                         ['calls.00000.fa', 'calls.00001.fa'])
+        self.assertEqual(self.read('calls.00000.fa'),
+                         ''.join(record for _, record in self.records[:3]))
+
+    def test_resume(self):
+        """ Output is truncated to last read recorded in index and continued
+        """
+        writer = basecall_helpers.BasecallWriter(self.output, 3, resume=True)
+        writer.open()
+        for read_id, record in self.records[:5]:
+            writer.write(read_id, record)
+        writer.close(complete=False)
+        #  Interrupted part way through writing a record and its index entry
+        with open(writer.shard_filename(partial=True), 'a') as fh:
+            fh.write('>read5\nAA')
+        with open(writer.index_filename, 'a') as fh:
+            fh.write('read5\t1')
+
+        with basecall_helpers.BasecallWriter(
+                self.output, 3, resume=True) as writer:
+            self.assertEqual(writer.done_read_ids,
+                             set(read_id for read_id, _ in self.records[:5]))
+            for read_id, record in self.records[5:]:
+                writer.write(read_id, record)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)),
+                         ['calls.00000.fa', 'calls.00001.fa',
+                          'calls.00002.fa', 'calls.fa.index'])
+        self.assertEqual(
+            ''.join(self.read('calls.0000{}.fa'.format(i)) for i in range(3)),
+            ''.join(record for _, record in self.records))
+        self.assertEqual(len(self.read('calls.fa.index').splitlines()), 9)
+
+    def test_resume_retries_failed_reads(self):
+        """ Reads with empty records are not recorded or counted in shards """
+        writer = basecall_helpers.BasecallWriter(self.output, 2, resume=True)
+        writer.open()
+        for i, (read_id, record) in enumerate(self.records[:4]):
+            writer.write(read_id, '' if i == 1 else record)
+        writer.close(complete=False)
+        self.assertEqual(self.read('calls.00000.fa'),
+                         self.records[0][1] + self.records[2][1])
+
+        with basecall_helpers.BasecallWriter(
+                self.output, 2, resume=True) as writer:
+            self.assertEqual(writer.done_read_ids,
+                             {'read0', 'read2', 'read3'})
+            writer.write(*self.records[1])
+        self.assertEqual(self.read('calls.00001.fa'),
+                         self.records[3][1] + self.records[1][1])
+
+    def test_resume_checks_output(self):
+        """ Resuming fails if output is missing or shorter than recorded, or
+        the number of reads per shard has changed
+        """
+        with basecall_helpers.BasecallWriter(self.output, resume=True) as \
+                writer:
+            for read_id, record in self.records[:3]:
+                writer.write(read_id, record)
+        with self.assertRaises(ValueError):
+            basecall_helpers.BasecallWriter(
+                self.output, 3, resume=True).open()
+
+        with open(self.output, 'r+') as fh:
+            fh.truncate(5)
+        with self.assertRaises(ValueError):
+            basecall_helpers.BasecallWriter(self.output, resume=True).open()
+
+        os.remove(self.output)
+        with self.assertRaises(ValueError):
+            basecall_helpers.BasecallWriter(self.output, resume=True).open()
+
+
+class TestScheduleReads(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0xC0FFEE)
+        #  Skewed lengths: many short reads and a few very long ones
+        lengths = np.concatenate([np.random.randint(1000, 20000, size=200),
+                                  [500000, 400000, 300000]])
+        np.random.shuffle(lengths)
+        self.reads = [('file{}'.format(i % 3), 'read{}'.format(i), int(n))
+                      for i, n in enumerate(lengths)]
+        self.lengths = {read_id: n for _, read_id, n in self.reads}
+
+    def test_tasks(self):
+        """ Every read is in one task, tasks are dispatched longest first and
+        only single long reads exceed the sample budget
+        """
+        tasks = basecall_helpers.schedule_reads(self.reads, 100000)
+        read_ids = [read_id for task in tasks for _, read_id in task]
+        self.assertEqual(sorted(read_ids), sorted(self.lengths))
+        task_lengths = [[self.lengths[read_id] for _, read_id in task]
+                        for task in tasks]
+        self.assertEqual(task_lengths[:3], [[500000], [400000], [300000]])
+        self.assertTrue(np.all(np.diff(
+            [n for task in task_lengths for n in task]) <= 0))
+        for task in task_lengths:
+            self.assertTrue(len(task) == 1 or sum(task) <= 100000)
+
+    def test_idle_tail_reduced(self):
+        """ Simulated run of reads in file order has a longer idle tail than
+        longest first
+        """
+        def simulate(tasks, nworker=4):
+            free = np.zeros(nworker)
+            completion_times = []
+            for task in tasks:
+                worker = np.argmin(free)
+                free[worker] += sum(self.lengths[rid] for _, rid in task)
+                completion_times.append(free[worker])
+            return basecall_helpers.idle_tail(sorted(completion_times),
+                                              nworker)
+
+        file_order = [[read[:2] for read in self.reads[i: i + 16]]
+                      for i in range(0, len(self.reads), 16)]
+        scheduled = basecall_helpers.schedule_reads(self.reads, 100000)
+        self.assertLess(simulate(scheduled), simulate(file_order))
+
+    def test_idle_tail(self):
+        self.assertEqual(basecall_helpers.idle_tail([], 4), 0.0)
+        self.assertEqual(basecall_helpers.idle_tail([1.0, 2.0, 5.0], 4), 4.0)
+        self.assertEqual(
+            basecall_helpers.idle_tail([1.0, 2.0, 3.0, 4.0, 9.0], 2), 5.0)
+
+
+class TestWorkerThreads(unittest.TestCase):
+
+    def test_threads_per_worker(self):
+        """ CPUs are divided between workers, at least one thread each """
+        self.assertEqual(basecall_helpers.threads_per_worker(4, range(16)), 4)
+        self.assertEqual(basecall_helpers.threads_per_worker(3, range(8)), 2)
+        self.assertEqual(basecall_helpers.threads_per_worker(8, [0, 1]), 1)
+        self.assertGreaterEqual(basecall_helpers.threads_per_worker(1), 1)
+
+
+class TestBenchmarkReport(unittest.TestCase):
+
+    def setUp(self):
+        def result(jobs, seconds):
+            return OrderedDict([
+                ('jobs', jobs), ('reads', 10), ('wall_seconds', seconds),
+                ('stages', OrderedDict(
+                    (stage, OrderedDict([('unit', unit), ('items', 10),
+                                         ('seconds', seconds / 2)]))
+                    for stage, unit in [('network', 'chunks'),
+                                        ('decode', 'reads')]))])
+
+        self.results = [result(1, 2.0), result(4, 0.5)]
+        self.settings = OrderedDict([('model', 'model.checkpoint'),
+                                     ('nread', 10)])
+
+    def test_tsv(self):
+        """ One column per result entry then seconds for each stage """
+        fh = io.StringIO()
+        basecall_helpers.write_benchmark_report(
+            self.results, self.settings, fh, 'tsv')
+        lines = fh.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0].split('\t'), [
+            'jobs', 'reads', 'wall_seconds', 'network_seconds',
+            'decode_seconds'])
+        self.assertEqual(lines[1].split('\t'), ['1', '10', '2', '1', '1'])
+        self.assertEqual(lines[2].split('\t'),
+                         ['4', '10', '0.5', '0.25', '0.25'])
+
+    def test_json(self):
+        """ Settings and results, including stages, are written in order """
+        fh = io.StringIO()
+        basecall_helpers.write_benchmark_report(
+            self.results, self.settings, fh, 'json')
+        report = json.loads(fh.getvalue(), object_pairs_hook=OrderedDict)
+        self.assertEqual(list(report), ['settings', 'results'])
+        self.assertEqual(report['settings'], self.settings)
+        self.assertEqual(report['results'], self.results)
+        self.assertEqual(list(report['results'][0]['stages']),
+                         ['network', 'decode'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import numpy as np
+import unittest
+
+from taiyaki import chunk_selection, signal_mapping
+
+
+class TestChunkIndex(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0xC0FFEE)
+        self.reads = []
+        for i, nbase in enumerate([50, 120, 300]):
+            dwells = np.random.geometric(0.15, size=nbase)
+            siglen = np.sum(dwells) + 100
+            #  Unmapped bases at either end of reference
+            ref_to_signal = np.concatenate((
+                [-1, -1], 50 + np.cumsum(np.concatenate(([0], dwells))),
+                [siglen + 1]))
+            self.reads.append(signal_mapping.SignalMapping(
+                ref_to_signal, np.random.randint(4, size=nbase + 3),
+                shift_frompA=0.0, scale_frompA=1.0, range=1.0, offset=0.0,
+                digitisation=1.0, read_id='read{}'.format(i),
+                Dacs=np.random.randint(100, size=siglen)))
+        self.chunk_len = 300
+        self.filter_params = chunk_selection.FILTER_PARAMETERS(
+            filter_mean_dwell=1.0, filter_max_dwell=4.0,
+            filter_min_pass_fraction=0.5, median_meandwell=6.5,
+            mad_meandwell=1.0, model_stride=2, path_buffer=1.1)
+
+    def accepted_starts(self, read, filter_params):
+        """ Whether chunk starting at each position would be accepted """
+        mapped_dacs_region = read.get_mapped_dacs_region()
+        spare_length = max(
+            0, mapped_dacs_region[1] - mapped_dacs_region[0] - self.chunk_len)
+        accepted = np.zeros(spare_length, dtype=bool)
+        for start in range(spare_length):
+            chunk = read.get_chunk_with_sample_length(
+                self.chunk_len, start_sample=start)
+            chunk.apply_filters(filter_params)
+            accepted[start] = chunk.accepted
+        return accepted
+
+    def test_index_agrees_with_filters(self):
+        """ Index contains exactly the chunks accepted by filters """
+        no_filter_params = self.filter_params._replace(median_meandwell=None)
+        for filter_params in [self.filter_params, no_filter_params]:
+            index = chunk_selection.ChunkIndex(
+                self.reads, self.chunk_len, filter_params)
+            expected = [self.accepted_starts(read, filter_params)
+                        for read in self.reads]
+            self.assertEqual(index.nchunks, sum(np.sum(e) for e in expected))
+            self.assertAlmostEqual(index.pass_fraction, np.mean(
+                [np.mean(e) if len(e) > 0 else 0.0 for e in expected]))
+
+            read_numbers, starts = index.sample(1000)
+            for read_number, start in zip(read_numbers, starts):
+                self.assertTrue(expected[read_number][start])
+
+    def test_sample_chunks_from_index(self):
+        """ Chunks sampled from index are all accepted """
+        index = chunk_selection.ChunkIndex(
+            self.reads, self.chunk_len, self.filter_params)
+        chunks, rejections = chunk_selection.sample_chunks(
+            self.reads, 50, self.chunk_len, self.filter_params,
+            chunk_index=index)
+        self.assertEqual(len(chunks), 50)
+        self.assertEqual(dict(rejections), {'pass': 50})
+        self.assertTrue(all(len(chunk.current) == self.chunk_len
+                            for chunk in chunks))
+
+    def test_empty_index(self):
+        """ Index of chunks longer than any read samples nothing """
+        index = chunk_selection.ChunkIndex(
+            self.reads, 100000, self.filter_params)
+        self.assertEqual(index.nchunks, 0)
+        read_numbers, starts = index.sample(10)
+        self.assertEqual(len(read_numbers), 0)
+        self.assertEqual(len(starts), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
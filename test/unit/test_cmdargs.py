@@ -92,6 +92,15 @@ class CmdArgsTest(unittest.TestCase):
             with self.assertRaises(argparse.ArgumentTypeError):
                 f(x)
 
+    def test_cpu_list(self):
+        """Test that lists of CPUs are expanded and invalid lists rejected."""
+        f = cmdargs.cpu_list
+        self.assertEqual([3], f('3'))
+        self.assertEqual([0, 1, 2, 3, 8, 10, 11], f('8,0-3,10-11,2'))
+        for x in ['', '3-1', '-1', 'a', '1,,2', '0-']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                f(x)
+
     def test_device_action_conversions(self):
         """Test to ensure DeviceAction accurately processes device strings."""
         parser = argparse.ArgumentParser()
@@ -53,6 +53,28 @@ class TestFlipFlopDecode(unittest.TestCase):
         path = path.numpy()
         self.assertArrayEqual(path, self.expected_path)
 
+    def test_cpu_decoding_no_native(self):
+        """ Test CPU Viterbi decoding of flip-flop using torch routines
+        """
+        _, _, path = decode.flipflop_viterbi(torch.tensor(self.scores),
+                                             _never_use_native=True)
+        path = path.numpy()
+        self.assertArrayEqual(path, self.expected_path)
+
+    @unittest.skipIf(not decode._native_is_available,
+                     "Native decoding is not available")
+    def test_native_equals_torch_viterbi(self):
+        """ Test that native and torch Viterbi routines agree exactly on a
+        batch of random scores.
+        """
+        np.random.seed(0xdeadbeef)
+        scores = torch.tensor(np.random.randn(50, 7, 40).astype('f4'))
+        res_native = decode.flipflop_viterbi(scores)
+        res_torch = decode.flipflop_viterbi(scores, _never_use_native=True)
+        for native, torch_res in zip(res_native, res_torch):
+            self.assertEqual(native.dtype, torch_res.dtype)
+            self.assertTrue(torch.equal(native, torch_res))
+
     @unittest.skipIf(not torch.cuda.is_available(), "CUDA is not available")
     def test_gpu_decoding_no_cupy(self):
         """ Test GPU Viterbi decoding of flip-flop (if available)
@@ -103,6 +125,20 @@ class TestFlipFlopDecode(unittest.TestCase):
         with torch.no_grad():
             decode.flipflop_make_trans(1.0 * scores)
 
+    @unittest.skipIf(not decode._native_is_available,
+                     "Native decoding is not available")
+    def test_native_equals_torch_make_trans(self):
+        """ Test that native and torch routines to calculate transition scores
+        agree on a batch of random scores.
+        """
+        np.random.seed(0xdeadbeef)
+        scores = torch.tensor(3.0 * np.random.randn(50, 7, 40).astype('f4'))
+        trans_torch = decode.flipflop_make_trans(scores,
+                                                 _never_use_native=True)
+        trans_native = decode.flipflop_make_trans(scores)
+        np.testing.assert_allclose(trans_native.numpy(), trans_torch.numpy(),
+                                   atol=1e-6)
+
     @unittest.skipIf(not _cupy_is_available, "Cupy is not installed")
     def test_cupy_equals_torch_make_trans(self):
         """ Test that cupy and torch routines to calculate transition scores
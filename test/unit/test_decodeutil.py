@@ -1,10 +1,11 @@
+from collections import namedtuple
 import unittest
 
 import numpy as np
 import torch
 
-from taiyaki import decodeutil
-from taiyaki.flipflopfings import nbase_flipflop
+from taiyaki import basecall_helpers, decodeutil
+from taiyaki.flipflopfings import nbase_flipflop, path_to_str
 from taiyaki.layers import log_partition_flipflop
 from taiyaki.maths import logsumexp
 
@@ -60,3 +61,114 @@ class TestDecodeutilFlipflop(unittest.TestCase):
         score_range = float(score.max() - score.min())
         print(score_range)
         self.assertAlmostEqual(score_range, 0.0, places=5)
+
+
+class TestBeamsearchBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        np.random.seed(0xdeadbeef)
+        self.scores = [np.random.randn(nt, 40).astype('f4')
+                       for nt in (50, 200, 0, 120)]
+
+    def test_batch_equals_single(self):
+        for guided in (False, True):
+            res = decodeutil.beamsearch_batch(self.scores, beam_width=5,
+                                              guided=guided)
+            self.assertEqual(len(res), len(self.scores))
+            for score, (seq, seq_score) in zip(self.scores, res):
+                expt_seq, expt_score = decodeutil.beamsearch(
+                    score, beam_width=5, guided=guided)
+                np.testing.assert_array_equal(seq, expt_seq)
+                self.assertEqual(seq_score, expt_score)
+                self.assertLessEqual(len(seq), score.shape[0] + 1)
+
+    def test_move_every_block(self):
+        """ Sequence is one longer than number of blocks """
+        score = np.full((10, 40), -10.0, dtype='f4')
+        #  Alternate moves from flip A to flip C and back
+        score[0::2, 8] = 0.0
+        score[1::2, 1] = 0.0
+        seq, _ = decodeutil.beamsearch(score, guided=False)
+        np.testing.assert_array_equal(seq, [0, 1] * 5 + [0])
+
+    def test_with_path(self):
+        """ Path has sequence as its changes of state """
+        res = decodeutil.beamsearch_batch(self.scores, with_path=True)
+        for score, (seq, _, path) in zip(self.scores, res):
+            self.assertEqual(len(path), score.shape[0] + 1)
+            self.assertEqual(path[0], seq[0])
+            self.assertEqual(path_to_str(path), path_to_str(seq))
+
+    def random_path_score(self, nt):
+        """ Scores favouring a random sequence with stays """
+        np.random.seed(0xdeadbeef)
+        score = np.random.randn(nt, 40).astype('f4')
+        state = 0
+        for blk in range(nt):
+            if np.random.rand() < 0.5:
+                base = np.random.randint(4)
+                to_state = base if base != state % 4 else (state + 4) % 8
+            else:
+                to_state = state
+            score[blk, state + 8 * min(to_state, 4)] += 10.0
+            state = to_state
+        return score
+
+    def test_stitch_paths(self):
+        """ Paths for overlapping chunks stitch to call for whole matrix """
+        nt = 2000
+        score = self.random_path_score(nt)
+        expt_seq, _ = decodeutil.beamsearch(score)
+
+        _, starts, ends = basecall_helpers.chunk_read(np.zeros(nt), 300, 40)
+        res = decodeutil.beamsearch_batch(
+            [score[start:end] for start, end in zip(starts, ends)],
+            with_path=True)
+        paths = torch.tensor(np.stack([path for _, _, path in res], 1))
+        path = basecall_helpers.stitch_chunks(paths, starts, ends, 1,
+                                              path_stitching=True)
+        self.assertEqual(path_to_str(path.numpy(), include_first_source=False),
+                         path_to_str(expt_seq, include_first_source=False))
+
+    def test_beam_by_chunk_basecall(self):
+        """ Beam search by chunk, as used by basecall.py, gives call for whole
+        matrix whether read is decoded after calling or streamed
+        """
+        nt = 2000
+        score = torch.tensor(self.random_path_score(nt))
+        expt_seq, _ = decodeutil.beamsearch(score.numpy())
+        expt_call = path_to_str(expt_seq, include_first_source=False)
+
+        class Model(torch.nn.Module):
+            """ Scores of blocks, where signal is position of each block """
+
+            def __init__(self):
+                super().__init__()
+                self.register_buffer('score', score)
+
+            def forward(self, x):
+                return self.score[x[:, :, 0].long()]
+
+        model = Model()
+        beam = namedtuple('beam', ['width', 'guided'])(5, True)
+        chunks, starts, ends = basecall_helpers.chunk_read(
+            np.arange(nt, dtype='f4'), 300, 40)
+        outputs = basecall_helpers.call_chunks(
+            model, chunks, 40, beam=beam, posterior=False, beam_by_chunk=True)
+        call, _ = basecall_helpers.decode_read(
+            outputs, starts, ends, 1, 'ACGT', path_stitching=True)
+        self.assertEqual(call, expt_call)
+
+        call, _ = basecall_helpers.stream_read(
+            [chunks], starts, ends, model, 40, 1, 'ACGT', 3, beam=beam,
+            posterior=False)
+        self.assertEqual(call, expt_call)
+
+    def test_empty_batch(self):
+        self.assertEqual(decodeutil.beamsearch_batch([]), [])
+
+    def test_inconsistent_transitions(self):
+        with self.assertRaises(AssertionError):
+            decodeutil.beamsearch_batch([np.zeros((5, 40), dtype='f4'),
+                                         np.zeros((5, 60), dtype='f4')])
@@ -0,0 +1,84 @@
+import numpy as np
+import os
+import tempfile
+import torch
+import unittest
+
+from taiyaki import activation, helpers, layers
+
+
+class TestExportModel(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0xC0FFEE)
+        self.size = 16
+        self.network = layers.Serial([
+            layers.Convolution_Quant(1, self.size, 9, stride=2,
+                                     fun=activation.tanh),
+            layers.Reverse(layers.GruMod_Quant(self.size, self.size)),
+            layers.GlobalNormFlipFlop_Quant(self.size, 4)]).eval()
+        self.network.metadata = {'reverse': False, 'standardize': True,
+                                 'version': layers.MODEL_VERSION}
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_model_stride_cached(self):
+        """ Stride is found by a single forward pass and saved with model """
+        calls = []
+        hook = self.network.register_forward_hook(
+            lambda *args: calls.append(1))
+        self.assertEqual(helpers.get_model_stride(self.network), 2)
+        self.assertEqual(helpers.get_model_stride(self.network), 2)
+        self.assertEqual(len(calls), 1)
+        hook.remove()
+        self.assertEqual(self.network.metadata['stride'], 2)
+
+        checkpoint = os.path.join(self.tmpdir.name, 'model.checkpoint')
+        torch.save(self.network, checkpoint)
+        model = helpers.load_model(checkpoint)
+        model.register_forward_hook(lambda *args: calls.append(1))
+        self.assertEqual(helpers.get_model_stride(model), 2)
+        self.assertEqual(len(calls), 1)
+
+    def test_export_and_load(self):
+        """ Exported model agrees with original for inputs of other shapes
+        and is loaded with its metadata
+        """
+        checkpoint = os.path.join(self.tmpdir.name, 'model.checkpoint')
+        torch.save(self.network, checkpoint)
+        exported = os.path.join(self.tmpdir.name, 'model.pt')
+        helpers.export_model(self.network, exported, example_len=100)
+
+        self.assertFalse(helpers.is_torchscript_model(checkpoint))
+        self.assertTrue(helpers.is_torchscript_model(exported))
+        model = helpers.load_model(exported)
+        self.assertIsInstance(model, torch.jit.ScriptModule)
+        self.assertEqual(model.metadata,
+                         dict(self.network.metadata, stride=2))
+        self.assertEqual(helpers.get_model_device(model), torch.device('cpu'))
+
+        for shape in [(300, 3, 1), (41, 1, 1)]:
+            x = torch.randn(*shape)
+            with torch.no_grad():
+                expected = self.network(x)
+                got = model(x)
+            self.assertEqual(got.shape, expected.shape)
+            np.testing.assert_allclose(got.numpy(), expected.numpy(),
+                                       rtol=1e-5, atol=1e-5)
+
+    def test_zero_point_is_traced(self):
+        """ Zero-point of quantisation is clamped by the traced model rather
+        than fixed at the value for the example input
+        """
+        layer = layers.GlobalNormFlipFlop_Quant(self.size, 4).eval()
+        with torch.no_grad():
+            traced = torch.jit.trace(layer, torch.randn(10, 1, self.size))
+            x = torch.rand(10, 1, self.size) + 1.0
+            np.testing.assert_allclose(traced(x).numpy(), layer(x).numpy(),
+                                       rtol=1e-5, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@ import os
 import unittest
 
 from . import DATA_DIR
-from taiyaki.fast5utils import iterate_fast5_reads
+from taiyaki.fast5utils import iterate_fast5_reads, iterate_read_lengths
 
 
 class TestStrandList(unittest.TestCase):
@@ -89,3 +89,44 @@ class TestStrandList(unittest.TestCase):
                 print("Filename=", fn, "read_id=", rid)
 
     # TODO add recursive test (requires adding recursive data dir
+
+
+class TestReadLengths(unittest.TestCase):
+    """Test finding length of reads from fast5 metadata"""
+    EXPECTED_LENGTHS = {
+        '0f776a08-1101-41d4-8097-89136494a46e': 28005,
+        '1f1a0f33-e2ac-431a-8f48-c3c687a7a7dc': 36474,
+        'b7096acd-b528-474e-a863-51295d18d3de': 26348,
+        'db6b45aa-5d21-45cf-a435-05fb8f12e839': 34188,
+        'de1508c4-755b-489e-9ffb-51af35c9a7e6': 19039,
+    }
+
+    def _check_lengths(self, read_dir):
+        reads = list(iterate_fast5_reads(os.path.join(DATA_DIR, read_dir)))
+        lengths = list(iterate_read_lengths(reads))
+        self.assertEqual([rec[:2] for rec in lengths], reads)
+        self.assertEqual({rec[1]: rec[2] for rec in lengths},
+                         self.EXPECTED_LENGTHS)
+
+    def test_single_reads(self):
+        self._check_lengths("reads")
+
+    def test_multiread(self):
+        self._check_lengths("multireads")
+
+    def test_missing_read(self):
+        """Reads that cannot be found have length zero"""
+        filepath = os.path.join(DATA_DIR, "reads",
+                                "0f776a08-1101-41d4-8097-89136494a46e.fast5")
+        lengths = list(iterate_read_lengths([(filepath, 'not_a_read')]))
+        self.assertEqual(lengths, [(filepath, 'not_a_read', 0)])
+
+    def test_missing_read_does_not_affect_others(self):
+        """Reads after one that cannot be found still have their length"""
+        reads = list(iterate_fast5_reads(os.path.join(DATA_DIR, "multireads")))
+        reads.insert(1, (reads[0][0], 'not_a_read'))
+        lengths = list(iterate_read_lengths(reads))
+        self.assertEqual(lengths[1], (reads[0][0], 'not_a_read', 0))
+        del lengths[1]
+        self.assertEqual({rec[1]: rec[2] for rec in lengths},
+                         self.EXPECTED_LENGTHS)
@@ -0,0 +1,55 @@
+import pickle
+import threading
+import time
+import unittest
+
+from taiyaki import iterators
+
+
+class TestPrefetchMap(unittest.TestCase):
+
+    def test_results_in_order(self):
+        """ Results are returned in order of input, whatever the number of
+        threads or the queue size
+        """
+        for threads, maxsize in [(1, 1), (3, 2), (4, 10)]:
+            res = list(iterators.prefetch_map(
+                lambda x: x * x, range(25), threads, maxsize))
+            self.assertEqual(res, [x * x for x in range(25)])
+
+    def test_backpressure(self):
+        """ No more than maxsize calls are ahead of the consumer """
+        lock = threading.Lock()
+        started = []
+
+        def f(x):
+            with lock:
+                started.append(x)
+            return x
+
+        for i, x in enumerate(iterators.prefetch_map(f, range(20), 4, 3)):
+            time.sleep(0.001)
+            with lock:
+                self.assertLessEqual(len(started), i + 3)
+
+
+class TestStageTimer(unittest.TestCase):
+
+    def test_timing_and_pickle(self):
+        """ Items and time are accumulated and survive pickling """
+        timer = iterators.StageTimer('reads')
+        with timer.time(3):
+            time.sleep(0.01)
+        timer.add(2, 0.5)
+        self.assertEqual(timer.nitem, 5)
+        self.assertGreater(timer.seconds, 0.5)
+
+        other = pickle.loads(pickle.dumps(timer))
+        other.update(timer)
+        self.assertEqual(other.nitem, 10)
+        self.assertEqual(other.unit, 'reads')
+        self.assertAlmostEqual(other.rate, timer.rate)
+
+
+if __name__ == '__main__':
+    unittest.main()
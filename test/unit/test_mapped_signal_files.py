@@ -1,5 +1,6 @@
 import tempfile
 import os
+import pickle
 import unittest
 
 import matplotlib.pyplot as plt
@@ -218,3 +219,88 @@ class TestMappedReadFiles(unittest.TestCase):
             print("Test report (should pass):", file_test_report)
             self.assertEqual(
                 file_test_report, signal_mapping.SignalMapping.pass_str)
+
+    def test_columnar_mapped_read_file(self):
+        """Test that reads written in columnar format are read back, in
+        any order, from memory mapped columns
+        """
+        read_dicts = []
+        for i in range(5):
+            read_dict = construct_mapped_read_dict()
+            read_dict['read_id'] = 'read_{}'.format(i)
+            read_dict['Dacs'] = np.arange(20 + i, dtype=np.int16) + i
+            read_dict['Reference'] = read_dict['Reference'] + i
+            if i % 2 == 0:
+                read_dict['mapping_score'] = float(i)
+            read_dicts.append(read_dict)
+
+        alphabet_info = alphabet.AlphabetInfo(
+            DEFAULT_ALPHABET, DEFAULT_ALPHABET)
+        with tempfile.NamedTemporaryFile(
+                delete=False, dir=self.testset_work_dir) as fh:
+            testfilepath = fh.name
+        with mapped_signal_files.MappedSignalWriter(
+                testfilepath, alphabet_info, columnar_format=True) as f:
+            for read_dict in read_dicts:
+                f.write_read(read_dict)
+
+        with mapped_signal_files.MappedSignalReader(testfilepath) as f:
+            self.assertIsInstance(f, mapped_signal_files.ColumnarHDF5Reader)
+            self.assertEqual(f.check(), f.pass_str)
+            self.assertEqual(f.get_read_ids(),
+                             [rd['read_id'] for rd in read_dicts])
+            self.assertEqual(
+                [read.read_id for read in f.reads(['read_3', 'read_1'])],
+                ['read_1', 'read_3'])
+            for read_dict in read_dicts[::-1]:
+                read = f.get_read(read_dict['read_id'])
+                for k in ['Dacs', 'Reference', 'Ref_to_signal']:
+                    np.testing.assert_array_equal(getattr(read, k),
+                                                  read_dict[k])
+                self.assertEqual(read.scale_frompA, read_dict['scale_frompA'])
+                self.assertEqual(read.mapping_score,
+                                 read_dict.get('mapping_score', 0.0))
+        os.remove(testfilepath)
+
+    def test_mapped_read_collection(self):
+        """Test reads loaded lazily, with a bounded cache, agree with reads
+        loaded up front
+        """
+        alphabet_info = alphabet.AlphabetInfo(
+            DEFAULT_ALPHABET, DEFAULT_ALPHABET)
+        with tempfile.NamedTemporaryFile(
+                delete=False, dir=self.testset_work_dir) as fh:
+            testfilepath = fh.name
+        with mapped_signal_files.MappedSignalWriter(
+                testfilepath, alphabet_info, columnar_format=True) as f:
+            for i in range(5):
+                read_dict = construct_mapped_read_dict()
+                read_dict['read_id'] = 'read_{}'.format(i)
+                read_dict['Dacs'] = read_dict['Dacs'] + i
+                f.write_read(read_dict)
+
+        read_ids = ['read_4', 'read_3', 'read_1', 'read_0']
+        eager = mapped_signal_files.MappedReadCollection(
+            testfilepath, read_ids, limit=3)
+        lazy = mapped_signal_files.MappedReadCollection(
+            testfilepath, read_ids, limit=3, cache_size=2)
+        self.assertEqual(lazy.read_ids, ['read_0', 'read_1', 'read_3'])
+        self.assertEqual(sorted(eager.read_ids), lazy.read_ids)
+        eager = eager.subset(lazy.read_ids[::2])
+        lazy = lazy.subset(lazy.read_ids[::2])
+        #  File is not held open once reads are found, or by getting alphabet
+        for collection in [eager, lazy]:
+            self.assertEqual(
+                collection.get_alphabet_information().alphabet,
+                DEFAULT_ALPHABET)
+            self.assertIsNone(collection._msr)
+        self.assertEqual(len(lazy), 2)
+        for i in [1, 0, 1, 1, 0]:
+            np.testing.assert_array_equal(lazy[i].Dacs, eager[i].Dacs)
+            self.assertLessEqual(len(lazy._cache), 2)
+
+        lazy = pickle.loads(pickle.dumps(lazy))
+        self.assertEqual(len(lazy._cache), 0)
+        self.assertEqual([read.read_id for read in lazy], lazy.read_ids)
+        lazy.close()
+        os.remove(testfilepath)
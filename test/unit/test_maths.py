@@ -51,6 +51,25 @@ class MathsTest(unittest.TestCase):
         self.assertTrue(np.allclose(maths.mad(x, axis=2, keepdims=True),
                                     np.zeros((5, 6, 1))))
 
+    def test_008_edit_distance(self):
+        """Test edit distance against known values and a direct
+        implementation of the dynamic programming."""
+        self.assertEqual(maths.edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(maths.edit_distance('', 'ACGT'), 4)
+        self.assertEqual(maths.edit_distance('ACGT', ''), 4)
+        self.assertEqual(maths.edit_distance('ACGT', 'ACGT'), 0)
+        for _ in range(10):
+            a = np.random.randint(4, size=np.random.randint(1, 30))
+            b = np.random.randint(4, size=np.random.randint(1, 30))
+            d = np.zeros((len(a) + 1, len(b) + 1), dtype=int)
+            d[:, 0] = np.arange(len(a) + 1)
+            d[0] = np.arange(len(b) + 1)
+            for i in range(1, len(a) + 1):
+                for j in range(1, len(b) + 1):
+                    d[i, j] = min(d[i - 1, j - 1] + (a[i - 1] != b[j - 1]),
+                                  d[i - 1, j] + 1, d[i, j - 1] + 1)
+            self.assertEqual(maths.edit_distance(a, b), d[-1, -1])
+
 
 if __name__ == '__main__':
     unittest.main()
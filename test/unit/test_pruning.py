@@ -0,0 +1,155 @@
+import json
+import numpy as np
+import torch
+import unittest
+
+from taiyaki import activation, layers, pruning
+from taiyaki.json import JsonEncoder
+
+
+def init_params(module, sd=0.2):
+    """ Initialise parameters like a trained model
+
+    Quantised layers are initialised with large integer-valued weights, which
+    saturate activations and amplify any difference in precision.
+    """
+    with torch.no_grad():
+        for name, param in module.named_parameters():
+            if 'bias_hh' not in name:
+                param.normal_(0.0, sd)
+    return module
+
+
+class TestMasks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        torch.manual_seed(0xBADF00D)
+        self.weight = torch.randn(30, 20)
+
+    def test_magnitude_mask(self):
+        mask = pruning.magnitude_mask(self.weight, 0.7)
+        self.assertEqual(int(mask.sum()), 180)
+        self.assertGreaterEqual(float(self.weight[mask].abs().min()),
+                                float(self.weight[~mask].abs().max()))
+
+    def test_block_mask(self):
+        """ Blocks of rows of a column are pruned together, including the
+        incomplete last block
+        """
+        mask = pruning.block_mask(self.weight, 0.5)
+        self.assertEqual(mask.shape, self.weight.shape)
+        blocks = mask[:28].reshape(7, 4, 20)
+        self.assertTrue(torch.all(blocks.all(1) == blocks.any(1)))
+        self.assertTrue(torch.all(mask[28:].all(0) == mask[28:].any(0)))
+        self.assertEqual(int(blocks.all(1).sum() + mask[28].sum()), 80)
+
+    def test_structured_mask(self):
+        mask = pruning.structured_mask(self.weight, 0.25)
+        self.assertTrue(torch.all(mask.all(0) == mask.any(0)))
+        self.assertEqual(int(mask[0].sum()), 15)
+
+    def test_convolution_weight(self):
+        weight = torch.randn(8, 3, 5)
+        for method in pruning.PRUNING_METHODS:
+            mask = pruning._MASK_FUNCTIONS[method](weight, 0.5)
+            self.assertEqual(mask.shape, weight.shape)
+
+
+class TestPruneModel(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0xBADF00D)
+        self.size = 32
+        self.network = init_params(layers.Serial([
+            layers.Convolution_Quant(1, self.size, 9, stride=2,
+                                     fun=activation.tanh),
+            layers.Reverse(layers.GruMod_Quant(self.size, self.size)),
+            layers.GruMod_Quant(self.size, self.size, has_bias=False),
+            layers.GlobalNormFlipFlop_Quant(self.size, 4)]).eval())
+        self.network.metadata = {'reverse': False, 'standardize': True}
+
+    def test_prune_model(self):
+        masks = pruning.prune_model(self.network, 0.7, 'block')
+        self.assertEqual(len(masks), 5)
+        self.assertIn('sublayers.1.layer.cudnn_gru.weight_hh_l0', masks)
+        for name, sparsity in pruning.sparsity_report(self.network).items():
+            self.assertAlmostEqual(sparsity, 0.7, delta=0.02, msg=name)
+
+    def test_apply_masks(self):
+        """ Pruned weights updated by optimiser are zeroed again """
+        masks = pruning.prune_model(self.network, 0.5, 'magnitude')
+        with torch.no_grad():
+            for param in self.network.parameters():
+                param.add_(1.0)
+        pruning.apply_masks(self.network, masks)
+        for name, sparsity in pruning.sparsity_report(self.network).items():
+            self.assertAlmostEqual(sparsity, 0.5, delta=0.01, msg=name)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            pruning.prune_model(self.network, 0.5, 'random')
+
+
+@unittest.skipIf(not layers._sparse_is_available,
+                 'Native sparse kernels not available')
+class TestConvertToSparse(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        torch.manual_seed(0xBADF00D)
+        self.size = 32
+        self.network = init_params(layers.Serial([
+            layers.Convolution_Quant(1, self.size, 9, stride=2,
+                                     fun=activation.tanh),
+            layers.Reverse(layers.GruMod_Quant(self.size, self.size)),
+            layers.GruMod_Quant(self.size, self.size, has_bias=False),
+            layers.GlobalNormFlipFlop_Quant(self.size, 4)]).eval())
+        self.network.metadata = {'reverse': False, 'standardize': True}
+        pruning.prune_model(self.network, 0.7, 'block')
+        self.x = torch.randn(200, 3, 1)
+
+    def test_layers_converted(self):
+        model, nconverted = pruning.convert_to_sparse(self.network)
+        self.assertEqual(nconverted, 3)
+        self.assertIsInstance(model.sublayers[0], layers.Convolution_Sparse)
+        self.assertIsInstance(model.sublayers[1].layer, layers.GruMod_Sparse)
+        self.assertIsInstance(model.sublayers[2], layers.GruMod_Sparse)
+        self.assertIsInstance(self.network.sublayers[2], layers.GruMod_Quant)
+        self.assertEqual(model.metadata, self.network.metadata)
+        self.assertAlmostEqual(model.sublayers[2].density(), 0.3, delta=0.02)
+
+    def test_layer_parity(self):
+        """ Each sparse layer agrees with the layer it was converted from """
+        x = torch.randn(100, 17, self.size)
+        for layer in [layers.Convolution_Quant(self.size, self.size, 5),
+                      layers.GruMod_Quant(self.size, self.size)]:
+            init_params(layer)
+            pruning.prune_model(layer, 0.5, 'magnitude')
+            sparse_layer = type(layer).__name__.replace('_Quant', '_Sparse')
+            slayer = getattr(layers, sparse_layer).from_float(layer)
+            with torch.no_grad():
+                expected = layer(x)
+                got = slayer(x)
+            self.assertEqual(got.shape, expected.shape)
+            np.testing.assert_allclose(got.numpy(), expected.numpy(),
+                                       rtol=1e-4, atol=1e-4)
+
+    def test_model_parity_and_json(self):
+        model, _ = pruning.convert_to_sparse(self.network)
+        with torch.no_grad():
+            expected = self.network(self.x)
+            got = model(self.x)
+        np.testing.assert_allclose(got.numpy(), expected.numpy(),
+                                   rtol=1e-4, atol=1e-4)
+        json.dumps(model.json(), cls=JsonEncoder)
+        for i in range(2):
+            self.assertEqual(
+                json.loads(json.dumps(model.sublayers[i].json(),
+                                      cls=JsonEncoder)),
+                json.loads(json.dumps(self.network.sublayers[i].json(),
+                                      cls=JsonEncoder)))
+
+
+if __name__ == '__main__':
+    unittest.main()
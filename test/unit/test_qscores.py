@@ -0,0 +1,71 @@
+import numpy as np
+import torch
+import unittest
+
+from taiyaki import qscores
+from taiyaki.constants import SMALL_VAL
+from taiyaki.decode import flipflop_make_trans, flipflop_viterbi
+
+
+class TestQscores(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        torch.manual_seed(0xBADF00D)
+        self.trans = flipflop_make_trans(torch.randn(30, 7, 40))
+        _, _, self.path = flipflop_viterbi(self.trans)
+
+    def test_errprobs_from_trans(self):
+        """ Agrees with sum over transitions into each base """
+        errprobs = qscores.errprobs_from_trans(self.trans, self.path)
+        self.assertEqual(errprobs.shape, self.path.shape)
+        self.assertTrue(torch.all(errprobs[0] == -1.0))
+        for blk in range(30):
+            for i in range(7):
+                base = int(self.path[blk + 1, i]) % 4
+                into_base = qscores.transitions_into_base(base, 4, 'cpu')
+                p = (self.trans[blk, i, into_base].sum() /
+                     self.trans[blk, i].sum())
+                self.assertAlmostEqual(float(errprobs[blk + 1, i]),
+                                       1.0 - float(p), places=6)
+
+    def test_errprobs_agree_with_per_base_sums(self):
+        """ Agrees, to float rounding, with summing probability of each base
+        with a separate mask
+        """
+        baseprobs = torch.stack([
+            self.trans[:, :, qscores.transitions_into_base(
+                base, 4, 'cpu')].sum(dim=2) for base in range(4)], dim=2)
+        baseprobs = baseprobs / (baseprobs.sum(dim=2, keepdim=True) +
+                                 SMALL_VAL)
+        expected = 1.0 - torch.gather(
+            baseprobs, 2, self.path[1:].unsqueeze(2) % 4).squeeze(2)
+        errprobs = qscores.errprobs_from_trans(self.trans, self.path)
+        np.testing.assert_allclose(errprobs[1:].numpy(), expected.numpy(),
+                                   rtol=1e-6, atol=1e-6)
+
+    def test_qchar_from_errprob(self):
+        errprob = np.array([0.5, 0.1, 0.01, 1.0], dtype=np.float32)
+        self.assertEqual(qscores.qchar_from_errprob(errprob, 1.0, 0.0),
+                         '$+5!')
+        self.assertEqual(qscores.qchar_from_errprob(errprob, 2.0, 1.0),
+                         '(6J"')
+
+    def test_qchar_from_errprob_limits(self):
+        """ Characters are valid for fastq whatever the probability """
+        errprob = np.array([0.0, -1e-7, 1e-20, np.nan, 1.0])
+        self.assertEqual(qscores.qchar_from_errprob(errprob, 1.0, 0.0),
+                         '~~~!!')
+        self.assertEqual(qscores.qchar_from_errprob(errprob, 1.0, -10.0),
+                         '~~~!!')
+
+    def test_path_errprobs_to_qstring(self):
+        path = np.array([0, 0, 1, 1, 5, 2])
+        errprobs = np.array([-1.0, 0.9, 0.5, 0.9, 0.1, 0.01])
+        self.assertEqual(
+            qscores.path_errprobs_to_qstring(errprobs, path, 1.0, 0.0),
+            '$+5')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import json
+import numpy as np
+import torch
+import unittest
+
+from taiyaki import activation, layers, quantization
+from taiyaki.json import JsonEncoder
+
+
+def init_params(module, sd=0.2):
+    """ Initialise parameters like a trained model
+
+    Quantised layers are initialised with large integer-valued weights, which
+    saturate activations and amplify any difference in precision.
+    """
+    with torch.no_grad():
+        for name, param in module.named_parameters():
+            if 'bias_hh' not in name:
+                param.normal_(0.0, sd)
+    return module
+
+
+class TestConvertToInt8(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        torch.manual_seed(0xC0FFEE)
+        self.size = 32
+        self.network = layers.Serial([
+            layers.Convolution_Quant(1, self.size, 9, stride=2,
+                                     fun=activation.tanh),
+            layers.Reverse(layers.GruMod_Quant(self.size, self.size)),
+            layers.GruMod_Quant(self.size, self.size, has_bias=False),
+            layers.GlobalNormFlipFlop_Quant(self.size, 4)]).eval()
+        init_params(self.network)
+        self.network.metadata = {'reverse': False, 'standardize': True}
+        self.x = torch.randn(200, 3, 1)
+
+    def test_layers_converted(self):
+        """ All _Quant layers are replaced and original model unchanged """
+        model, nconverted = quantization.convert_to_int8(self.network)
+        self.assertEqual(nconverted, 4)
+        self.assertIsInstance(model.sublayers[0], layers.Convolution_Int8)
+        self.assertIsInstance(model.sublayers[1].layer, layers.GruMod_Int8)
+        self.assertIsInstance(model.sublayers[2], layers.GruMod_Int8)
+        self.assertIsInstance(model.sublayers[3],
+                              layers.GlobalNormFlipFlop_Int8)
+        self.assertIsInstance(self.network.sublayers[0],
+                              layers.Convolution_Quant)
+        self.assertEqual(model.metadata, self.network.metadata)
+
+    def test_layer_parity(self):
+        """ Each int8 layer agrees with the layer it was converted from """
+        x = torch.randn(100, 3, self.size)
+        for layer in [layers.Convolution_Quant(self.size, self.size, 5),
+                      layers.GruMod_Quant(self.size, self.size),
+                      layers.GlobalNormFlipFlop_Quant(self.size, 4)]:
+            init_params(layer)
+            int8_layer = type(layer).__name__.replace('_Quant', '_Int8')
+            qlayer = getattr(layers, int8_layer).from_float(layer)
+            with torch.no_grad():
+                expected = layer(x)
+                got = qlayer(x)
+            self.assertEqual(got.shape, expected.shape)
+            scale = float(expected.abs().max())
+            np.testing.assert_allclose(got.numpy(), expected.numpy(),
+                                       atol=0.05 * scale)
+
+    def test_model_parity_and_json(self):
+        """ Converted model agrees with original and can be dumped to json """
+        model, _ = quantization.convert_to_int8(self.network)
+        with torch.no_grad():
+            expected = self.network(self.x)
+            got = model(self.x)
+        self.assertEqual(got.shape, expected.shape)
+        scale = float(expected.abs().max())
+        np.testing.assert_allclose(got.numpy(), expected.numpy(),
+                                   atol=0.05 * scale)
+        json.dumps(model.json(), cls=JsonEncoder)
+
+    def test_other_layers_converted(self):
+        """ Layers without an int8 version have their linear transforms and
+        recurrent units quantised
+        """
+        network = init_params(layers.Serial([
+            layers.Window(5),
+            layers.Reverse(layers.Lstm(5, self.size)),
+            layers.CudnnGru(self.size, self.size),
+            layers.FeedForward(self.size, 40)]).eval())
+        model, nconverted = quantization.convert_to_int8(network)
+        self.assertEqual(nconverted, 3)
+        self.assertEqual(len(list(model.parameters())), 0)
+        with torch.no_grad():
+            expected = network(self.x)
+            got = model(self.x)
+        scale = float(expected.abs().max())
+        np.testing.assert_allclose(got.numpy(), expected.numpy(),
+                                   atol=0.05 * scale)
+
+    def test_calibration(self):
+        """ Calibrated model gives same output for a chunk whatever the
+        batch it is called in
+        """
+        model, _ = quantization.convert_to_int8(self.network)
+        batches = [torch.randn(200, 4, 1) for _ in range(5)]
+        ncalibrated = quantization.calibrate(model, batches)
+        self.assertEqual(ncalibrated, 4)
+        self.assertIsNotNone(model.sublayers[2].input_range)
+        with torch.no_grad():
+            together = model(self.x)
+            alone = model(self.x[:, :1])
+        np.testing.assert_allclose(alone.numpy(), together[:, :1].numpy(),
+                                   atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()